@@ -0,0 +1,828 @@
+import asyncio
+import os
+import random
+from time import perf_counter
+
+from ai.collection_views import COLLECTION_VIEWS, LLM_SUMMARY, PAGE_SIZE, is_next_page_request, render_page
+from ai.intent.fast_classifier import FastIntentClassifier, FastIntentStats, timed_classify
+from ai.llm_registry import get_llm_registry, structured_args
+from ai.prompt_registry import reply_with_system_prompt
+from ai.recommendation.coffee_index import get_coffee_index, render_recommendation_context
+from ai.reply_stream import emit_event, generate_reply, stream_local_text
+from ai.reply_templates import render_reply, should_reword
+from ai.response_cache import ResponseCache, is_cacheable
+from ai.schemas import BREWING_METHOD_FIELDS, COFFEE_FIELDS
+from business.repositories.coffee_repository import BREWING_METHODS_TABLE, COFFEES_TABLE
+from business.services.company_business_logic import (
+    COLLECTION_TABLES,
+    RECOMMENDATION_TABLES,
+    build_record,
+    collection_page,
+    prefetch_collection,
+    recommendation_context,
+    save_registration,
+    valid_value,
+)
+from metrics.stage_timing import label_intent, span
+
+"""Pipeline de chat v1.1 como grafo de estados.
+
+`StateGraph` ejecuta nodos asíncronos sobre un estado compartido (dict):
+cada nodo declara los nodos que deben terminar antes (`after`) y empieza en
+cuanto terminan, así que los nodos independientes corren en paralelo. Cada
+nodo puede tener:
+
+- `when(state)`: condición para ejecutarlo; si no se cumple se salta. Se
+  vuelve a evaluar mientras el nodo corre cada vez que otro nodo termina:
+  si deja de cumplirse, el nodo se cancela.
+- `cache`: un NodeCache; si tiene la salida para el estado actual el nodo
+  no se ejecuta.
+
+La ejecución deja un `GraphTrace` con el resultado (ran, cached, skipped,
+cancelled), el inicio y la duración de cada nodo.
+
+`ChatGraph` arma el flujo de /api/chat_v1.1:
+
+    fast_classify ─ classify ─┬─ completeness ─┬─ persist ─┐
+                              ├─ extract ──────┘           ├─ reply
+                              └─ fetch_collection ─────────┘
+    fast_classify ─ prefetch (opcional) ─ fetch_collection
+
+fast_classify corre el pre-clasificador local (microsegundos); classify
+usa su intención si tiene confianza suficiente y, si no, llama al LLM.
+
+En modo multistep la completitud y la extracción de un registro corren a la
+vez (COFFETTO_GRAPH_EAGER_EXTRACTION); si el mensaje resulta incompleto, la
+extracción se cancela.
+
+Con COFFETTO_COLLECTION_PREFETCH el nodo prefetch arranca junto con la
+clasificación y lanza la lectura que necesitará el turno, solo si la
+etiqueta más probable del pre-clasificador local es de lectura, aunque su
+confianza no alcance el umbral: para Recommend_* la colección del usuario
+hacia la caché de colecciones; para Show_my_* solo la primera página de la
+vista con sus columnas, como la leería fetch_collection (cargar la colección
+completa desharía la lectura paginada). fetch_collection espera esa lectura
+en lugar de empezar una nueva.
+No corre ante un posible registro (la lectura se cruzaría con la inserción),
+si el turno completa un registro pendiente ni si la intención ya se
+resolvió sin leer colecciones.
+
+Recommend_coffee arma su contexto con el índice de similitud de cafés
+(ai/recommendation/coffee_index.py) cuando ya está cargado: sin leer la
+base, con los cafés recientes del usuario y los más parecidos de otros
+usuarios. La rama 'Other' se sirve desde la caché de
+respuestas como caché del nodo reply; las preguntas cacheables se responden
+sin historial para que la respuesta compartida no lleve datos del usuario. El grafo no toca la memoria de la
+conversación: el endpoint agrega el mensaje del usuario antes y la
+respuesta después.
+"""
+
+REGISTER_INTENTS = ("Register_coffee", "Register_brewing_method")
+
+
+class NodeCache:
+    """Interfaz de la caché de un nodo"""
+
+    def lookup(self, state: dict) -> tuple:
+        """(clave, salida cacheada o None); la clave es None si el estado no es cacheable"""
+        raise NotImplementedError
+
+    def store(self, key, output: dict) -> None:
+        raise NotImplementedError
+
+
+class GraphNode:
+    __slots__ = ("name", "run", "after", "when", "cache")
+
+    def __init__(self, name: str, run, after: tuple = (), when=None, cache: NodeCache = None):
+        self.name = name
+        # async run(state) -> dict con las claves que el nodo agrega al estado
+        self.run = run
+        self.after = tuple(after)
+        self.when = when
+        self.cache = cache
+
+
+class GraphTrace:
+    __slots__ = ("started", "seconds", "nodes")
+
+    def __init__(self):
+        self.started = perf_counter()
+        self.seconds = None
+        # [{"node", "status", "start_ms", "ms"}, ...] en el orden en que terminaron
+        self.nodes = []
+
+    def record(self, name: str, status: str, started: float) -> None:
+        self.nodes.append({
+            "node": name,
+            "status": status,
+            "start_ms": round((started - self.started) * 1000, 3),
+            "ms": round((perf_counter() - started) * 1000, 3),
+        })
+
+    def finish(self) -> None:
+        self.seconds = perf_counter() - self.started
+
+    def as_dict(self) -> dict:
+        return {
+            "total_ms": round(self.seconds * 1000, 3) if self.seconds is not None else None,
+            "nodes": list(self.nodes),
+        }
+
+
+class _GraphRun:
+    """Estado de una ejecución del grafo"""
+
+    __slots__ = ("state", "trace", "tasks", "running", "dropped")
+
+    def __init__(self, state: dict):
+        self.state = state
+        self.trace = GraphTrace()
+        self.tasks = {}
+        # nodos que están ejecutando su `run`, para volver a evaluar su condición
+        self.running = {}
+        # nodos cancelados porque su condición dejó de cumplirse
+        self.dropped = set()
+
+
+class StateGraph:
+    def __init__(self):
+        self._nodes = {}
+
+    @property
+    def nodes(self) -> list:
+        return list(self._nodes)
+
+    def add_node(self, name: str, run, after: tuple = (), when=None, cache: NodeCache = None) -> "StateGraph":
+        """Agrega un nodo; sus dependencias deben estar declaradas antes (el grafo no tiene ciclos)"""
+        if name in self._nodes:
+            raise ValueError(f"Nodo duplicado: {name}")
+        unknown = [dependency for dependency in after if dependency not in self._nodes]
+        if unknown:
+            raise ValueError(f"El nodo {name} depende de nodos no declarados: {', '.join(unknown)}")
+        self._nodes[name] = GraphNode(name, run, after, when, cache)
+        return self
+
+    async def run(self, state: dict) -> GraphTrace:
+        """Ejecuta el grafo sobre `state` (se modifica en el lugar) y retorna su traza"""
+        graph_run = _GraphRun(state)
+        loop = asyncio.get_running_loop()
+        # Las tareas se crean en orden de declaración: las dependencias de cada nodo ya existen
+        for node in self._nodes.values():
+            dependencies = [graph_run.tasks[name] for name in node.after]
+            graph_run.tasks[node.name] = loop.create_task(self._run_node(graph_run, node, dependencies))
+        try:
+            await asyncio.gather(*graph_run.tasks.values())
+        except BaseException:
+            # Un nodo falló (o se canceló la petición): no se deja ningún nodo corriendo
+            for task in graph_run.tasks.values():
+                task.cancel()
+            await asyncio.gather(*graph_run.tasks.values(), return_exceptions=True)
+            raise
+        finally:
+            graph_run.trace.finish()
+        return graph_run.trace
+
+    async def _run_node(self, graph_run: _GraphRun, node: GraphNode, dependencies: list) -> None:
+        if dependencies:
+            await asyncio.gather(*dependencies)
+        state, trace = graph_run.state, graph_run.trace
+        started = perf_counter()
+        if node.when is not None and not node.when(state):
+            trace.record(node.name, "skipped", started)
+            return
+        key = None
+        if node.cache is not None:
+            key, output = node.cache.lookup(state)
+            if output is not None:
+                state.update(output)
+                trace.record(node.name, "cached", started)
+                self._recheck(graph_run)
+                return
+        graph_run.running[node.name] = node
+        try:
+            output = await node.run(state)
+        except asyncio.CancelledError:
+            if node.name not in graph_run.dropped:
+                raise
+            trace.record(node.name, "cancelled", started)
+            return
+        finally:
+            graph_run.running.pop(node.name, None)
+        if output:
+            state.update(output)
+            if key is not None:
+                node.cache.store(key, output)
+        trace.record(node.name, "ran", started)
+        self._recheck(graph_run)
+
+    @staticmethod
+    def _recheck(graph_run: _GraphRun) -> None:
+        """Cancela los nodos en curso cuya condición dejó de cumplirse con el nuevo estado"""
+        for name, node in list(graph_run.running.items()):
+            if node.when is not None and name not in graph_run.dropped and not node.when(graph_run.state):
+                graph_run.dropped.add(name)
+                graph_run.tasks[name].cancel()
+
+
+# --- Prompts del flujo v1.1 ---
+_INTENT_LABELS = (
+    "estrictamente en una de las etiquetas: 'Register_coffee', 'Register_brewing_method', 'Recommend_coffee', 'Recommend_brewing', 'Show_my_coffees', 'Show_my_brewing_methods' u 'Other'. "
+    "Usa 'Register_coffee' cuando el usuario quiere guardar/registrar información de un café. "
+    "Usa 'Register_brewing_method' cuando quiere guardar un método de preparación. "
+    "Usa 'Recommend_coffee' cuando pide recomendaciones de café. "
+    "Usa 'Recommend_brewing' cuando pide recomendaciones de preparación. "
+    "Usa 'Show_my_coffees' cuando pregunta por sus cafés favoritos, registrados, guardados o cuáles tiene. "
+    "Usa 'Show_my_brewing_methods' cuando pregunta por sus métodos de preparación registrados o cuáles tiene. "
+)
+
+
+def _combined_turn_text(history_text: str, user_input: str) -> str:
+    return (
+        "Eres un asistente especializado en café. Lee la conversación y clasifica la intención del último "
+        "mensaje " + _INTENT_LABELS +
+        "En otro caso usa 'Other'.\n"
+        "Solo si la intención es 'Register_coffee' o 'Register_brewing_method': extrae del último mensaje los "
+        "campos del café (nombre_cafe obligatorio; variedad, proceso, tueste, perfil_sabor, donde_comprar opcionales) "
+        "o del método (nombre_metodo obligatorio; ratio, instrucciones opcionales), devuelve is_complete=true solo "
+        "si está el nombre y lista en missing_fields los campos faltantes. No inventes datos: omite los campos "
+        "ausentes (no devuelvas null).\n\n"
+        f"Historial:\n{history_text}\n\n"
+        f"Último mensaje del usuario: {user_input}"
+    )
+
+
+def _classify_text(history_text: str, user_input: str) -> str:
+    return (
+        "Eres un clasificador especializado en café. Lee la conversación y clasifica la intención "
+        + _INTENT_LABELS +
+        "En otro caso usa 'Other'.\n\n"
+        f"Historial:\n{history_text}\n\n"
+        f"Último mensaje del usuario: {user_input}"
+    )
+
+
+def _general_question_text(user_input: str) -> str:
+    # Sin historial: la respuesta se guarda en la caché de respuestas y se comparte entre usuarios
+    return (
+        "Pregunta general sobre café. Responde solo la pregunta, sin saludar, sin presentarte y sin "
+        "mencionar el nombre del usuario ni la conversación anterior.\n\n"
+        f"Usuario: {user_input}\n"
+        f"Asistente:"
+    )
+
+
+def _coffee_completeness_text(message: str) -> str:
+    return (
+        "Evalúa si el mensaje contiene la información completa para registrar un café. "
+        "Requisitos mínimos: nombre_cafe. Campos opcionales: variedad, proceso, tueste, perfil_sabor, donde_comprar. "
+        "Devuelve is_complete=true solo si al menos el nombre del café está presente en el mensaje. "
+        "Si falta el nombre o si el usuario quiere agregar más información, lista los campos faltantes en missing_fields."
+    ) + f"\n\nMensaje del usuario: {message}"
+
+
+def _brewing_completeness_text(message: str) -> str:
+    return (
+        "Evalúa si el mensaje contiene información completa para registrar un método de preparación de café. "
+        "Requisitos mínimos: nombre_metodo. Campos opcionales: ratio, instrucciones. "
+        "Devuelve is_complete=true solo si al menos el nombre del método está presente."
+    ) + f"\n\nMensaje del usuario: {message}"
+
+
+def _coffee_extraction_text(message: str) -> str:
+    return (
+        "Extrae los campos del café desde el mensaje del usuario. No inventes datos. "
+        "Si un campo no está presente, omítelo (no devuelvas null).\n\n"
+        f"Mensaje del usuario: {message}"
+    )
+
+
+def _brewing_extraction_text(message: str) -> str:
+    return (
+        "Extrae los campos del método de preparación desde el mensaje del usuario. No inventes datos.\n\n"
+        f"Mensaje del usuario: {message}"
+    )
+
+
+def _coffee_missing_text(missing_fields: list, history_text: str, user_input: str) -> str:
+    return (
+        "ROLE: Coffetto, asistente cafetero entusiasta y amigable.\n"
+        "Pide al usuario, de manera amigable, los datos faltantes del café: "
+        f"{', '.join(missing_fields)}. Explica que estos datos te ayudarán a recordar y recomendar mejor el café. "
+        "NO uses formato Markdown (**, *, etc.) - usa solo texto plano.\n\n"
+        f"Historial:\n{history_text}\n\n"
+        f"Usuario: {user_input}\n"
+        f"Asistente:"
+    )
+
+
+def _brewing_missing_text(missing_fields: list, history_text: str, user_input: str) -> str:
+    return (
+        "ROLE: Coffetto, asistente cafetero entusiasta.\n"
+        "Pide al usuario los datos faltantes del método de preparación: "
+        f"{', '.join(missing_fields)}. Explica que esto te ayudará a recordar cómo preparar el café. "
+        "NO uses formato Markdown - usa solo texto plano.\n\n"
+        f"Historial:\n{history_text}\n\n"
+        f"Usuario: {user_input}\n"
+        f"Asistente:"
+    )
+
+
+def _recommend_coffee_text(collection_text: str, history_text: str, user_input: str) -> str:
+    return (
+        f"ROLE: Coffetto, asistente cafetero experto en recomendaciones.\n"
+        f"Basándote en los gustos del usuario y los cafés registrados, recomienda cafés similares "
+        f"o nuevas opciones que podrían gustar. NO uses formato Markdown - usa solo texto plano.\n\n"
+        f"{collection_text}\n\n"
+        f"Historial:\n{history_text}\n\n"
+        f"Usuario: {user_input}\n"
+        f"Asistente:"
+    )
+
+
+def _recommend_brewing_text(collection_text: str, history_text: str, user_input: str) -> str:
+    return (
+        f"ROLE: Coffetto, asistente cafetero experto en preparación.\n"
+        f"Recomienda métodos de preparación adecuados para el café mencionado o ayuda a calcular "
+        f"las proporciones basándote en los métodos registrados. NO uses formato Markdown - usa solo texto plano.\n\n"
+        f"{collection_text}\n\n"
+        f"Historial:\n{history_text}\n\n"
+        f"Usuario: {user_input}\n"
+        f"Asistente:"
+    )
+
+
+# Intención de registro -> tabla, campos, esquemas estructurados, prompts y plantillas
+REGISTRATIONS = {
+    "Register_coffee": {
+        "table": COFFEES_TABLE,
+        "fields": COFFEE_FIELDS,
+        "completeness_schema": "coffee_completeness",
+        "completeness_text": _coffee_completeness_text,
+        "extraction_schema": "coffee_data",
+        "extraction_text": _coffee_extraction_text,
+        "missing_text": _coffee_missing_text,
+        "templates": "coffee",
+    },
+    "Register_brewing_method": {
+        "table": BREWING_METHODS_TABLE,
+        "fields": BREWING_METHOD_FIELDS,
+        "completeness_schema": "brewing_completeness",
+        "completeness_text": _brewing_completeness_text,
+        "extraction_schema": "brewing_data",
+        "extraction_text": _brewing_extraction_text,
+        "missing_text": _brewing_missing_text,
+        "templates": "brewing_method",
+    },
+}
+
+RECOMMENDATION_TEXTS = {
+    "Recommend_coffee": _recommend_coffee_text,
+    "Recommend_brewing": _recommend_brewing_text,
+}
+
+
+def _turn_slots(turn: dict, fields: list) -> tuple:
+    """Obtiene (is_complete, missing_fields, extracted) de la salida combinada"""
+    extracted = {k: turn[k] for k in fields if valid_value(turn.get(k))}
+    missing_fields = [f for f in (turn.get("missing_fields") or []) if f in fields]
+    # El primer campo (nombre) es el mínimo requerido para registrar
+    is_complete = bool(turn.get("is_complete", False)) and fields[0] in extracted
+    if not is_complete and fields[0] not in missing_fields and fields[0] not in extracted:
+        missing_fields.insert(0, fields[0])
+    return is_complete, missing_fields, extracted
+
+
+async def _classify_intention(registry, history_text: str, user_input: str) -> str:
+    """Clasificación de intención (prompt plano) del modo multistep"""
+    result = await registry.structured("intention").ainvoke(_classify_text(history_text, user_input))
+    return structured_args(result).get("userintention")
+
+
+# --- Condiciones de los nodos ---
+def _is_registration(state: dict) -> bool:
+    return state["intention"] in REGISTRATIONS
+
+
+def _needs_extraction(state: dict) -> bool:
+    # En modo combined los campos ya vienen de la llamada combinada; se cancela si resulta incompleto
+    return _is_registration(state) and state["turn"] is None and state["is_complete"] is not False
+
+
+def _can_persist(state: dict) -> bool:
+    return _is_registration(state) and state["is_complete"] is True
+
+
+def _needs_collection(state: dict) -> bool:
+    return state["intention"] in COLLECTION_TABLES
+
+
+def _is_page_continuation(state: dict) -> bool:
+    return state["pending_page"] is not None and is_next_page_request(state["message"])
+
+
+def _may_need_collection(state: dict) -> bool:
+    # Solo si el pre-clasificador propone una lectura; un turno que completa un registro pendiente no lee colecciones
+    return (
+        state["pending_intent"] is None
+        and state["fast_label"] in COLLECTION_TABLES
+        and (state["intention"] is None or _needs_collection(state))
+    )
+
+
+def _coffee_index_ready() -> bool:
+    index = get_coffee_index()
+    return index is not None and index.ready
+
+
+class _GeneralReplyCache(NodeCache):
+    """Caché de respuestas de la rama 'Other' como caché del nodo reply"""
+
+    def __init__(self, response_cache: ResponseCache):
+        self.response_cache = response_cache
+
+    def lookup(self, state: dict) -> tuple:
+        if state["intention"] != "Other":
+            return None, None
+        key, reply = self.response_cache.lookup(state["message"], len(state["history"]) - 1)
+        if reply is None:
+            return key, None
+        return key, {"result": {"userintention": "Other", "reply": reply}}
+
+    def store(self, key, output: dict) -> None:
+        # Solo las respuestas generadas sin historial (ver _general_question_text) son compartibles
+        if output.get("shared_reply"):
+            self.response_cache.store(key, output["result"]["reply"])
+
+
+class ChatGraph:
+    def __init__(
+        self,
+        fast_intent_classifier: FastIntentClassifier = None,
+        shadow_rate: float = 0.05,
+        response_cache: ResponseCache = None,
+        eager_extraction: bool = True,
+        prefetch_collections: bool = False,
+    ):
+        # Pre-clasificador local de intención: los mensajes con confianza >= umbral no
+        # pasan por el clasificador de Gemini. Una fracción (`shadow_rate`) se verifica
+        # en segundo plano contra el LLM para medir la concordancia.
+        self.fast_intent_classifier = fast_intent_classifier
+        self.fast_intent_stats = FastIntentStats()
+        self.shadow_rate = shadow_rate
+        # Respuestas reutilizables de la rama 'Other' (ver COFFETTO_RESPONSE_CACHE_*)
+        self.response_cache = response_cache or ResponseCache()
+        # Completitud y extracción en paralelo (modo multistep)
+        self.eager_extraction = eager_extraction
+        # Lectura anticipada de las colecciones mientras se clasifica
+        self.prefetch_collections = prefetch_collections
+        # Referencias a tareas en segundo plano para que no sean recolectadas antes de terminar
+        self._background_tasks = set()
+        self.graph = self._build_graph()
+
+    @classmethod
+    def from_env(cls) -> "ChatGraph":
+        fast_intent_enabled = os.getenv("COFFETTO_FAST_INTENT_ENABLED", "true").lower() in ("1", "true", "yes")
+        return cls(
+            fast_intent_classifier=FastIntentClassifier.from_env() if fast_intent_enabled else None,
+            shadow_rate=float(os.getenv("COFFETTO_FAST_INTENT_SHADOW_RATE", "0.05")),
+            response_cache=ResponseCache.from_env(),
+            eager_extraction=os.getenv("COFFETTO_GRAPH_EAGER_EXTRACTION", "true").lower() in ("1", "true", "yes"),
+            prefetch_collections=os.getenv("COFFETTO_COLLECTION_PREFETCH", "false").lower() in ("1", "true", "yes"),
+        )
+
+    def _build_graph(self) -> StateGraph:
+        graph = StateGraph()
+        graph.add_node("fast_classify", self._fast_classify)
+        graph.add_node("classify", self._classify, after=("fast_classify",))
+        if self.prefetch_collections:
+            graph.add_node("prefetch", self._prefetch, after=("fast_classify",), when=_may_need_collection)
+        graph.add_node("completeness", self._completeness, after=("classify",), when=_is_registration)
+        graph.add_node(
+            "extract",
+            self._extract,
+            after=("classify",) if self.eager_extraction else ("classify", "completeness"),
+            when=_needs_extraction,
+        )
+        graph.add_node("persist", self._persist, after=("completeness", "extract"), when=_can_persist)
+        # prefetch solo lanza las lecturas y termina enseguida: esperarlo no retrasa el nodo
+        fetch_after = ("classify", "prefetch") if self.prefetch_collections else ("classify",)
+        graph.add_node("fetch_collection", self._fetch_collection, after=fetch_after, when=_needs_collection)
+        graph.add_node(
+            "reply",
+            self._reply,
+            after=("completeness", "persist", "fetch_collection"),
+            cache=_GeneralReplyCache(self.response_cache),
+        )
+        return graph
+
+    async def run(self, user_id: str, message: str, extraction_mode: str, history, history_text: str) -> tuple:
+        """(resultado del turno, GraphTrace); `history` ya incluye el mensaje del usuario"""
+        # El registro o la página pendientes solo valen para el turno siguiente
+        pending_intent, history.pending_intent = history.pending_intent, None
+        pending_page, history.pending_page = history.pending_page, None
+        state = {
+            "user_id": user_id,
+            "message": message,
+            "extraction_mode": extraction_mode,
+            "history": history,
+            "history_text": history_text,
+            "pending_intent": pending_intent,
+            "pending_page": pending_page,
+            # Etiqueta más probable del pre-clasificador local y la intención si su confianza basta
+            "fast_label": None,
+            "fast_intention": None,
+            "intention": None,
+            "page": 0,
+            # Salida de la llamada combinada (solo en modo "combined")
+            "turn": None,
+            "is_complete": None,
+            "missing_fields": [],
+            "extracted": None,
+            "record": None,
+            "saved": None,
+            "collection": None,
+            # True si la respuesta 'Other' se generó sin historial y puede ir a la caché de respuestas
+            "shared_reply": False,
+            # intención -> tarea de lectura anticipada (nodo prefetch)
+            "prefetch": {},
+            "result": None,
+        }
+        trace = await self.graph.run(state)
+        return state["result"], trace
+
+    # --- Nodos ---
+    async def _fast_classify(self, state: dict) -> dict:
+        if _is_page_continuation(state):
+            return {}
+        with span("intent_fast"):
+            label, usable = self._fast_intention(state["message"], state["extraction_mode"], state["pending_intent"])
+        return {"fast_label": label, "fast_intention": label if usable else None}
+
+    async def _classify(self, state: dict) -> dict:
+        user_input = state["message"]
+        page = 0
+        turn = None
+        if _is_page_continuation(state):
+            # "más" / "siguiente" después de una lista paginada: no hace falta clasificar
+            user_intention, page = state["pending_page"]
+        else:
+            user_intention = state["fast_intention"]
+            # Intención resuelta por el pre-clasificador local; una muestra se verifica con el LLM
+            if user_intention is not None and random.random() < self.shadow_rate:
+                self._spawn_background(self._shadow_check_intention(state["history_text"], user_input, user_intention))
+        if user_intention is None:
+            registry = get_llm_registry()
+            llm_started = perf_counter()
+            if state["extraction_mode"] == "combined":
+                # Intención + completitud + campos en una sola llamada
+                with span("combined_turn"):
+                    result = await registry.structured("turn").ainvoke(_combined_turn_text(state["history_text"], user_input))
+                turn = structured_args(result)
+                user_intention = turn.get("userintention")
+            else:
+                with span("intent_classification"):
+                    user_intention = await _classify_intention(registry, state["history_text"], user_input)
+            self.fast_intent_stats.record_llm(perf_counter() - llm_started)
+
+        # En el endpoint de streaming la intención se envía antes de la respuesta
+        emit_event("intent", userintention=user_intention)
+        label_intent(user_intention)
+        return {"intention": user_intention, "page": page, "turn": turn}
+
+    async def _completeness(self, state: dict) -> dict:
+        registration = REGISTRATIONS[state["intention"]]
+        if state["turn"] is not None:
+            # En modo "combined" la completitud y los campos ya vienen de la llamada combinada
+            is_complete, missing_fields, extracted = _turn_slots(state["turn"], registration["fields"])
+            return {"is_complete": is_complete, "missing_fields": missing_fields, "extracted": extracted}
+        completeness_model = get_llm_registry().structured(registration["completeness_schema"])
+        with span("completeness"):
+            completeness = await completeness_model.ainvoke(registration["completeness_text"](state["message"]))
+        completeness_args = structured_args(completeness)
+        return {
+            "is_complete": bool(completeness_args.get("is_complete", False)),
+            "missing_fields": completeness_args.get("missing_fields", []) or [],
+        }
+
+    async def _extract(self, state: dict) -> dict:
+        registration = REGISTRATIONS[state["intention"]]
+        extractor = get_llm_registry().structured(registration["extraction_schema"])
+        with span("extraction"):
+            extracted_payload = await extractor.ainvoke(registration["extraction_text"](state["message"]))
+        return {"extracted": structured_args(extracted_payload)}
+
+    async def _persist(self, state: dict) -> dict:
+        # Inserción en Supabase (o en la cola de escritura diferida)
+        record = build_record(state["user_id"], state["extracted"] or {})
+        saved = await save_registration(REGISTRATIONS[state["intention"]]["table"], record)
+        return {"record": record, "saved": saved}
+
+    async def _prefetch(self, state: dict) -> dict:
+        # La intención del LLM aún no se conoce: se lee la tabla de la etiqueta del pre-clasificador
+        intention = state["intention"] or state["fast_label"]
+        if intention == "Recommend_coffee" and _coffee_index_ready():
+            return {}
+        if intention in COLLECTION_VIEWS:
+            # Vista paginada: la primera página con sus columnas, no la colección completa
+            read = collection_page(COLLECTION_VIEWS[intention], state["user_id"], 0, PAGE_SIZE)
+        else:
+            read = prefetch_collection(COLLECTION_TABLES[intention], state["user_id"])
+        # Tarea en segundo plano: si el turno no la necesita termina sola
+        return {"prefetch": {intention: self._spawn_background(read)}}
+
+    async def _fetch_collection(self, state: dict) -> dict:
+        intention = state["intention"]
+        if intention == "Recommend_coffee" and _coffee_index_ready():
+            # Solo los cafés recientes del usuario y los top-k parecidos van al prompt
+            with span("similarity_search"):
+                result = get_coffee_index().search(state["user_id"], state["message"])
+            return {"collection": render_recommendation_context(result)}
+        prefetched = state["prefetch"].get(intention)
+        if prefetched is not None:
+            # La lectura empezó junto con la clasificación: se espera en vez de repetir la consulta.
+            # shield: si el turno se cancela la carga compartida de la caché no se interrumpe
+            with span("prefetch_wait"):
+                prefetched_result = await asyncio.shield(prefetched)
+        if intention in RECOMMENDATION_TABLES:
+            return {"collection": await recommendation_context(RECOMMENDATION_TABLES[intention], state["user_id"])}
+        if prefetched is not None and state["page"] == 0:
+            return {"collection": prefetched_result}
+        view = COLLECTION_VIEWS[intention]
+        return {"collection": await collection_page(view, state["user_id"], state["page"], PAGE_SIZE)}
+
+    async def _reply(self, state: dict) -> dict:
+        intention = state["intention"]
+        llm = get_llm_registry().llm
+        shared_reply = False
+        if intention == "Other":
+            shared_reply = is_cacheable(state["message"], len(state["history"]) - 1)
+            result = await self._general_reply(llm, state, shared_reply)
+        elif intention in REGISTRATIONS:
+            result = await self._registration_reply(llm, state)
+        elif intention in RECOMMENDATION_TEXTS:
+            reply_text = await generate_reply(
+                llm, RECOMMENDATION_TEXTS[intention](state["collection"], state["history_text"], state["message"])
+            )
+            result = {"userintention": intention, "reply": reply_text}
+        elif intention in COLLECTION_VIEWS:
+            result = await self._collection_reply(llm, state)
+        else:
+            result = None
+        return {"result": result, "shared_reply": shared_reply}
+
+    # --- Respuestas por rama ---
+    async def _general_reply(self, llm, state: dict, shared: bool = False) -> dict:
+        # Rama 'Other': respuesta general con memoria; el prompt de sistema con el
+        # conocimiento de café viene compilado del registro de prompts. Las preguntas
+        # cacheables se responden sin historial, porque la respuesta se comparte entre usuarios.
+        if shared:
+            prompt_text = _general_question_text(state["message"])
+        else:
+            prompt_text = (
+                f"Historial:\n{state['history_text']}\n\n"
+                f"Usuario: {state['message']}\n"
+                f"Asistente:"
+            )
+        reply = await reply_with_system_prompt(llm, "general_chat", prompt_text)
+        return {"userintention": "Other", "reply": reply}
+
+    async def _registration_reply(self, llm, state: dict) -> dict:
+        intention = state["intention"]
+        registration = REGISTRATIONS[intention]
+        templates = registration["templates"]
+        if not state["is_complete"]:
+            # Solicitud de los datos faltantes; el siguiente mensaje completa este registro
+            missing_fields = state["missing_fields"]
+            reply_text = await generate_reply(
+                llm, registration["missing_text"](missing_fields, state["history_text"], state["message"])
+            )
+            state["history"].pending_intent = intention
+            return {
+                "userintention": intention,
+                "status": "need_more_data",
+                "missing_fields": missing_fields,
+                "reply": reply_text,
+            }
+
+        saved = state["saved"]
+        if saved["status"] == "error":
+            key = f"{templates}.missing_credentials" if saved.get("missing_credentials") else f"{templates}.error"
+            reply_text = await self._template_reply(llm, key, state)
+            return {
+                "userintention": intention,
+                "status": "error",
+                "error": saved["error"],
+                "reply": reply_text,
+                "extracted": state["extracted"],
+            }
+
+        name_field = registration["fields"][0]
+        reply_text = await self._template_reply(
+            llm, f"{templates}.created", state, **{name_field: state["record"].get(name_field)}
+        )
+        return {
+            "userintention": intention,
+            "status": saved["status"],
+            "data": saved["data"],
+            "reply": reply_text,
+        }
+
+    async def _collection_reply(self, llm, state: dict) -> dict:
+        """Página de los cafés o métodos del usuario, renderizada localmente"""
+        intention, page, collection = state["intention"], state["page"], state["collection"]
+        view = COLLECTION_VIEWS[intention]
+        templates = view["templates"]
+        if collection["status"] == "error":
+            key = f"{templates}.missing_credentials" if collection.get("missing_credentials") else f"{templates}.error"
+            reply_text = await self._template_reply(llm, key, state)
+            return {
+                "userintention": intention,
+                "status": "error",
+                "error": collection["error"],
+                "reply": reply_text,
+            }
+
+        rows, has_more = collection["rows"], collection["has_more"]
+        if not rows:
+            reply_text = await self._template_reply(llm, f"{templates}.empty" if page == 0 else "collection.no_more", state)
+        else:
+            listing = render_page(view, rows, page)
+            llm_header = False
+            if page > 0:
+                header = render_reply("collection.page", page=page + 1)
+            elif LLM_SUMMARY:
+                # Solo la primera página lleva una introducción del modelo sobre lo que se muestra
+                summary_text = (
+                    "ROLE: Coffetto, asistente cafetero entusiasta.\n"
+                    f"Escribe 1-2 frases que presenten al usuario sus {view['label']} (lista abajo), "
+                    "destacando algo en común o llamativo. No repitas la lista. "
+                    "NO uses formato Markdown - usa solo texto plano.\n\n"
+                    f"{listing}\n\n"
+                    f"Usuario: {state['message']}\n"
+                    f"Asistente:"
+                )
+                header = (await generate_reply(llm, summary_text)).strip()
+                llm_header = True
+            else:
+                header = render_reply(f"{templates}.header", seed=state["user_id"])
+            reply_text = f"{header}\n{listing}"
+            if has_more:
+                reply_text += "\n\n" + render_reply("collection.more")
+                state["history"].pending_page = (intention, page + 1)
+            if llm_header:
+                # La introducción ya salió como tokens del modelo: la lista local sigue en el stream
+                stream_local_text(reply_text[len(header):])
+
+        return {
+            "userintention": intention,
+            "status": "success",
+            "page": page + 1,
+            "has_more": has_more,
+            "data": rows,
+            "reply": reply_text,
+        }
+
+    async def _template_reply(self, llm, key: str, state: dict, **values) -> str:
+        """Respuesta fija desde plantilla; solo llama al modelo si la rama pide reformularla"""
+        seed = f"{state['user_id']}:{len(state['history'])}"
+        reply_text = render_reply(key, seed=seed, **values)
+        if should_reword(key):
+            reword_text = (
+                "ROLE: Coffetto, asistente cafetero entusiasta.\n"
+                "Reformula el siguiente mensaje con tus propias palabras, sin cambiar su significado, "
+                "en 1-2 frases. NO uses formato Markdown - usa solo texto plano.\n\n"
+                f"Mensaje: {reply_text}\n\n"
+                f"Usuario: {state['message']}\n"
+                f"Asistente:"
+            )
+            reply_text = await generate_reply(llm, reword_text)
+        return reply_text
+
+    # --- Pre-clasificador local ---
+    def _fast_intention(self, user_input: str, extraction_mode: str, pending_intent) -> tuple:
+        """(etiqueta más probable del pre-clasificador local, si basta para no llamar al LLM)"""
+        # Si se esperan datos de un registro, el mensaje depende del historial
+        if self.fast_intent_classifier is None or pending_intent:
+            return None, False
+        (label, confidence, _source), seconds = timed_classify(self.fast_intent_classifier, user_input)
+        usable = confidence >= self.fast_intent_classifier.threshold
+        # En modo "combined" los registros necesitan la llamada combinada para extraer los campos
+        if extraction_mode == "combined" and label in REGISTER_INTENTS:
+            usable = False
+        self.fast_intent_stats.record_fast(seconds, usable)
+        return label, usable
+
+    async def _shadow_check_intention(self, history_text: str, user_input: str, fast_label: str) -> None:
+        """Compara en segundo plano la intención local con la del clasificador LLM"""
+        try:
+            llm_label = await _classify_intention(get_llm_registry(), history_text, user_input)
+            self.fast_intent_stats.record_agreement(llm_label == fast_label)
+        except Exception as e:
+            print(f"Error en la verificación del pre-clasificador: {e}")
+
+    def _spawn_background(self, coro) -> asyncio.Task:
+        task = asyncio.get_running_loop().create_task(coro)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+        return task
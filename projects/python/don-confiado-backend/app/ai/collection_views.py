@@ -0,0 +1,80 @@
+import os
+import re
+
+from ai.intent.fast_classifier import normalize
+
+"""Vistas paginadas de las colecciones del usuario (cafés y métodos).
+
+Cada vista consulta solo las columnas que muestra, una página a la vez, y
+arma la lista localmente en lugar de enviar todas las filas al modelo para
+darles formato. Cuando hay más resultados, el usuario pide la siguiente
+página con "más" / "siguiente".
+"""
+
+PAGE_SIZE = int(os.getenv("COFFETTO_VIEW_PAGE_SIZE", "10"))
+# Introducción generada por el modelo solo para la primera página
+LLM_SUMMARY = os.getenv("COFFETTO_VIEW_LLM_SUMMARY", "true").lower() in ("1", "true", "yes")
+
+COFFEE_VIEW_COLUMNS = ("nombre_cafe", "variedad", "perfil_sabor", "donde_comprar")
+BREWING_METHOD_VIEW_COLUMNS = ("nombre_metodo", "ratio", "instrucciones")
+
+# Longitud máxima de las instrucciones mostradas por método
+_MAX_INSTRUCTIONS_CHARS = 100
+
+_NEXT_PAGE = re.compile(
+    r"^(y )?(ver |muestra(me)? |dame |quiero ver )?(los |las )?"
+    r"(mas|siguientes?|la siguiente|pagina siguiente|otra pagina|next|more)"
+    r"( pagina| por favor| porfa| please)?$"
+)
+
+
+def is_next_page_request(message: str) -> bool:
+    return bool(_NEXT_PAGE.match(normalize(message)))
+
+
+def _coffee_line(cafe: dict) -> str:
+    line = cafe.get("nombre_cafe") or "Sin nombre"
+    if cafe.get("variedad"):
+        line += f" - {cafe['variedad']}"
+    if cafe.get("perfil_sabor"):
+        line += f" ({cafe['perfil_sabor']})"
+    if cafe.get("donde_comprar"):
+        line += f" - Disponible en: {cafe['donde_comprar']}"
+    return line
+
+
+def _brewing_method_line(metodo: dict) -> str:
+    line = metodo.get("nombre_metodo") or "Sin nombre"
+    if metodo.get("ratio"):
+        line += f" - Ratio: {metodo['ratio']}"
+    instrucciones = metodo.get("instrucciones")
+    if instrucciones:
+        if len(instrucciones) > _MAX_INSTRUCTIONS_CHARS:
+            instrucciones = instrucciones[:_MAX_INSTRUCTIONS_CHARS] + "..."
+        line += f" - {instrucciones}"
+    return line
+
+
+# Intención -> configuración de la vista
+COLLECTION_VIEWS = {
+    "Show_my_coffees": {
+        "list_page": "list_coffees_page",
+        "columns": COFFEE_VIEW_COLUMNS,
+        "line": _coffee_line,
+        "templates": "show_coffees",
+        "label": "cafés registrados",
+    },
+    "Show_my_brewing_methods": {
+        "list_page": "list_brewing_methods_page",
+        "columns": BREWING_METHOD_VIEW_COLUMNS,
+        "line": _brewing_method_line,
+        "templates": "show_brewing_methods",
+        "label": "métodos de preparación registrados",
+    },
+}
+
+
+def render_page(view: dict, rows: list, page: int, page_size: int = PAGE_SIZE) -> str:
+    """Lista numerada de la página `page` (desde 0), continuando la numeración"""
+    first = page * page_size + 1
+    return "\n".join(f"{i}. {view['line'](row)}" for i, row in enumerate(rows, first))
@@ -0,0 +1,255 @@
+import math
+import os
+import re
+import time
+import unicodedata
+from collections import Counter
+
+"""Pre-clasificador local de intención, previo al clasificador de Gemini.
+
+Combina reglas de palabras clave/regex con un Naive Bayes multinomial sobre
+n-gramas de caracteres entrenado en proceso con frases de ejemplo. Responde
+en microsegundos con una confianza; solo los mensajes con confianza menor
+al umbral se envían al clasificador LLM. Una regla de palabras clave solo
+aporta su confianza si el modelo elige la misma intención, así que las
+preguntas que mencionan las palabras ("¿cómo guardar el café para que no
+pierda aroma?") se quedan con la confianza del modelo y van al LLM.
+"""
+
+# (intención, confianza, patrón, exacta) sobre el texto normalizado (minúsculas, sin tildes).
+# Las reglas de palabras clave piden la forma imperativa o posesiva ("muéstrame mis cafés",
+# "quiero registrar un café") y solo deciden si el modelo de n-gramas elige la misma
+# intención; las exactas (el mensaje completo es un saludo) no necesitan su acuerdo.
+_RULES = [
+    ("Other", 0.97, re.compile(
+        r"^(hola|holi|buen[oa]s( dias| tardes| noches)?|hey|que tal|saludos|gracias|muchas gracias|"
+        r"ok|okay|vale|chao|adios|hasta luego)( coffetto)?[ !.]*$"), True),
+    ("Show_my_brewing_methods", 0.95, re.compile(
+        r"^(por favor )?(((muestra|ensena|lista)(me)?|mostrar(me)?|ver|dame|cuales son) (todos )?mis "
+        r"(metodos|recetas|preparaciones)\b|(que|cuales) (metodos|recetas|preparaciones) (tengo|he (guardado|registrado))\b)"),
+     False),
+    ("Show_my_coffees", 0.95, re.compile(
+        r"^(por favor )?(((muestra|ensena|lista)(me)?|mostrar(me)?|ver|dame|cuales son) (todos )?mis cafes\b|"
+        r"(que|cuales) cafes (tengo|he (guardado|registrado))\b)"), False),
+    ("Register_brewing_method", 0.93, re.compile(
+        r"^(por favor )?((registra|guarda|agrega|anota)(me)?|quiero (guardar|registrar|agregar|anotar)|"
+        r"(me )?puedes (guardar|registrar|agregar|anotar))\b.*\b(metodo|receta|preparacion)\b"), False),
+    ("Register_coffee", 0.93, re.compile(
+        r"^(por favor )?((registra|guarda|agrega|anota)(me)?|quiero (guardar|registrar|agregar|anotar)|"
+        r"(me )?puedes (guardar|registrar|agregar|anotar))\b.*\bcafe\b"), False),
+    ("Recommend_brewing", 0.92, re.compile(
+        r"\b(como (preparo|preparar|deberia preparar)|con que metodo|"
+        r"que (metodo|ratio|proporcion|molienda) (uso|usar|me recomiendas|deberia))\b"), False),
+    ("Recommend_coffee", 0.92, re.compile(
+        r"\b((recomienda(me)?|recomiendas|sugiere(me)?|sugieres)( me)? (un |algun |otro )?cafe|"
+        r"que cafe (me (recomiendas|sugieres)|deberia))\b"), False),
+]
+
+# Frases de entrenamiento del modelo de n-gramas
+_SEED_EXAMPLES = {
+    "Register_coffee": [
+        "quiero registrar un cafe",
+        "guarda este cafe geisha lavado de tueste claro",
+        "registra el cafe finca la esperanza bourbon natural",
+        "agrega a mis favoritos un caturra honey",
+        "me gusto mucho un cafe de huila con notas de panela",
+        "anota este cafe etiope con notas florales",
+        "tengo un cafe nuevo que quiero guardar",
+        "compre un cafe tostado medio en la tienda del barrio y quiero guardarlo",
+    ],
+    "Register_brewing_method": [
+        "quiero guardar mi receta de v60",
+        "registra mi metodo de chemex ratio 1:16",
+        "guarda esta preparacion de aeropress",
+        "mi receta de prensa francesa es 1:15 con 4 minutos",
+        "agrega el metodo cold brew con 12 horas de reposo",
+        "anota mi metodo de espresso 18 gramos 36 de salida",
+        "quiero registrar como preparo mi cafe en moka",
+    ],
+    "Recommend_coffee": [
+        "recomiendame un cafe",
+        "que cafe me recomiendas",
+        "sugiereme un cafe parecido a los que me gustan",
+        "que otro cafe podria gustarme",
+        "quiero probar un cafe nuevo cual me sugieres",
+        "busco un cafe afrutado que me recomiendas",
+        "dame una recomendacion de cafe",
+    ],
+    "Recommend_brewing": [
+        "como preparo este cafe",
+        "que metodo me recomiendas para un natural",
+        "que ratio uso para v60",
+        "como hago un buen cold brew",
+        "con que metodo preparo un tueste claro",
+        "cuanta agua para 20 gramos de cafe",
+        "que molienda uso para chemex",
+    ],
+    "Show_my_coffees": [
+        "muestrame mis cafes",
+        "cuales son mis cafes favoritos",
+        "que cafes tengo registrados",
+        "lista mis cafes guardados",
+        "ver mis cafes",
+        "cuales cafes he guardado",
+    ],
+    "Show_my_brewing_methods": [
+        "muestrame mis metodos",
+        "cuales son mis metodos de preparacion",
+        "que recetas tengo guardadas",
+        "lista mis metodos registrados",
+        "ver mis recetas de preparacion",
+        "que metodos he guardado",
+    ],
+    "Other": [
+        "hola",
+        "buenos dias como estas",
+        "me llamo andres",
+        "que es un proceso honey",
+        "de donde viene el cafe",
+        "que diferencia hay entre arabica y robusta",
+        "gracias coffetto",
+        "que es la sobre extraccion",
+        "cual es la historia del cafe",
+        "a que temperatura debe estar el agua",
+    ],
+}
+
+
+def normalize(text: str) -> str:
+    """Minúsculas, sin tildes, sin signos de puntuación y espacios simples"""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    text = re.sub(r"[^a-z0-9: ]+", " ", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def _char_ngrams(text: str, sizes=(2, 3, 4)) -> list:
+    padded = f" {text} "
+    grams = []
+    for size in sizes:
+        grams.extend(padded[i:i + size] for i in range(len(padded) - size + 1))
+    return grams
+
+
+# Mensajes más cortos (p. ej. "sí", "Geisha") dependen del historial: se dejan al LLM
+_MIN_NGRAM_TEXT_LENGTH = 12
+
+
+class _CharNgramNaiveBayes:
+    def __init__(self, examples: dict, alpha: float = 0.5, temperature: float = 0.25):
+        self.labels = list(examples)
+        self.alpha = alpha
+        # Suaviza la sobreconfianza de Naive Bayes al convertir a probabilidades
+        self.temperature = temperature
+        self._log_priors = {}
+        self._log_likelihoods = {}
+        self._log_unseen = {}
+        counts = {label: Counter() for label in self.labels}
+        vocabulary = set()
+        total_examples = sum(len(phrases) for phrases in examples.values())
+        for label, phrases in examples.items():
+            self._log_priors[label] = math.log(len(phrases) / total_examples)
+            for phrase in phrases:
+                grams = _char_ngrams(normalize(phrase))
+                counts[label].update(grams)
+                vocabulary.update(grams)
+        for label in self.labels:
+            denominator = sum(counts[label].values()) + alpha * len(vocabulary)
+            self._log_likelihoods[label] = {
+                gram: math.log((count + alpha) / denominator) for gram, count in counts[label].items()
+            }
+            self._log_unseen[label] = math.log(alpha / denominator)
+        self._vocabulary = vocabulary
+
+    def predict(self, text: str) -> tuple:
+        if len(text) < _MIN_NGRAM_TEXT_LENGTH:
+            return "Other", 0.0
+        grams = [gram for gram in _char_ngrams(text) if gram in self._vocabulary]
+        if not grams:
+            return "Other", 0.0
+        scores = {}
+        for label in self.labels:
+            likelihoods = self._log_likelihoods[label]
+            unseen = self._log_unseen[label]
+            scores[label] = self._log_priors[label] + sum(likelihoods.get(gram, unseen) for gram in grams)
+        # Softmax sobre la log-verosimilitud promedio por n-grama
+        scaled = {label: score / (len(grams) * self.temperature) for label, score in scores.items()}
+        best = max(scaled, key=scaled.get)
+        total = sum(math.exp(value - scaled[best]) for value in scaled.values())
+        return best, 1.0 / total
+
+
+class FastIntentClassifier:
+    def __init__(self, threshold: float = 0.9, examples: dict = None):
+        self.threshold = threshold
+        self._model = _CharNgramNaiveBayes(examples or _SEED_EXAMPLES)
+
+    @classmethod
+    def from_env(cls) -> "FastIntentClassifier":
+        return cls(threshold=float(os.getenv("COFFETTO_FAST_INTENT_THRESHOLD", "0.9")))
+
+    def classify(self, message: str) -> tuple:
+        """Retorna (intención, confianza, origen) con origen "rule" o "ngram" """
+        text = normalize(message)
+        predicted = None
+        for label, confidence, pattern, exact in _RULES:
+            if not pattern.search(text):
+                continue
+            if exact:
+                return label, confidence, "rule"
+            predicted = predicted or self._model.predict(text)
+            # Una regla que el modelo no respalda no decide: queda la confianza del modelo
+            if predicted[0] == label:
+                return label, confidence, "rule"
+        label, confidence = predicted or self._model.predict(text)
+        return label, confidence, "ngram"
+
+
+class FastIntentStats:
+    """Contadores de uso del pre-clasificador y de concordancia con el LLM"""
+
+    def __init__(self):
+        self.messages = 0
+        self.fast_path = 0
+        self.llm_fallbacks = 0
+        self.shadow_checks = 0
+        self.agreements = 0
+        self._fast_seconds = 0.0
+        self._llm_seconds = 0.0
+
+    def record_fast(self, seconds: float, used: bool) -> None:
+        self.messages += 1
+        self._fast_seconds += seconds
+        if used:
+            self.fast_path += 1
+
+    def record_llm(self, seconds: float) -> None:
+        self.llm_fallbacks += 1
+        self._llm_seconds += seconds
+
+    def record_agreement(self, agreed: bool) -> None:
+        self.shadow_checks += 1
+        if agreed:
+            self.agreements += 1
+
+    def snapshot(self) -> dict:
+        avg_llm = self._llm_seconds / self.llm_fallbacks if self.llm_fallbacks else 0.0
+        return {
+            "messages": self.messages,
+            "fast_path": self.fast_path,
+            "llm_fallbacks": self.llm_fallbacks,
+            "fast_path_rate": self.fast_path / self.messages if self.messages else 0.0,
+            "shadow_checks": self.shadow_checks,
+            "agreement_rate": self.agreements / self.shadow_checks if self.shadow_checks else None,
+            "avg_fast_latency_us": (self._fast_seconds / self.messages * 1e6) if self.messages else 0.0,
+            "avg_llm_latency_ms": avg_llm * 1000,
+            # Estimado: cada acierto del camino rápido evita una clasificación LLM promedio
+            "latency_saved_ms": self.fast_path * avg_llm * 1000,
+        }
+
+
+def timed_classify(classifier: FastIntentClassifier, message: str) -> tuple:
+    """classify() más el tiempo que tomó, en segundos"""
+    start = time.perf_counter()
+    result = classifier.classify(message)
+    return result, time.perf_counter() - start
@@ -0,0 +1,91 @@
+import os
+
+from dotenv import load_dotenv
+
+from ai.schemas import STRUCTURED_SCHEMAS
+
+"""Registro de clientes LLM compartido por todo el proceso.
+
+El modelo base y cada runnable con salida estructurada se construyen una
+sola vez (al arrancar la aplicación) y se reutilizan entre peticiones, de
+modo que también se reutilizan las conexiones HTTP del cliente de Gemini.
+
+El SDK de Gemini (langchain_google_genai) tarda más de un segundo en
+importarse, así que se importa al construir el registro y no al importar
+este módulo: el servidor queda escuchando antes y la construcción ocurre
+en el calentamiento del arranque (ver warmup.py).
+"""
+
+load_dotenv()
+
+DEFAULT_MODEL = "gemini-2.5-flash"
+
+
+class LLMRegistry:
+    def __init__(self, llm, schemas: dict = None):
+        self.llm = llm
+        self._structured = {}
+        for name, schema in (schemas or STRUCTURED_SCHEMAS).items():
+            self._structured[name] = llm.with_structured_output(schema)
+
+    def structured(self, name: str):
+        """Retorna el runnable de salida estructurada registrado como `name`"""
+        try:
+            return self._structured[name]
+        except KeyError:
+            raise KeyError(f"Esquema estructurado no registrado: {name}") from None
+
+
+_registry = None
+
+
+def _ensure_api_key() -> None:
+    api_key = os.getenv("GOOGLE_API_KEY")
+    if not api_key:
+        api_key = input("Por favor, ingrese su API KEY de Google (GOOGLE_API_KEY): ")
+        os.environ["GOOGLE_API_KEY"] = api_key
+
+
+def build_llm_registry() -> LLMRegistry:
+    """Construye el modelo base de Gemini y todos sus runnables estructurados"""
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+    from metrics.usage_callback import UsageCallbackHandler
+
+    _ensure_api_key()
+    # El callback registra los tokens de todas las llamadas, incluidas las estructuradas
+    llm = ChatGoogleGenerativeAI(
+        model=os.getenv("GEMINI_MODEL", DEFAULT_MODEL),
+        callbacks=[UsageCallbackHandler()],
+    )
+    return LLMRegistry(llm)
+
+
+def init_llm_registry() -> LLMRegistry:
+    """Inicializa el registro global; pensado para el evento de arranque"""
+    global _registry
+    if _registry is None:
+        _registry = build_llm_registry()
+    return _registry
+
+
+def set_llm_registry(registry: LLMRegistry) -> None:
+    """Reemplaza el registro global (p. ej. por un modelo falso en benchmarks)"""
+    global _registry
+    _registry = registry
+
+
+def get_llm_registry() -> LLMRegistry:
+    """Retorna el registro global, construyéndolo si aún no existe"""
+    return init_llm_registry()
+
+
+def structured_args(result) -> dict:
+    """Normaliza la salida de un runnable estructurado a un dict de campos.
+
+    Según la versión de langchain-google-genai la salida es una lista de
+    tool calls (`[{"args": {...}}]`) o directamente el dict de campos.
+    """
+    if isinstance(result, list):
+        return (result[0].get("args") or {}) if result else {}
+    return result or {}
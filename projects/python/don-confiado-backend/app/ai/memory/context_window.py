@@ -0,0 +1,109 @@
+import asyncio
+import os
+
+from ai.memory.conversation_history import ConversationHistory
+
+"""Ventana de contexto con presupuesto de tokens y resumen incremental.
+
+En lugar de enviar todo el historial en cada prompt, se envía un resumen
+acumulado de los turnos antiguos más los mensajes recientes que caben en el
+presupuesto. El resumen se actualiza en segundo plano cuando quedan
+suficientes mensajes fuera de la ventana reciente, de modo que ninguna
+petición del usuario espera por él.
+"""
+
+# Aproximación de caracteres por token para texto en español
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+class ContextWindow:
+    def __init__(
+        self,
+        summarize,
+        token_budget: int = 1500,
+        recent_messages: int = 8,
+        min_fold_messages: int = 4,
+    ):
+        # summarize(previous_summary: str, transcript: str) -> awaitable[str]
+        self._summarize = summarize
+        self.token_budget = token_budget
+        self.recent_messages = recent_messages
+        self.min_fold_messages = min_fold_messages
+        self._tasks = set()
+        self.summaries = 0
+        self.summary_failures = 0
+
+    @classmethod
+    def from_env(cls, summarize) -> "ContextWindow":
+        return cls(
+            summarize,
+            token_budget=int(os.getenv("COFFETTO_CONTEXT_TOKEN_BUDGET", "1500")),
+            recent_messages=int(os.getenv("COFFETTO_CONTEXT_RECENT_MESSAGES", "8")),
+            min_fold_messages=int(os.getenv("COFFETTO_CONTEXT_MIN_FOLD_MESSAGES", "4")),
+        )
+
+    def render(self, history: ConversationHistory) -> str:
+        """Resumen + mensajes recientes que caben en el presupuesto de tokens"""
+        if self.token_budget <= 0:
+            return history.as_text()
+
+        self._schedule_fold(history)
+
+        summary = history.summary
+        budget_chars = self.token_budget * CHARS_PER_TOKEN
+        if summary:
+            summary = f"Resumen de la conversación anterior: {summary}"
+            budget_chars -= len(summary) + 1
+        # Los mensajes aún no resumidos se incluyen textualmente mientras quepan
+        start_seq = history.tail_start_seq(max(budget_chars, 0), floor_seq=history.summary_seq)
+        recent = history.text_range(start_seq)
+        if summary and recent:
+            return f"{summary}\n{recent}"
+        return summary or recent
+
+    def stats(self) -> dict:
+        return {
+            "token_budget": self.token_budget,
+            "recent_messages": self.recent_messages,
+            "summaries": self.summaries,
+            "summary_failures": self.summary_failures,
+            "summaries_in_progress": len(self._tasks),
+        }
+
+    async def drain(self) -> None:
+        """Espera a que terminen los resúmenes en curso (apagado y benchmarks)"""
+        if self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+    # --- Internos ---
+    def _schedule_fold(self, history: ConversationHistory) -> None:
+        fold_to = history.end_seq - self.recent_messages
+        fold_from = max(history.summary_seq, history.start_seq)
+        if history.summarizing or fold_to - fold_from < self.min_fold_messages:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        history.summarizing = True
+        task = loop.create_task(self._fold(history, fold_from, fold_to))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _fold(self, history: ConversationHistory, fold_from: int, fold_to: int) -> None:
+        try:
+            transcript = history.text_range(fold_from, fold_to)
+            summary = await self._summarize(history.summary, transcript)
+            history.summary = (summary or "").strip()
+            history.summary_seq = fold_to
+            self.summaries += 1
+        except Exception as e:
+            # Se reintentará en la siguiente petición; mientras tanto se usan los mensajes textuales
+            self.summary_failures += 1
+            print(f"Error al resumir la conversación: {e}")
+        finally:
+            history.summarizing = False
@@ -0,0 +1,149 @@
+import itertools
+from collections import deque
+
+"""Historial de conversación de un usuario con transcripción incremental.
+
+Cada mensaje guarda su línea ya renderizada ("Usuario: ..." /
+"Asistente: ..."): agregar o recortar k mensajes cuesta O(k) y no copia la
+transcripción. La transcripción completa se une solo al pedirla, una vez
+por cada cambio del historial (la unión queda en caché hasta el siguiente
+append o recorte).
+"""
+
+_ROLE_PREFIXES = {
+    "human": "Usuario: ",
+    "ai": "Asistente: ",
+}
+
+
+class ConversationHistory:
+    __slots__ = (
+        "messages", "chars", "start_seq", "summary", "summary_seq", "summarizing",
+        "pending_intent", "pending_page", "_lines", "_text",
+    )
+
+    def __init__(self):
+        # Mensajes {"role": "human"|"ai", "content": str}, del más antiguo al más reciente
+        self.messages = deque()
+        self.chars = 0
+        # Número de secuencia absoluto del mensaje más antiguo que se conserva
+        self.start_seq = 0
+        # Resumen acumulado de los mensajes con secuencia < summary_seq (ver ContextWindow)
+        self.summary = ""
+        self.summary_seq = 0
+        self.summarizing = False
+        # Registro en curso que espera datos del usuario (p. ej. "Register_coffee")
+        self.pending_intent = None
+        # Vista paginada que continúa si el usuario pide "más": (intención, página)
+        self.pending_page = None
+        # Línea renderizada de cada mensaje (None si su rol no se muestra)
+        self._lines = deque()
+        # Unión de las líneas; None si el historial cambió desde la última unión
+        self._text = ""
+
+    def __len__(self) -> int:
+        return len(self.messages)
+
+    def __iter__(self):
+        return iter(self.messages)
+
+    def __getitem__(self, index):
+        return self.messages[index]
+
+    @property
+    def end_seq(self) -> int:
+        """Secuencia que tendrá el próximo mensaje"""
+        return self.start_seq + len(self.messages)
+
+    def append(self, role: str, content: str) -> None:
+        self.messages.append({"role": role, "content": content})
+        self.chars += len(content)
+
+        prefix = _ROLE_PREFIXES.get(role)
+        self._lines.append(f"{prefix}{content}" if prefix is not None else None)
+        if prefix is not None:
+            self._text = None
+
+    def drop_oldest(self, count: int) -> int:
+        """Elimina los `count` mensajes más antiguos; retorna los caracteres liberados"""
+        count = min(count, len(self.messages))
+        dropped_chars = 0
+        for _ in range(count):
+            dropped_chars += len(self.messages.popleft()["content"])
+            if self._lines.popleft() is not None:
+                self._text = None
+        self.chars -= dropped_chars
+        self.start_seq += count
+        return dropped_chars
+
+    def drop_newest(self, count: int) -> int:
+        """Elimina los `count` mensajes más recientes; retorna los caracteres liberados"""
+        count = min(count, len(self.messages))
+        dropped_chars = 0
+        for _ in range(count):
+            dropped_chars += len(self.messages.pop()["content"])
+            if self._lines.pop() is not None:
+                self._text = None
+        self.chars -= dropped_chars
+        return dropped_chars
+
+    def messages_since(self, seq: int) -> list:
+        """Mensajes con secuencia >= seq que aún se conservan"""
+        first = max(seq - self.start_seq, 0)
+        return [self.messages[index] for index in range(first, len(self.messages))]
+
+    def state(self) -> dict:
+        """Estado de la sesión que se comparte entre procesos (ver SessionStore)"""
+        return {
+            "pending_intent": self.pending_intent,
+            "pending_page": list(self.pending_page) if self.pending_page else None,
+            "summary": self.summary,
+            "summary_seq": self.summary_seq,
+        }
+
+    def restore_state(self, state: dict) -> None:
+        self.pending_intent = state.get("pending_intent")
+        pending_page = state.get("pending_page")
+        self.pending_page = tuple(pending_page) if pending_page else None
+        # Un resumen local más reciente (de un resumen en segundo plano) no se pisa
+        if state.get("summary_seq", 0) >= self.summary_seq:
+            self.summary = state.get("summary", "")
+            self.summary_seq = state.get("summary_seq", 0)
+
+    def as_text(self) -> str:
+        """Transcripción del historial; se une de nuevo solo si cambió"""
+        if self._text is None:
+            self._text = "\n".join(line for line in self._lines if line is not None)
+        return self._text
+
+    def text_range(self, from_seq: int, to_seq: int = None) -> str:
+        """Transcripción de los mensajes con secuencia en [from_seq, to_seq)"""
+        if to_seq is None:
+            to_seq = self.end_seq
+        first = max(from_seq - self.start_seq, 0)
+        last = min(to_seq - self.start_seq, len(self.messages))
+        if first >= last:
+            return ""
+        if first == 0 and last == len(self.messages):
+            return self.as_text()
+        return "\n".join(
+            line for line in itertools.islice(self._lines, first, last) if line is not None
+        )
+
+    def tail_start_seq(self, max_chars: int, floor_seq: int = 0) -> int:
+        """Menor secuencia >= floor_seq cuya cola de transcripción cabe en max_chars.
+
+        Siempre incluye al menos el último mensaje.
+        """
+        floor = max(floor_seq - self.start_seq, 0)
+        used = 0
+        index = len(self._lines)
+        for line in reversed(self._lines):
+            if index <= floor:
+                break
+            line_length = len(line) if line is not None else 0
+            if line_length and used + line_length > max_chars and index < len(self._lines):
+                break
+            used += line_length + 1 if line_length else 0
+            index -= 1
+        return self.start_seq + index
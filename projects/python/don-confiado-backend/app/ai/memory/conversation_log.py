@@ -0,0 +1,222 @@
+import asyncio
+import hashlib
+import json
+import os
+
+"""Registro persistente de conversaciones con escritura diferida (write-behind).
+
+Cada mensaje se agrega a un búfer en memoria (O(1), sin E/S en la
+petición) y una tarea en segundo plano lo escribe en lotes a un archivo
+JSONL de solo-agregado por usuario. Tras un reinicio, el historial de un
+usuario se carga de forma perezosa la primera vez que vuelve a escribir.
+Los archivos que crecen demasiado se compactan conservando solo los
+mensajes más recientes y el último estado de la sesión.
+
+Líneas del archivo:
+    {"seq": 12, "role": "human", "content": "..."}
+    {"state": {...}}   (ver ConversationHistory.state)
+"""
+
+
+class ConversationLog:
+    def __init__(
+        self,
+        directory: str,
+        flush_interval_seconds: float = 0.5,
+        batch_size: int = 500,
+        max_messages: int = 40,
+        max_file_bytes: int = 256 * 1024,
+        fsync: bool = False,
+    ):
+        self.directory = directory
+        self.flush_interval_seconds = flush_interval_seconds
+        self.batch_size = batch_size
+        self.max_messages = max_messages
+        self.max_file_bytes = max_file_bytes
+        self.fsync = fsync
+        os.makedirs(directory, exist_ok=True)
+        # Registros pendientes de escribir: (user_id, dict)
+        self._buffer = []
+        self._wakeup = None
+        self._task = None
+        self._closing = False
+        self.flushes = 0
+        self.written_records = 0
+        self.compactions = 0
+        self.flush_failures = 0
+
+    @classmethod
+    def from_env(cls) -> "ConversationLog":
+        return cls(
+            os.getenv("COFFETTO_HISTORY_LOG_DIR", "data/conversations"),
+            flush_interval_seconds=float(os.getenv("COFFETTO_HISTORY_LOG_FLUSH_SECONDS", "0.5")),
+            batch_size=int(os.getenv("COFFETTO_HISTORY_LOG_BATCH_SIZE", "500")),
+            max_messages=int(os.getenv("COFFETTO_MEMORY_MAX_MESSAGES_PER_USER", "40")),
+            max_file_bytes=int(os.getenv("COFFETTO_HISTORY_LOG_MAX_FILE_BYTES", str(256 * 1024))),
+            fsync=os.getenv("COFFETTO_HISTORY_LOG_FSYNC", "false").lower() in ("1", "true", "yes"),
+        )
+
+    # --- Camino de la petición: solo encola ---
+    def append(self, user_id: str, seq: int, role: str, content: str) -> None:
+        self._enqueue(user_id, {"seq": seq, "role": role, "content": content})
+
+    def save_state(self, user_id: str, state: dict) -> None:
+        self._enqueue(user_id, {"state": state})
+
+    async def load(self, user_id: str):
+        """(primera_secuencia, mensajes, estado) del usuario, o None si no tiene registro"""
+        # Lo que aún está en el búfer también cuenta (p. ej. si el usuario fue expulsado de memoria)
+        pending = [record for pending_user, record in self._buffer if pending_user == user_id]
+        return await asyncio.to_thread(self._read_user, user_id, pending)
+
+    async def flush(self) -> None:
+        """Escribe todo lo pendiente"""
+        while self._buffer:
+            batch, self._buffer = self._buffer, []
+            try:
+                await asyncio.to_thread(self._write_batch, batch)
+            except Exception as e:
+                # Se reintenta en el siguiente flush conservando el orden
+                self._buffer[:0] = batch
+                self.flush_failures += 1
+                print(f"Error al persistir el historial de conversaciones: {e}")
+                return
+
+    async def close(self) -> None:
+        if self._task is not None:
+            # Se deja terminar el flush en curso para no escribir dos lotes a la vez
+            self._closing = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+            self._closing = False
+        await self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "pending_records": len(self._buffer),
+            "flushes": self.flushes,
+            "written_records": self.written_records,
+            "compactions": self.compactions,
+            "flush_failures": self.flush_failures,
+        }
+
+    # --- Internos ---
+    def _enqueue(self, user_id: str, record: dict) -> None:
+        self._buffer.append((user_id, record))
+        if self._task is None:
+            self._start()
+        if len(self._buffer) >= self.batch_size and self._wakeup is not None:
+            self._wakeup.set()
+
+    def _start(self) -> None:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Sin event loop (scripts): se escribe al llamar flush()/close()
+            return
+        self._wakeup = asyncio.Event()
+        self._task = loop.create_task(self._flush_loop())
+
+    async def _flush_loop(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+            if self._closing:
+                return
+
+    def _path(self, user_id: str) -> str:
+        # Los user_id de WhatsApp llevan "@" y ".": el nombre del archivo es un hash
+        digest = hashlib.sha1(user_id.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, f"{digest}.jsonl")
+
+    def _write_batch(self, batch: list) -> None:
+        by_user = {}
+        for user_id, record in batch:
+            by_user.setdefault(user_id, []).append(json.dumps(record, ensure_ascii=False))
+        for user_id, lines in by_user.items():
+            path = self._path(user_id)
+            with open(path, "a", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+                if self.fsync:
+                    f.flush()
+                    os.fsync(f.fileno())
+                size = f.tell()
+            if size > self.max_file_bytes:
+                self._compact(user_id)
+        self.flushes += 1
+        self.written_records += len(batch)
+
+    def _read_user(self, user_id: str, pending: list = ()):
+        try:
+            with open(self._path(user_id), encoding="utf-8") as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            lines = []
+        records = []
+        for line in lines:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                # Última línea truncada por una caída a mitad de escritura
+                continue
+        messages = {}
+        state = {}
+        for record in records + list(pending):
+            if "state" in record:
+                state = record["state"]
+            else:
+                messages[record["seq"]] = {"role": record["role"], "content": record["content"]}
+        if not messages and not state:
+            return None
+        if not messages:
+            return 0, [], state
+        # Tramo contiguo más reciente, hasta max_messages
+        last_seq = max(messages)
+        first_seq = last_seq
+        while first_seq - 1 in messages and last_seq - first_seq + 1 < self.max_messages:
+            first_seq -= 1
+        return first_seq, [messages[seq] for seq in range(first_seq, last_seq + 1)], state
+
+    def _compact(self, user_id: str) -> None:
+        restored = self._read_user(user_id)
+        if restored is None:
+            return
+        first_seq, messages, state = restored
+        path = self._path(user_id)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            for offset, message in enumerate(messages):
+                f.write(json.dumps({"seq": first_seq + offset, **message}, ensure_ascii=False) + "\n")
+            if state:
+                f.write(json.dumps({"state": state}, ensure_ascii=False) + "\n")
+        os.replace(temp_path, path)
+        self.compactions += 1
+
+
+_conversation_log = None
+_initialized = False
+
+
+def init_conversation_log():
+    """Crea el registro según COFFETTO_HISTORY_LOG_ENABLED; None si está desactivado"""
+    global _conversation_log, _initialized
+    if not _initialized:
+        _initialized = True
+        if os.getenv("COFFETTO_HISTORY_LOG_ENABLED", "true").lower() in ("1", "true", "yes"):
+            _conversation_log = ConversationLog.from_env()
+    return _conversation_log
+
+
+def get_conversation_log():
+    return init_conversation_log()
+
+
+async def close_conversation_log() -> None:
+    """Escribe lo pendiente; pensado para el apagado de la aplicación"""
+    if _conversation_log is not None:
+        await _conversation_log.close()
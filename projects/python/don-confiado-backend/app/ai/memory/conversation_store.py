@@ -0,0 +1,182 @@
+import os
+import time
+from collections import OrderedDict
+
+from ai.memory.conversation_history import ConversationHistory
+
+"""Almacén de conversaciones en memoria con límites.
+
+Mantiene un ConversationHistory por usuario con un tope global de usuarios
+y de caracteres, expulsión LRU y por inactividad (TTL) de usuarios
+completos, y un tope de mensajes y de caracteres por usuario. Expone
+contadores para dimensionar contenedores.
+"""
+
+
+class _UserConversation:
+    __slots__ = ("history", "last_access")
+
+    def __init__(self, now: float):
+        self.history = ConversationHistory()
+        self.last_access = now
+
+
+class ConversationStore:
+    def __init__(
+        self,
+        max_users: int = 5000,
+        max_total_chars: int = 20_000_000,
+        idle_ttl_seconds: float = 6 * 3600,
+        max_messages_per_user: int = 40,
+        max_chars_per_user: int = 20_000,
+        clock=time.monotonic,
+    ):
+        self.max_users = max_users
+        self.max_total_chars = max_total_chars
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self.max_messages_per_user = max_messages_per_user
+        self.max_chars_per_user = max_chars_per_user
+        self._clock = clock
+        # Orden LRU: el primero es el usuario usado hace más tiempo
+        self._users = OrderedDict()
+        self._total_chars = 0
+        self._total_messages = 0
+        self.evictions = {"lru": 0, "idle_ttl": 0, "memory": 0}
+        self.trimmed_messages = 0
+
+    @classmethod
+    def from_env(cls) -> "ConversationStore":
+        return cls(
+            max_users=int(os.getenv("COFFETTO_MEMORY_MAX_USERS", "5000")),
+            max_total_chars=int(os.getenv("COFFETTO_MEMORY_MAX_TOTAL_CHARS", "20000000")),
+            idle_ttl_seconds=float(os.getenv("COFFETTO_MEMORY_IDLE_TTL_SECONDS", str(6 * 3600))),
+            max_messages_per_user=int(os.getenv("COFFETTO_MEMORY_MAX_MESSAGES_PER_USER", "40")),
+            max_chars_per_user=int(os.getenv("COFFETTO_MEMORY_MAX_CHARS_PER_USER", "20000")),
+        )
+
+    def __contains__(self, user_id: str) -> bool:
+        return user_id in self._users
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+    def get(self, user_id: str) -> ConversationHistory:
+        """Retorna (creando si no existe) el historial del usuario"""
+        return self._touch(user_id).history
+
+    def append(self, user_id: str, role: str, content: str) -> ConversationHistory:
+        history = self._touch(user_id).history
+        history.append(role, content)
+        self._total_chars += len(content)
+        self._total_messages += 1
+        self._trim_user(history)
+        self._enforce_memory_cap(keep=user_id)
+        return history
+
+    def merge(self, user_id: str, first_seq: int, messages: list, state: dict) -> ConversationHistory:
+        """Incorpora mensajes y estado cargados del almacén de sesiones compartido"""
+        history = self._touch(user_id).history
+        if first_seq > history.end_seq or first_seq + len(messages) < history.start_seq:
+            # Hay un hueco con lo que se tiene en memoria: se reemplaza el historial local
+            self.remove(user_id)
+            history = self._touch(user_id).history
+            history.start_seq = first_seq
+        for message in messages[max(history.end_seq - first_seq, 0):]:
+            self.append(user_id, message["role"], message["content"])
+        history.restore_state(state)
+        return history
+
+    def rebase(self, user_id: str, own_seq: int, first_seq: int, messages: list, state: dict) -> ConversationHistory:
+        """Reubica los mensajes locales desde `own_seq` después de los que guardó otro proceso.
+
+        `first_seq`, `messages` y `state` vienen de SessionStore.load(user_id, own_seq)
+        tras un guardado rechazado por versión. El registro pendiente y la página
+        pendiente quedan los de este proceso, cuyo turno pasa a ser el último.
+        """
+        history = self._touch(user_id).history
+        own_messages = history.messages_since(own_seq)
+        own_state = history.state()
+        dropped = min(len(own_messages), len(history))
+        self._total_chars -= history.drop_newest(dropped)
+        self._total_messages -= dropped
+        history = self.merge(user_id, first_seq, messages, state)
+        for message in own_messages:
+            self.append(user_id, message["role"], message["content"])
+        history.pending_intent = own_state["pending_intent"]
+        history.pending_page = tuple(own_state["pending_page"]) if own_state["pending_page"] else None
+        return history
+
+    def remove(self, user_id: str) -> None:
+        conversation = self._users.pop(user_id, None)
+        if conversation is not None:
+            self._forget(conversation)
+
+    def stats(self) -> dict:
+        return {
+            "users": len(self._users),
+            "messages": self._total_messages,
+            "chars": self._total_chars,
+            "max_users": self.max_users,
+            "max_total_chars": self.max_total_chars,
+            "max_messages_per_user": self.max_messages_per_user,
+            "max_chars_per_user": self.max_chars_per_user,
+            "idle_ttl_seconds": self.idle_ttl_seconds,
+            "evictions": dict(self.evictions),
+            "trimmed_messages": self.trimmed_messages,
+        }
+
+    # --- Internos ---
+    def _touch(self, user_id: str) -> _UserConversation:
+        now = self._clock()
+        self._expire_idle(now)
+        conversation = self._users.get(user_id)
+        if conversation is None:
+            while len(self._users) >= self.max_users > 0:
+                self._evict_oldest("lru")
+            conversation = _UserConversation(now)
+            self._users[user_id] = conversation
+        else:
+            self._users.move_to_end(user_id)
+            conversation.last_access = now
+        return conversation
+
+    def _expire_idle(self, now: float) -> None:
+        if self.idle_ttl_seconds <= 0:
+            return
+        while self._users:
+            oldest = next(iter(self._users.values()))
+            if now - oldest.last_access < self.idle_ttl_seconds:
+                break
+            self._evict_oldest("idle_ttl")
+
+    def _evict_oldest(self, reason: str) -> None:
+        _, conversation = self._users.popitem(last=False)
+        self._forget(conversation)
+        self.evictions[reason] += 1
+
+    def _forget(self, conversation: _UserConversation) -> None:
+        self._total_chars -= conversation.history.chars
+        self._total_messages -= len(conversation.history)
+
+    def _trim_user(self, history: ConversationHistory) -> None:
+        drop = 0
+        dropped_chars = 0
+        # Se conserva siempre el último mensaje aunque exceda el tope de caracteres
+        while len(history) - drop > 1 and (
+            len(history) - drop > self.max_messages_per_user
+            or history.chars - dropped_chars > self.max_chars_per_user
+        ):
+            dropped_chars += len(history[drop]["content"])
+            drop += 1
+        if drop:
+            history.drop_oldest(drop)
+            self._total_chars -= dropped_chars
+            self._total_messages -= drop
+            self.trimmed_messages += drop
+
+    def _enforce_memory_cap(self, keep: str) -> None:
+        while self._total_chars > self.max_total_chars and len(self._users) > 1:
+            oldest_id = next(iter(self._users))
+            if oldest_id == keep:
+                break
+            self._evict_oldest("memory")
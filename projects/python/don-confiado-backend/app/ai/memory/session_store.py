@@ -0,0 +1,287 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+
+"""Almacén de sesiones compartido entre procesos.
+
+El ConversationStore de cada proceso funciona como caché local; el almacén
+de sesiones guarda los mensajes de cada usuario con su número de secuencia
+absoluto y el estado de la sesión (registro pendiente, página pendiente,
+resumen). Antes de cada turno se cargan solo los mensajes con secuencia
+posterior a la que ya se tiene en memoria, y al terminar se guardan los
+nuevos. Así varios workers o réplicas comparten la conversación.
+
+Cada usuario tiene una versión que aumenta con cada guardado. `save` solo
+escribe si la versión sigue siendo la que se leyó en `load`; si otro proceso
+guardó un turno del mismo usuario entre medio, retorna False y el llamador
+vuelve a cargar, reubica sus mensajes después de los ajenos y reintenta
+(ver _save_session en chat_webservice). Sin ese reintento, dos turnos
+simultáneos del mismo usuario en procesos distintos se pisarían: quien no
+pueda reintentar necesita enrutamiento fijo (sticky) por usuario.
+
+Implementaciones (COFFETTO_SESSION_BACKEND):
+- memory: solo el proceso actual (comportamiento original).
+- sqlite: archivo SQLite en modo WAL, compartido por los workers de una máquina.
+- redis: cualquier servidor con protocolo Redis, compartido entre contenedores.
+"""
+
+
+class SessionStore:
+    """Interfaz del almacén de sesiones"""
+
+    async def load(self, user_id: str, after_seq: int):
+        """Mensajes con secuencia >= after_seq y estado de la sesión.
+
+        Retorna (primera_secuencia, mensajes, estado, versión) o None si no hay
+        nada guardado (versión 0). `mensajes` es una lista de {"role", "content"}
+        consecutivos.
+        """
+        raise NotImplementedError
+
+    async def save(self, user_id: str, first_seq: int, messages: list, state: dict, version: int) -> bool:
+        """Guarda `messages` a partir de la secuencia `first_seq` y el estado.
+
+        Solo escribe si la versión guardada sigue siendo `version`; retorna
+        False (sin escribir nada) si otro proceso guardó antes.
+        """
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        pass
+
+
+class InMemorySessionStore(SessionStore):
+    # La memoria del proceso ya es la única copia: no hay nada que sincronizar
+    async def load(self, user_id: str, after_seq: int):
+        return None
+
+    async def save(self, user_id: str, first_seq: int, messages: list, state: dict, version: int) -> bool:
+        return True
+
+
+class SQLiteSessionStore(SessionStore):
+    # Cada cuántos guardados se eliminan las sesiones inactivas
+    _PRUNE_EVERY = 500
+
+    def __init__(self, path: str, max_messages: int = 40, ttl_seconds: float = 6 * 3600):
+        self.path = path
+        self.max_messages = max_messages
+        self.ttl_seconds = ttl_seconds
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._saves = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS session_messages (
+                user_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL,
+                PRIMARY KEY (user_id, seq)
+            );
+            CREATE TABLE IF NOT EXISTS session_state (
+                user_id TEXT PRIMARY KEY,
+                state TEXT NOT NULL,
+                updated_at REAL NOT NULL,
+                version INTEGER NOT NULL DEFAULT 0
+            );
+            """
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(session_state)")}
+        if "version" not in columns:
+            # Archivos creados antes de los guardados condicionales
+            self._conn.execute("ALTER TABLE session_state ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+        self._conn.commit()
+
+    async def load(self, user_id: str, after_seq: int):
+        return await asyncio.to_thread(self._load, user_id, after_seq)
+
+    async def save(self, user_id: str, first_seq: int, messages: list, state: dict, version: int) -> bool:
+        return await asyncio.to_thread(self._save, user_id, first_seq, messages, state, version)
+
+    async def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def _load(self, user_id: str, after_seq: int):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT seq, role, content FROM session_messages WHERE user_id = ? AND seq >= ? ORDER BY seq",
+                (user_id, after_seq),
+            ).fetchall()
+            state_row = self._conn.execute(
+                "SELECT state, version FROM session_state WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        if not rows and state_row is None:
+            return None
+        first_seq = rows[0][0] if rows else after_seq
+        messages = [{"role": role, "content": content} for _, role, content in rows]
+        if state_row is None:
+            return first_seq, messages, {}, 0
+        return first_seq, messages, json.loads(state_row[0]), state_row[1]
+
+    def _save(self, user_id: str, first_seq: int, messages: list, state: dict, version: int) -> bool:
+        end_seq = first_seq + len(messages)
+        now = time.time()
+        state_json = json.dumps(state, ensure_ascii=False)
+        with self._lock, self._conn:
+            # Bloqueo de escritura desde el inicio: la versión leída no cambia hasta el commit
+            self._conn.execute("BEGIN IMMEDIATE")
+            if version == 0:
+                updated = self._conn.execute(
+                    "INSERT INTO session_state (user_id, state, updated_at, version) VALUES (?, ?, ?, 1) "
+                    "ON CONFLICT (user_id) DO NOTHING",
+                    (user_id, state_json, now),
+                ).rowcount
+            else:
+                updated = self._conn.execute(
+                    "UPDATE session_state SET state = ?, updated_at = ?, version = version + 1 "
+                    "WHERE user_id = ? AND version = ?",
+                    (state_json, now, user_id, version),
+                ).rowcount
+            if not updated:
+                # Otro proceso guardó primero; la transacción se cierra sin cambios
+                return False
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO session_messages (user_id, seq, role, content) VALUES (?, ?, ?, ?)",
+                [(user_id, first_seq + i, m["role"], m["content"]) for i, m in enumerate(messages)],
+            )
+            self._conn.execute(
+                "DELETE FROM session_messages WHERE user_id = ? AND seq < ?",
+                (user_id, end_seq - self.max_messages),
+            )
+            self._saves += 1
+            if self.ttl_seconds > 0 and self._saves % self._PRUNE_EVERY == 0:
+                self._prune(now - self.ttl_seconds)
+        return True
+
+    def _prune(self, cutoff: float) -> None:
+        self._conn.execute(
+            "DELETE FROM session_messages WHERE user_id IN "
+            "(SELECT user_id FROM session_state WHERE updated_at < ?)",
+            (cutoff,),
+        )
+        self._conn.execute("DELETE FROM session_state WHERE updated_at < ?", (cutoff,))
+
+
+class RedisSessionStore(SessionStore):
+    def __init__(self, url: str, max_messages: int = 40, ttl_seconds: float = 6 * 3600, prefix: str = "coffetto:session"):
+        # Dependencia opcional (solo para COFFETTO_SESSION_BACKEND=redis); se importa al usarla
+        try:
+            import redis.asyncio as redis_asyncio
+            from redis.exceptions import WatchError
+        except ImportError:
+            raise RuntimeError("COFFETTO_SESSION_BACKEND=redis requiere el paquete 'redis' (pip install redis)") from None
+        self.max_messages = max_messages
+        self.ttl_seconds = int(ttl_seconds)
+        self.prefix = prefix
+        self._watch_error = WatchError
+        self._client = redis_asyncio.from_url(url, decode_responses=True)
+
+    def _keys(self, user_id: str) -> tuple:
+        # Mensajes en un sorted set con la secuencia como score; estado en un string JSON; versión entera
+        user_prefix = f"{self.prefix}:{user_id}"
+        return f"{user_prefix}:messages", f"{user_prefix}:state", f"{user_prefix}:version"
+
+    async def load(self, user_id: str, after_seq: int):
+        messages_key, state_key, version_key = self._keys(user_id)
+        async with self._client.pipeline(transaction=False) as pipe:
+            pipe.zrangebyscore(messages_key, after_seq, "+inf", withscores=True)
+            pipe.get(state_key)
+            pipe.get(version_key)
+            rows, raw_state, raw_version = await pipe.execute()
+        if not rows and raw_state is None:
+            return None
+        first_seq = int(rows[0][1]) if rows else after_seq
+        messages = []
+        for member, _ in rows:
+            message = json.loads(member)
+            messages.append({"role": message["role"], "content": message["content"]})
+        return first_seq, messages, json.loads(raw_state) if raw_state else {}, int(raw_version or 0)
+
+    async def save(self, user_id: str, first_seq: int, messages: list, state: dict, version: int) -> bool:
+        messages_key, state_key, version_key = self._keys(user_id)
+        end_seq = first_seq + len(messages)
+        async with self._client.pipeline(transaction=True) as pipe:
+            # WATCH/MULTI: EXEC falla si otro proceso cambia la versión después de leerla
+            await pipe.watch(version_key)
+            if int(await pipe.get(version_key) or 0) != version:
+                return False
+            pipe.multi()
+            if messages:
+                # La secuencia va en el miembro para que mensajes iguales no se colapsen
+                pipe.zremrangebyscore(messages_key, first_seq, "+inf")
+                pipe.zadd(messages_key, {
+                    json.dumps({"seq": first_seq + i, **m}, ensure_ascii=False): first_seq + i
+                    for i, m in enumerate(messages)
+                })
+                pipe.zremrangebyscore(messages_key, "-inf", f"({end_seq - self.max_messages}")
+            pipe.set(state_key, json.dumps(state, ensure_ascii=False))
+            pipe.incr(version_key)
+            if self.ttl_seconds > 0:
+                pipe.expire(messages_key, self.ttl_seconds)
+                pipe.expire(state_key, self.ttl_seconds)
+                pipe.expire(version_key, self.ttl_seconds)
+            try:
+                await pipe.execute()
+            except self._watch_error:
+                return False
+        return True
+
+    async def close(self) -> None:
+        await self._client.aclose()
+
+
+_session_store = None
+
+
+def build_session_store() -> SessionStore:
+    backend = os.getenv("COFFETTO_SESSION_BACKEND", "memory").strip().lower()
+    max_messages = int(os.getenv("COFFETTO_MEMORY_MAX_MESSAGES_PER_USER", "40"))
+    ttl_seconds = float(os.getenv("COFFETTO_MEMORY_IDLE_TTL_SECONDS", str(6 * 3600)))
+    if backend == "sqlite":
+        return SQLiteSessionStore(
+            os.getenv("COFFETTO_SESSION_SQLITE_PATH", "data/sessions.db"),
+            max_messages=max_messages,
+            ttl_seconds=ttl_seconds,
+        )
+    if backend == "redis":
+        return RedisSessionStore(
+            os.getenv("COFFETTO_SESSION_REDIS_URL", "redis://localhost:6379/0"),
+            max_messages=max_messages,
+            ttl_seconds=ttl_seconds,
+        )
+    if backend != "memory":
+        raise ValueError(f"COFFETTO_SESSION_BACKEND inválido: {backend}")
+    return InMemorySessionStore()
+
+
+def init_session_store() -> SessionStore:
+    global _session_store
+    if _session_store is None:
+        _session_store = build_session_store()
+    return _session_store
+
+
+def set_session_store(store: SessionStore) -> None:
+    global _session_store
+    _session_store = store
+
+
+def get_session_store() -> SessionStore:
+    return init_session_store()
+
+
+async def close_session_store() -> None:
+    global _session_store
+    if _session_store is not None:
+        await _session_store.close()
+        _session_store = None
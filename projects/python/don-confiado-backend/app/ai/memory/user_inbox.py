@@ -0,0 +1,103 @@
+import asyncio
+import contextvars
+import os
+
+"""Bandeja de entrada por usuario: agrupa ráfagas y procesa en orden.
+
+Los usuarios de WhatsApp suelen enviar varios mensajes cortos seguidos y el
+gateway publica cada uno por separado. En lugar de ejecutar un turno por
+mensaje en paralelo (y mezclar el historial), los turnos de un mismo usuario
+se procesan estrictamente en orden. Un mensaje de un usuario sin turno en
+curso se procesa de inmediato, sin esperar; los que llegan mientras su turno
+corre se retienen y, al terminar, se unen en un solo turno (hasta
+max_messages). La petición del último mensaje unido recibe la respuesta; las
+demás reciben una respuesta vacía con status "coalesced".
+"""
+
+
+class _PendingMessage:
+    __slots__ = ("message", "process", "context", "future")
+
+    def __init__(self, message: str, process, context, future):
+        self.message = message
+        # process(mensaje_unido) -> awaitable[dict]
+        self.process = process
+        # Contexto de la petición (p. ej. el stream activo del endpoint de streaming)
+        self.context = context
+        self.future = future
+
+
+class UserInbox:
+    def __init__(self, max_messages: int = 5):
+        # Mensajes retenidos que se unen como máximo en un turno
+        self.max_messages = max_messages
+        # user_id -> lista de _PendingMessage; existe mientras el usuario tiene turnos en curso
+        self._pending = {}
+        self._tasks = set()
+        self.turns = 0
+        self.messages = 0
+        self.coalesced = 0
+
+    @classmethod
+    def from_env(cls) -> "UserInbox":
+        return cls(max_messages=int(os.getenv("COFFETTO_INBOX_MAX_MESSAGES", "5")))
+
+    async def submit(self, user_id: str, message: str, process) -> dict:
+        """Encola el mensaje y espera la respuesta del turno en que se procese"""
+        loop = asyncio.get_running_loop()
+        pending = _PendingMessage(message, process, contextvars.copy_context(), loop.create_future())
+        self.messages += 1
+
+        queue = self._pending.get(user_id)
+        if queue is None:
+            # Sin turno en curso: se procesa ya, en la tarea que atiende en orden a este usuario
+            queue = self._pending[user_id] = [pending]
+            task = loop.create_task(self._drain(user_id, queue))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        else:
+            # Hay un turno en curso: el mensaje espera a que termine y se une con los demás retenidos
+            queue.append(pending)
+
+        # shield: si el cliente se desconecta, el turno igual se completa
+        return await asyncio.shield(pending.future)
+
+    def stats(self) -> dict:
+        return {
+            "active_users": len(self._pending),
+            "messages": self.messages,
+            "turns": self.turns,
+            "coalesced_messages": self.coalesced,
+        }
+
+    # --- Internos ---
+    async def _drain(self, user_id: str, queue: list) -> None:
+        try:
+            while queue:
+                batch = queue[:self.max_messages]
+                del queue[:len(batch)]
+                await self._process_turn(batch)
+        finally:
+            del self._pending[user_id]
+
+    async def _process_turn(self, batch: list) -> None:
+        self.turns += 1
+        self.coalesced += len(batch) - 1
+        lead = batch[-1]
+        message = "\n".join(item.message for item in batch)
+        try:
+            # Se ejecuta en el contexto de la petición que recibirá la respuesta
+            result = await asyncio.get_running_loop().create_task(lead.process(message), context=lead.context)
+        except Exception as e:
+            for item in batch:
+                if not item.future.done():
+                    item.future.set_exception(e)
+                    # Evita el aviso de excepción no recuperada si el cliente ya no espera
+                    item.future.exception()
+            return
+
+        for item in batch[:-1]:
+            if not item.future.done():
+                item.future.set_result({"status": "coalesced", "reply": ""})
+        if not lead.future.done():
+            lead.future.set_result(result)
@@ -0,0 +1,253 @@
+import asyncio
+import os
+import time
+
+from ai.memory.context_window import estimate_tokens
+from ai.reply_stream import generate_reply, streamed_parts
+from ai.system_prompts import GENERAL_CHAT_PROMPT, MEMORY_CHAT_PROMPT
+
+"""Registro de prompts de sistema compilados y cacheados en el proveedor.
+
+Cada prompt estático se compila una sola vez al arrancar: se guarda su
+mensaje de sistema ya construido y sus tokens estimados. En cada llamada
+solo se arma la parte dinámica (historial y mensaje del usuario) y el
+prompt se envía según COFFETTO_PROMPT_CACHE:
+
+- prefix: como mensaje de sistema separado e idéntico en todas las
+  llamadas, lo que permite la caché implícita de prefijos del proveedor.
+- gemini: como contenido cacheado de Gemini (`cached_content`), creado al
+  arrancar y renovado antes de expirar. Los prompts con menos tokens que
+  COFFETTO_PROMPT_CACHE_MIN_TOKENS (mínimo que exige la API) se envían como
+  prefijo; el arranque lo avisa una vez por prompt.
+
+Los benchmarks prueban el ciclo de vida de la caché sin red con un
+proveedor en memoria (benchmarks/fake_llm.py, LocalContextCache) que se
+pasa a PromptRegistry directamente; no es un modo de COFFETTO_PROMPT_CACHE
+porque el modelo real rechazaría sus identificadores.
+
+Si una llamada con contenido cacheado falla (p. ej. la caché expiró en el
+proveedor), se invalida y se reintenta una vez con el prefijo.
+
+Los mensajes de langchain_core se importan al compilar los prompts (en el
+calentamiento del arranque) y no al importar el módulo.
+"""
+
+SYSTEM_PROMPTS = {
+    "memory_chat": MEMORY_CHAT_PROMPT,
+    "general_chat": GENERAL_CHAT_PROMPT,
+}
+
+PROMPT_CACHE_MODES = ("prefix", "gemini")
+
+
+def _messages():
+    import langchain_core.messages
+
+    return langchain_core.messages
+
+
+class CompiledPrompt:
+    __slots__ = ("name", "text", "token_count", "message", "cache_handle", "cache_expires_at")
+
+    def __init__(self, name: str, text: str):
+        self.name = name
+        self.text = text.strip()
+        self.token_count = estimate_tokens(self.text)
+        self.message = _messages().SystemMessage(content=self.text)
+        self.cache_handle = None
+        self.cache_expires_at = 0.0
+
+
+class ContextCacheProvider:
+    """Interfaz de la caché de contexto del proveedor del modelo"""
+
+    # Tokens mínimos que el proveedor acepta en un contenido cacheado
+    min_tokens = 0
+
+    async def create(self, prompt: CompiledPrompt, ttl_seconds: float) -> str:
+        """Crea el contenido cacheado del prompt y retorna su identificador"""
+        raise NotImplementedError
+
+
+class GeminiContextCache(ContextCacheProvider):
+    def __init__(self, llm, min_tokens: int = 1024):
+        self.llm = llm
+        self.min_tokens = min_tokens
+
+    async def create(self, prompt: CompiledPrompt, ttl_seconds: float) -> str:
+        from langchain_google_genai import create_context_cache
+
+        # Cliente síncrono de google-genai: fuera del event loop
+        return await asyncio.to_thread(create_context_cache, self.llm, [prompt.message], ttl=f"{int(ttl_seconds)}s")
+
+
+class PromptRegistry:
+    def __init__(
+        self,
+        prompts: dict = None,
+        provider: ContextCacheProvider = None,
+        ttl_seconds: float = 3600,
+        refresh_margin_seconds: float = 60,
+        retry_after_seconds: float = 300,
+        clock=time.monotonic,
+    ):
+        self._prompts = {name: CompiledPrompt(name, text) for name, text in (prompts or SYSTEM_PROMPTS).items()}
+        self.provider = provider
+        self.ttl_seconds = ttl_seconds
+        # Se renueva la caché cuando le queda menos que este margen
+        self.refresh_margin_seconds = refresh_margin_seconds
+        # Tras un fallo al crear la caché se usa el prefijo durante este tiempo
+        self.retry_after_seconds = retry_after_seconds
+        self._clock = clock
+        # nombre -> tarea que está creando la caché (una sola por prompt)
+        self._creating = {}
+        self._retry_at = {}
+        self.cached_calls = 0
+        self.prefix_calls = 0
+        self.cache_creations = 0
+        self.cache_failures = 0
+        self.invalidations = 0
+
+    def get(self, name: str) -> CompiledPrompt:
+        try:
+            return self._prompts[name]
+        except KeyError:
+            raise KeyError(f"Prompt de sistema no registrado: {name}") from None
+
+    def cacheable(self, prompt: CompiledPrompt) -> bool:
+        return self.provider is not None and prompt.token_count >= self.provider.min_tokens
+
+    async def warm(self) -> None:
+        """Crea por adelantado las cachés de los prompts que la admiten"""
+        if self.provider is not None:
+            for prompt in self._prompts.values():
+                if not self.cacheable(prompt):
+                    print(
+                        f"Caché de contexto omitida para el prompt {prompt.name}: ~{prompt.token_count} tokens, "
+                        f"menos que el mínimo de {self.provider.min_tokens}; se envía como prefijo"
+                    )
+        await asyncio.gather(*(self._cache_handle(prompt) for prompt in self._prompts.values() if self.cacheable(prompt)))
+
+    async def request(self, name: str, user_text: str) -> tuple:
+        """(mensajes, kwargs de la llamada) para el prompt `name` seguido de `user_text`"""
+        prompt = self.get(name)
+        handle = await self._cache_handle(prompt) if self.cacheable(prompt) else None
+        if handle is None:
+            return self.prefix_request(name, user_text)
+        self.cached_calls += 1
+        return [_messages().HumanMessage(content=user_text)], {"cached_content": handle}
+
+    def prefix_request(self, name: str, user_text: str) -> tuple:
+        self.prefix_calls += 1
+        return [self.get(name).message, _messages().HumanMessage(content=user_text)], {}
+
+    def invalidate(self, name: str) -> None:
+        prompt = self.get(name)
+        prompt.cache_handle = None
+        prompt.cache_expires_at = 0.0
+        self.invalidations += 1
+
+    def stats(self) -> dict:
+        now = self._clock()
+        return {
+            "provider": type(self.provider).__name__ if self.provider is not None else None,
+            "prompts": {
+                name: {
+                    "tokens": prompt.token_count,
+                    "cacheable": self.cacheable(prompt),
+                    "cached": prompt.cache_handle is not None and prompt.cache_expires_at > now,
+                }
+                for name, prompt in self._prompts.items()
+            },
+            "cached_calls": self.cached_calls,
+            "prefix_calls": self.prefix_calls,
+            "cache_creations": self.cache_creations,
+            "cache_failures": self.cache_failures,
+            "invalidations": self.invalidations,
+        }
+
+    # --- Internos ---
+    async def _cache_handle(self, prompt: CompiledPrompt):
+        now = self._clock()
+        if prompt.cache_handle is not None and now < prompt.cache_expires_at - self.refresh_margin_seconds:
+            return prompt.cache_handle
+        if now < self._retry_at.get(prompt.name, 0.0):
+            # Mientras tanto sirve la caché anterior si aún no expiró
+            return prompt.cache_handle if now < prompt.cache_expires_at else None
+        task = self._creating.get(prompt.name)
+        if task is None:
+            task = self._creating[prompt.name] = asyncio.get_running_loop().create_task(self._create(prompt))
+            task.add_done_callback(lambda _: self._creating.pop(prompt.name, None))
+        # shield: si la petición que espera se cancela, la creación continúa para las demás
+        return await asyncio.shield(task)
+
+    async def _create(self, prompt: CompiledPrompt):
+        started = self._clock()
+        try:
+            handle = await self.provider.create(prompt, self.ttl_seconds)
+        except Exception as e:
+            self.cache_failures += 1
+            self._retry_at[prompt.name] = self._clock() + self.retry_after_seconds
+            print(f"No se pudo crear la caché del prompt {prompt.name}: {e}")
+            return prompt.cache_handle if self._clock() < prompt.cache_expires_at else None
+        self.cache_creations += 1
+        prompt.cache_handle = handle
+        prompt.cache_expires_at = started + self.ttl_seconds
+        return handle
+
+
+async def reply_with_system_prompt(llm, name: str, user_text: str) -> str:
+    """Respuesta del modelo al prompt de sistema `name` seguido de `user_text`"""
+    registry = get_prompt_registry()
+    messages, kwargs = await registry.request(name, user_text)
+    if not kwargs:
+        return await generate_reply(llm, messages)
+    parts_before = streamed_parts()
+    try:
+        return await generate_reply(llm, messages, **kwargs)
+    except Exception as e:
+        # Caché borrada o expirada en el proveedor: se invalida y se responde con el prefijo
+        print(f"Fallo con el contenido cacheado del prompt {name}, se reintenta sin caché: {e}")
+        registry.invalidate(name)
+        messages, _ = registry.prefix_request(name, user_text)
+        # Si el primer intento ya transmitió tokens, el reintento no se transmite encima:
+        # la respuesta completa llega en el evento "done"
+        return await generate_reply(llm, messages, stream_tokens=streamed_parts() == parts_before)
+
+
+_prompt_registry = None
+
+
+def build_prompt_registry(llm=None) -> PromptRegistry:
+    mode = os.getenv("COFFETTO_PROMPT_CACHE", "prefix").strip().lower()
+    if mode not in PROMPT_CACHE_MODES:
+        raise ValueError(f"COFFETTO_PROMPT_CACHE inválido: {mode}")
+    min_tokens = int(os.getenv("COFFETTO_PROMPT_CACHE_MIN_TOKENS", "1024"))
+    provider = None
+    if mode == "gemini":
+        if llm is None:
+            from ai.llm_registry import get_llm_registry
+
+            llm = get_llm_registry().llm
+        provider = GeminiContextCache(llm, min_tokens=min_tokens)
+    return PromptRegistry(
+        provider=provider,
+        ttl_seconds=float(os.getenv("COFFETTO_PROMPT_CACHE_TTL_SECONDS", "3600")),
+    )
+
+
+def init_prompt_registry() -> PromptRegistry:
+    """Compila los prompts de sistema; pensado para el evento de arranque"""
+    global _prompt_registry
+    if _prompt_registry is None:
+        _prompt_registry = build_prompt_registry()
+    return _prompt_registry
+
+
+def set_prompt_registry(registry: PromptRegistry) -> None:
+    global _prompt_registry
+    _prompt_registry = registry
+
+
+def get_prompt_registry() -> PromptRegistry:
+    return init_prompt_registry()
@@ -0,0 +1,377 @@
+import array
+import asyncio
+import heapq
+import math
+import os
+import re
+import sys
+from collections import Counter
+from functools import lru_cache
+from time import perf_counter
+
+from ai.intent.fast_classifier import normalize
+from business.repositories.coffee_repository import COFFEES_TABLE
+
+"""Índice de similitud TF-IDF sobre los cafés de todos los usuarios.
+
+Recommend_coffee ya no pone la colección completa del usuario en el prompt:
+el índice puntúa todas las filas de `cafes` contra una consulta armada con
+los cafés más recientes del usuario y su mensaje, y al prompt solo van esos
+cafés recientes y los `top_k` más parecidos registrados por otros usuarios.
+
+Cada café se indexa con las palabras de `variedad`, `proceso`, `tueste` y
+`perfil_sabor` (normalizadas, sin palabras vacías y sin plural), con peso
+de frecuencia sublineal normalizado por documento. El IDF se calcula al
+consultar, así que agregar una fila no obliga a recalcular las demás. Las
+listas invertidas son arreglos compactos (array) que NumPy lee sin copiar:
+una consulta suma las listas de sus términos en un vector de puntajes y
+toma los mejores con argpartition.
+
+El índice se carga en el calentamiento (ver warmup.py) recorriendo `cafes`
+por páginas de COFFETTO_RECOMMEND_INDEX_PAGE_SIZE filas y se actualiza con
+cada inserción del repositorio de este proceso. Cada
+COFFETTO_RECOMMEND_INDEX_SYNC_SECONDS (0 lo desactiva) lee las filas nuevas
+insertadas por otros workers. Mientras no termina la primera carga, o con
+COFFETTO_RECOMMEND_INDEX_ENABLED=false, la recomendación usa la colección
+completa del usuario como antes.
+"""
+
+INDEX_FIELDS = ("variedad", "proceso", "tueste", "perfil_sabor")
+ROW_COLUMNS = ",".join(("id", "user_id", "nombre_cafe") + INDEX_FIELDS)
+
+# Peso del mensaje frente al de los cafés del usuario en la consulta
+MESSAGE_WEIGHT = 1.5
+
+# Candidatos que se revisan por cada uno que se devuelve (se descartan nombres repetidos)
+_CANDIDATE_FACTOR = 8
+
+_STOPWORDS = frozenset(
+    "a al algo alguno alguna con como de del el en es esta este la las lo los me mi mis muy "
+    "mas o para por que se sin su sus un una uno unos unas y ya tiene tienen cafe cafes taza "
+    "nota notas sabor sabores perfil tipo quiero gusta gustan gustaria busco recomienda recomiendame "
+    "recomendar recomendacion recomendaciones parecido parecidos similar similares otro otros".split()
+)
+
+
+def _numpy():
+    import numpy
+
+    return numpy
+
+
+def _stem(token: str) -> str:
+    """Quita el plural: frutales -> frutal, flores -> flor, dulces -> dulce"""
+    if len(token) > 4 and token.endswith("es") and token[-3] in "lrn":
+        return token[:-2]
+    if len(token) > 4 and token.endswith("s"):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str) -> list:
+    return [
+        _stem(token) for token in normalize(text).replace(":", " ").split()
+        if len(token) > 1 and token not in _STOPWORDS
+    ]
+
+
+# Separadores de las notas de un perfil ("chocolate, panela; miel")
+_SEGMENTS = re.compile(r"[,;/\n]+")
+
+
+@lru_cache(maxsize=16384)
+def _segment_tokens(segment: str) -> tuple:
+    return tuple(tokenize(segment))
+
+
+def _row_tokens(row: dict) -> list:
+    """Tokens de los campos indexados; variedades, procesos, tuestes y notas
+    se repiten entre filas, así que se tokeniza cada segmento una sola vez"""
+    return [
+        token
+        for field in INDEX_FIELDS
+        for segment in _SEGMENTS.split(str(row.get(field) or ""))
+        for token in _segment_tokens(segment.strip())
+    ]
+
+
+def _sublinear(counts: Counter) -> dict:
+    """Pesos 1 + log(tf) normalizados a norma 1"""
+    weights = {term: 1.0 + math.log(count) for term, count in counts.items()}
+    norm = math.sqrt(sum(weight * weight for weight in weights.values())) or 1.0
+    return {term: weight / norm for term, weight in weights.items()}
+
+
+def _text_or_none(value) -> str:
+    return sys.intern(str(value)) if value not in (None, "") else None
+
+
+class CoffeeSimilarityIndex:
+    def __init__(self, top_k: int = 5, profile_size: int = 5, page_size: int = 1000, sync_seconds: float = 60.0):
+        self.top_k = top_k
+        # Cafés más recientes del usuario que forman la consulta y van al prompt
+        self.profile_size = profile_size
+        self.page_size = page_size
+        self.sync_seconds = sync_seconds
+        # True tras la primera carga completa de la tabla
+        self.ready = False
+        # Mayor id leído de la tabla (las inserciones locales no lo mueven)
+        self.synced_id = 0
+        self.queries = 0
+        self.query_seconds = 0.0
+        self._vocabulary = {}
+        # término -> documentos que lo contienen, sus pesos y cuántos son
+        self._postings_docs = []
+        self._postings_weights = []
+        self._df = []
+        # documento -> (id, user_id, nombre_cafe, variedad, proceso, tueste, perfil_sabor)
+        self._rows = []
+        self._doc_by_id = {}
+        self._docs_by_user = {}
+        self._sync_task = None
+
+    @classmethod
+    def from_env(cls) -> "CoffeeSimilarityIndex":
+        return cls(
+            top_k=int(os.getenv("COFFETTO_RECOMMEND_TOP_K", "5")),
+            profile_size=int(os.getenv("COFFETTO_RECOMMEND_PROFILE_SIZE", "5")),
+            page_size=int(os.getenv("COFFETTO_RECOMMEND_INDEX_PAGE_SIZE", "1000")),
+            sync_seconds=float(os.getenv("COFFETTO_RECOMMEND_INDEX_SYNC_SECONDS", "60")),
+        )
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def add_rows(self, rows: list) -> int:
+        """Indexa las filas que aún no estén (por id); retorna cuántas agregó"""
+        added = 0
+        for row in rows:
+            row_id = row.get("id")
+            if row_id is None or row_id in self._doc_by_id:
+                continue
+            doc = len(self._rows)
+            for term, weight in _sublinear(Counter(_row_tokens(row))).items():
+                term_id = self._vocabulary.get(term)
+                if term_id is None:
+                    term_id = self._vocabulary[term] = len(self._df)
+                    self._postings_docs.append(array.array("i"))
+                    self._postings_weights.append(array.array("f"))
+                    self._df.append(0)
+                self._postings_docs[term_id].append(doc)
+                self._postings_weights[term_id].append(weight)
+                self._df[term_id] += 1
+            user_id = _text_or_none(row.get("user_id"))
+            self._rows.append((
+                row_id,
+                user_id,
+                row.get("nombre_cafe"),
+                *(_text_or_none(row.get(field)) for field in INDEX_FIELDS),
+            ))
+            self._doc_by_id[row_id] = doc
+            self._docs_by_user.setdefault(user_id, []).append(doc)
+            added += 1
+        return added
+
+    def on_insert(self, table: str, rows: list) -> None:
+        """Listener del repositorio: indexa los cafés recién insertados"""
+        if table == COFFEES_TABLE:
+            self.add_rows(rows)
+
+    def search(self, user_id: str, message: str, k: int = None) -> dict:
+        """Retorna {"profile", "total_own", "candidates"}.
+
+        profile: los cafés más recientes del usuario; candidates: hasta `k`
+        cafés de otros usuarios (sin nombres repetidos ni que el usuario ya
+        tenga), del más parecido al menos parecido, con su "score".
+        """
+        started = perf_counter()
+        k = k or self.top_k
+        own_docs = self._docs_by_user.get(user_id, [])
+        profile_docs = heapq.nlargest(self.profile_size, own_docs, key=lambda doc: self._rows[doc][0])
+        query = self._query(profile_docs, message)
+        candidates = self._top_candidates(query, own_docs, k) if query else []
+        self.queries += 1
+        self.query_seconds += perf_counter() - started
+        return {
+            "profile": [self._row_dict(doc) for doc in profile_docs],
+            "total_own": len(own_docs),
+            "candidates": candidates,
+        }
+
+    async def sync(self, repository) -> int:
+        """Indexa las filas con id mayor a `synced_id`, página por página"""
+        # La primera consulta no debe pagar la importación de NumPy
+        _numpy()
+        added = 0
+        while True:
+            rows = await repository.list_all_coffees_after(self.synced_id, self.page_size, columns=ROW_COLUMNS)
+            if not rows:
+                break
+            added += self.add_rows(rows)
+            self.synced_id = max(self.synced_id, max(row["id"] for row in rows))
+            if len(rows) < self.page_size:
+                break
+        self.ready = True
+        return added
+
+    def start_sync(self, repository) -> None:
+        """Lanza la lectura periódica de las filas insertadas por otros workers"""
+        if self.sync_seconds > 0 and self._sync_task is None:
+            self._sync_task = asyncio.get_running_loop().create_task(self._sync_loop(repository))
+
+    async def close(self) -> None:
+        task, self._sync_task = self._sync_task, None
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    def stats(self) -> dict:
+        postings = sum(self._df)
+        return {
+            "ready": self.ready,
+            "coffees": len(self._rows),
+            "users": len(self._docs_by_user),
+            "terms": len(self._vocabulary),
+            "postings": postings,
+            # Listas invertidas: 4 bytes del documento y 4 del peso
+            "postings_bytes": postings * 8,
+            "synced_id": self.synced_id,
+            "queries": self.queries,
+            "avg_query_ms": round(self.query_seconds / self.queries * 1000, 3) if self.queries else 0.0,
+        }
+
+    # --- Internos ---
+    def _idf(self, term_id: int) -> float:
+        return math.log((1 + len(self._rows)) / (1 + self._df[term_id])) + 1.0
+
+    def _weighted(self, tokens: list) -> dict:
+        """término -> peso TF-IDF normalizado, solo con términos del vocabulario"""
+        counts = Counter(
+            term_id for term_id in (self._vocabulary.get(token) for token in tokens) if term_id is not None
+        )
+        weights = {term_id: weight * self._idf(term_id) for term_id, weight in _sublinear(counts).items()}
+        norm = math.sqrt(sum(weight * weight for weight in weights.values())) or 1.0
+        return {term_id: weight / norm for term_id, weight in weights.items()}
+
+    def _query(self, profile_docs: list, message: str) -> dict:
+        profile_tokens = [
+            token for doc in profile_docs for token in _row_tokens(dict(zip(INDEX_FIELDS, self._rows[doc][3:])))
+        ]
+        query = self._weighted(profile_tokens)
+        for term_id, weight in self._weighted(tokenize(message or "")).items():
+            query[term_id] = query.get(term_id, 0.0) + MESSAGE_WEIGHT * weight
+        return query
+
+    def _top_candidates(self, query: dict, own_docs: list, k: int) -> list:
+        np = _numpy()
+        scores = np.zeros(len(self._rows), dtype=np.float32)
+        for term_id, weight in query.items():
+            # Vistas sin copia de las listas; sin nombre local para no retener el búfer
+            # (un array con vistas vivas no puede crecer)
+            scores[np.frombuffer(self._postings_docs[term_id], dtype=np.int32)] += (
+                weight * self._idf(term_id) * np.frombuffer(self._postings_weights[term_id], dtype=np.float32)
+            )
+        if own_docs:
+            scores[np.asarray(own_docs, dtype=np.int64)] = 0.0
+        wanted = min(len(scores), k * _CANDIDATE_FACTOR)
+        if wanted == 0:
+            return []
+        best = np.argpartition(scores, len(scores) - wanted)[-wanted:]
+        best = best[np.argsort(-scores[best], kind="stable")]
+
+        seen = {normalize(str(self._rows[doc][2] or "")) for doc in own_docs}
+        candidates = []
+        for doc, score in zip(best.tolist(), scores[best].tolist()):
+            if score <= 0.0:
+                break
+            name = normalize(str(self._rows[doc][2] or ""))
+            if name in seen:
+                continue
+            seen.add(name)
+            candidates.append({**self._row_dict(doc), "score": round(score, 4)})
+            if len(candidates) == k:
+                break
+        return candidates
+
+    def _row_dict(self, doc: int) -> dict:
+        row_id, user_id, nombre, *fields = self._rows[doc]
+        return {"id": row_id, "user_id": user_id, "nombre_cafe": nombre, **dict(zip(INDEX_FIELDS, fields))}
+
+    async def _sync_loop(self, repository) -> None:
+        while True:
+            await asyncio.sleep(self.sync_seconds)
+            try:
+                await self.sync(repository)
+            except Exception as e:
+                print(f"Error al sincronizar el índice de cafés: {e}")
+
+
+def _describe(coffee: dict) -> str:
+    details = ", ".join(
+        value for value in (
+            coffee.get("variedad"),
+            coffee.get("proceso"),
+            f"tueste {coffee['tueste']}" if coffee.get("tueste") else None,
+        ) if value
+    )
+    name = coffee.get("nombre_cafe") or "Sin nombre"
+    return f"{name} ({details})" if details else name
+
+
+def render_recommendation_context(result: dict) -> str:
+    """Texto del prompt de recomendación a partir de `CoffeeSimilarityIndex.search`"""
+    profile = result["profile"]
+    if profile:
+        shown = f" ({len(profile)} más recientes de {result['total_own']})" if len(profile) < result["total_own"] else ""
+        text = f"Cafés registrados{shown}:\n" + "".join(
+            f"- {cafe.get('nombre_cafe') or 'Sin nombre'}: {cafe.get('perfil_sabor') or 'Sin descripción'}\n"
+            for cafe in profile
+        )
+    else:
+        text = "No hay cafés registrados aún.\n"
+    if result["candidates"]:
+        return text + "\nCafés de otros usuarios parecidos a sus gustos (del más parecido al menos):\n" + "".join(
+            f"- {_describe(cafe)}: {cafe.get('perfil_sabor') or 'Sin descripción'}\n" for cafe in result["candidates"]
+        )
+    return text
+
+
+_index = None
+
+
+def build_coffee_index():
+    """Construye el índice, o None con COFFETTO_RECOMMEND_INDEX_ENABLED=false"""
+    if os.getenv("COFFETTO_RECOMMEND_INDEX_ENABLED", "true").lower() not in ("1", "true", "yes"):
+        return None
+    return CoffeeSimilarityIndex.from_env()
+
+
+def init_coffee_index(repository):
+    """Crea el índice global y lo suscribe a las inserciones del repositorio.
+
+    Retorna None si no hay base de datos o el índice está desactivado; la
+    carga de la tabla la hace el calentamiento.
+    """
+    global _index
+    if _index is None and repository is not None:
+        _index = build_coffee_index()
+        if _index is not None:
+            repository.add_insert_listener(_index.on_insert)
+    return _index
+
+
+def set_coffee_index(index) -> None:
+    """Reemplaza el índice global (p. ej. en benchmarks)"""
+    global _index
+    _index = index
+
+
+def get_coffee_index():
+    return _index
+
+
+async def close_coffee_index() -> None:
+    global _index
+    if _index is not None:
+        await _index.close()
+        _index = None
@@ -0,0 +1,146 @@
+import asyncio
+import contextvars
+import json
+
+from metrics.stage_timing import span
+
+"""Streaming de respuestas del asistente como eventos NDJSON.
+
+Los endpoints de streaming ejecutan el mismo manejador que los endpoints
+normales dentro de una tarea con un `ReplyStream` activo. Mientras está
+activo, `generate_reply` usa la API de streaming del modelo y publica cada
+fragmento como evento "token"; fuera de un stream se comporta como un
+`ainvoke` normal. Eventos emitidos, uno por línea:
+
+    {"type": "intent", "userintention": ...}
+    {"type": "token", "text": ...}
+    {"type": "done", ...respuesta completa del endpoint...}
+    {"type": "error", "error": ...}
+"""
+
+_active_stream = contextvars.ContextVar("coffetto_reply_stream", default=None)
+
+
+def _unsent_suffix(reply: str, streamed: str):
+    """Parte de `reply` que falta enviar si lo transmitido es su prefijo sin contar
+    diferencias de espacios (p. ej. una introducción recortada con strip); None si no lo es"""
+    position = 0
+    for char in streamed:
+        if char.isspace():
+            continue
+        while position < len(reply) and reply[position].isspace():
+            position += 1
+        if position == len(reply) or reply[position] != char:
+            return None
+        position += 1
+    return reply[position:]
+
+
+def _chunk_text(chunk) -> str:
+    content = getattr(chunk, "content", chunk)
+    if isinstance(content, list):
+        # Gemini puede devolver el contenido como lista de partes
+        return "".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content)
+    return content if isinstance(content, str) else str(content)
+
+
+class ReplyStream:
+    def __init__(self):
+        self._queue = asyncio.Queue()
+        # Texto ya enviado como tokens
+        self._streamed = []
+        # Tarea que ejecuta el manejador (ver run_streamed)
+        self.task = None
+
+    def emit(self, event_type: str, **data) -> None:
+        self._queue.put_nowait({"type": event_type, **data})
+
+    @property
+    def streamed_parts(self) -> int:
+        return len(self._streamed)
+
+    def token(self, text: str) -> None:
+        if text:
+            self._streamed.append(text)
+            self.emit("token", text=text)
+
+    def finish(self, result: dict) -> None:
+        # Las respuestas que no vienen del modelo (plantillas, caché, listas
+        # renderizadas) se envían como el texto aún no transmitido
+        reply = (result or {}).get("reply") or ""
+        unsent = _unsent_suffix(reply, "".join(self._streamed))
+        if unsent is not None:
+            self.token(unsent)
+        self.emit("done", **(result or {}))
+        self._queue.put_nowait(None)
+
+    def fail(self, error: Exception) -> None:
+        self.emit("error", error=str(error))
+        self._queue.put_nowait(None)
+
+    async def ndjson(self):
+        while True:
+            event = await self._queue.get()
+            if event is None:
+                return
+            yield json.dumps(event, ensure_ascii=False, default=str) + "\n"
+
+
+def run_streamed(handler) -> ReplyStream:
+    """Ejecuta `handler()` (corutina) en una tarea con un stream activo.
+
+    La tarea termina aunque el cliente se desconecte, así que la respuesta
+    completa siempre queda registrada en la memoria de la conversación.
+    """
+    stream = ReplyStream()
+
+    async def run():
+        _active_stream.set(stream)
+        try:
+            stream.finish(await handler())
+        except Exception as e:
+            stream.fail(e)
+
+    stream.task = asyncio.get_running_loop().create_task(run())
+    return stream
+
+
+def stream_local_text(text: str) -> None:
+    """Publica como tokens texto armado localmente (p. ej. la lista que sigue a una
+    introducción del modelo); sin stream no hace nada"""
+    stream = _active_stream.get()
+    if stream is not None:
+        stream.token(text)
+
+
+def streamed_parts() -> int:
+    """Fragmentos ya transmitidos en el stream activo (0 sin stream)"""
+    stream = _active_stream.get()
+    return stream.streamed_parts if stream is not None else 0
+
+
+def emit_event(event_type: str, **data) -> None:
+    """Publica un evento en el stream activo; sin stream no hace nada"""
+    stream = _active_stream.get()
+    if stream is not None:
+        stream.emit(event_type, **data)
+
+
+async def generate_reply(llm, prompt, stream_tokens: bool = True, **kwargs) -> str:
+    """Texto de respuesta del modelo, transmitido por tokens si hay un stream activo.
+
+    Con `stream_tokens=False` no se transmite (la respuesta llega completa en el
+    evento "done"). `kwargs` se pasan a la llamada del modelo (p. ej. cached_content).
+    """
+    stream = _active_stream.get() if stream_tokens else None
+    with span("reply_generation"):
+        if stream is None:
+            result = await llm.ainvoke(prompt, **kwargs)
+            return getattr(result, "content", str(result))
+
+        parts = []
+        async for chunk in llm.astream(prompt, **kwargs):
+            text = _chunk_text(chunk)
+            parts.append(text)
+            stream.token(text)
+        return "".join(parts)
@@ -0,0 +1,191 @@
+import os
+import random
+import zlib
+
+"""Respuestas fijas del asistente generadas a partir de plantillas.
+
+Las ramas que solo informan algo fijo (credenciales faltantes, registro
+exitoso, error) no necesitan una llamada al modelo: se elige una de varias
+variantes por idioma y se completan los datos del registro. Si una rama
+aparece en COFFETTO_LLM_REWORD, el texto se pasa al modelo para reformularlo.
+"""
+
+DEFAULT_LOCALE = os.getenv("COFFETTO_LOCALE", "es")
+
+REPLY_TEMPLATES = {
+    "es": {
+        "coffee.missing_credentials": [
+            "Aún no puedo guardar tu café: faltan las credenciales de Supabase (SUPABASE_URL / SUPABASE_SERVICE_ROLE_KEY). Configúralas y lo intentamos de nuevo.",
+            "Me encantaría guardar ese café, pero primero hay que configurar SUPABASE_URL y SUPABASE_SERVICE_ROLE_KEY. Cuando estén listas, lo registramos.",
+        ],
+        "coffee.created": [
+            "¡Listo! Guardé {nombre_cafe} en tu colección de cafés.",
+            "¡Perfecto! {nombre_cafe} ya forma parte de tu colección.",
+            "¡Anotado! Registré {nombre_cafe} para recordarlo y recomendarte mejor.",
+        ],
+        "coffee.error": [
+            "Uy, tuve un problema al guardar tu café. ¿Lo intentamos de nuevo en un momento?",
+            "No pude registrar el café esta vez. Por favor, inténtalo de nuevo.",
+        ],
+        "brewing_method.missing_credentials": [
+            "Aún no puedo guardar métodos de preparación: faltan las credenciales de Supabase. Configúralas y lo intentamos de nuevo.",
+            "Para guardar tu método primero hay que configurar las credenciales de Supabase (SUPABASE_URL / SUPABASE_SERVICE_ROLE_KEY).",
+        ],
+        "brewing_method.created": [
+            "¡Listo! Guardé {nombre_metodo} en tus métodos de preparación.",
+            "¡Perfecto! {nombre_metodo} quedó registrado en tus métodos de preparación.",
+            "¡Anotado! Ya tengo {nombre_metodo} guardado para la próxima vez.",
+        ],
+        "brewing_method.error": [
+            "Uy, tuve un problema al guardar tu método de preparación. ¿Lo intentamos de nuevo?",
+            "No pude registrar el método esta vez. Por favor, inténtalo de nuevo en un momento.",
+        ],
+        "show_coffees.missing_credentials": [
+            "No puedo consultar tus cafés porque faltan las credenciales de Supabase. Configúralas y los revisamos juntos.",
+            "Para mostrarte tus cafés primero hay que configurar las credenciales de Supabase.",
+        ],
+        "show_coffees.error": [
+            "Uy, tuve un problema al consultar tus cafés. Inténtalo de nuevo en un momento.",
+            "No pude traer tus cafés registrados esta vez. ¿Lo intentamos de nuevo?",
+        ],
+        "show_brewing_methods.missing_credentials": [
+            "No puedo consultar tus métodos de preparación porque faltan las credenciales de Supabase.",
+            "Para mostrarte tus métodos primero hay que configurar las credenciales de Supabase.",
+        ],
+        "show_brewing_methods.error": [
+            "Uy, tuve un problema al consultar tus métodos de preparación. Inténtalo de nuevo en un momento.",
+            "No pude traer tus métodos registrados esta vez. ¿Lo intentamos de nuevo?",
+        ],
+        "show_coffees.empty": [
+            "Aún no tienes cafés registrados. Cuéntame de un café que te guste y lo guardo en tu colección.",
+            "Tu colección de cafés está vacía por ahora. ¿Registramos el primero?",
+        ],
+        "show_coffees.header": [
+            "Estos son tus cafés registrados:",
+            "Aquí tienes tu colección de cafés:",
+        ],
+        "show_brewing_methods.empty": [
+            "Aún no tienes métodos de preparación registrados. Cuéntame cómo preparas tu café y lo guardo.",
+            "Todavía no hay métodos guardados. ¿Registramos tu receta favorita?",
+        ],
+        "show_brewing_methods.header": [
+            "Estos son tus métodos de preparación registrados:",
+            "Aquí tienes tus métodos de preparación:",
+        ],
+        "collection.page": [
+            "Página {page}:",
+        ],
+        "collection.more": [
+            "Escribe \"más\" para ver los siguientes.",
+        ],
+        "collection.no_more": [
+            "Ya no hay más resultados; esa era toda la lista.",
+        ],
+        "registration.failed": [
+            "Por cierto, no logré guardar {nombres} después de varios intentos. ¿Me lo cuentas de nuevo para registrarlo?",
+            "Una aclaración: el registro de {nombres} no se pudo guardar. Si quieres, envíamelo otra vez.",
+        ],
+    },
+    "en": {
+        "coffee.missing_credentials": [
+            "I can't save your coffee yet: the Supabase credentials (SUPABASE_URL / SUPABASE_SERVICE_ROLE_KEY) are missing. Set them up and we'll try again.",
+        ],
+        "coffee.created": [
+            "Done! I saved {nombre_cafe} to your coffee collection.",
+            "Great! {nombre_cafe} is now part of your collection.",
+        ],
+        "coffee.error": [
+            "Oops, something went wrong while saving your coffee. Please try again in a moment.",
+        ],
+        "brewing_method.missing_credentials": [
+            "I can't save brewing methods yet: the Supabase credentials are missing.",
+        ],
+        "brewing_method.created": [
+            "Done! I saved {nombre_metodo} to your brewing methods.",
+            "Great! {nombre_metodo} is now in your brewing methods.",
+        ],
+        "brewing_method.error": [
+            "Oops, something went wrong while saving your brewing method. Please try again.",
+        ],
+        "show_coffees.missing_credentials": [
+            "I can't look up your coffees because the Supabase credentials are missing.",
+        ],
+        "show_coffees.error": [
+            "Oops, I couldn't fetch your coffees right now. Please try again in a moment.",
+        ],
+        "show_brewing_methods.missing_credentials": [
+            "I can't look up your brewing methods because the Supabase credentials are missing.",
+        ],
+        "show_brewing_methods.error": [
+            "Oops, I couldn't fetch your brewing methods right now. Please try again in a moment.",
+        ],
+        "show_coffees.empty": [
+            "You don't have any coffees saved yet. Tell me about one you like and I'll add it.",
+        ],
+        "show_coffees.header": [
+            "Here are your saved coffees:",
+        ],
+        "show_brewing_methods.empty": [
+            "You don't have any brewing methods saved yet. Tell me how you brew and I'll save it.",
+        ],
+        "show_brewing_methods.header": [
+            "Here are your saved brewing methods:",
+        ],
+        "collection.page": [
+            "Page {page}:",
+        ],
+        "collection.more": [
+            "Type \"more\" to see the next ones.",
+        ],
+        "collection.no_more": [
+            "There are no more results; that was the whole list.",
+        ],
+        "registration.failed": [
+            "By the way, I couldn't save {nombres} after several attempts. Could you send it again?",
+        ],
+    },
+}
+
+# Valores por defecto cuando el registro no trae el dato
+_DEFAULT_VALUES = {
+    "es": {"nombre_cafe": "tu café", "nombre_metodo": "tu método"},
+    "en": {"nombre_cafe": "your coffee", "nombre_metodo": "your method"},
+}
+
+
+class _DefaultingValues(dict):
+    def __missing__(self, key):
+        return ""
+
+
+def _reword_keys() -> set:
+    raw = os.getenv("COFFETTO_LLM_REWORD", "")
+    return {key.strip() for key in raw.split(",") if key.strip()}
+
+
+# Ramas cuya respuesta de plantilla se reformula con el modelo ("*" = todas)
+REWORD_KEYS = _reword_keys()
+
+
+def should_reword(key: str) -> bool:
+    return "*" in REWORD_KEYS or key in REWORD_KEYS
+
+
+def render_reply(key: str, locale: str = None, seed: str = None, **values) -> str:
+    """Renderiza una de las variantes de la plantilla `key`.
+
+    Con `seed` (p. ej. el user_id) la variante es estable para ese valor;
+    sin él se elige al azar.
+    """
+    locale = locale or DEFAULT_LOCALE
+    templates = REPLY_TEMPLATES.get(locale) or REPLY_TEMPLATES["es"]
+    variants = templates.get(key) or REPLY_TEMPLATES["es"][key]
+
+    if seed is None:
+        variant = random.choice(variants)
+    else:
+        variant = variants[zlib.crc32(f"{key}:{seed}".encode("utf-8")) % len(variants)]
+
+    merged = _DefaultingValues(_DEFAULT_VALUES.get(locale, _DEFAULT_VALUES["es"]))
+    merged.update({k: v for k, v in values.items() if v})
+    return variant.format_map(merged)
@@ -0,0 +1,81 @@
+import os
+import re
+
+from ai.intent.fast_classifier import normalize
+from cache.ttl_cache import TTLCache
+
+"""Caché de respuestas para preguntas generales de café (rama 'Other').
+
+Preguntas educativas como "¿qué es un proceso honey?" no dependen del
+historial, así que su respuesta se reutiliza entre usuarios, indexada por
+el texto normalizado. Solo se cachean turnos que pasan `is_cacheable`: no
+la primera interacción (lleva saludo), solo preguntas, sin referencias
+personales ni a mensajes anteriores. El grafo de chat responde esos turnos
+con un prompt sin historial (sin el nombre ni los turnos del usuario) y
+solo guarda esas respuestas, así que nada personal se comparte.
+"""
+
+_QUESTION_START = re.compile(
+    r"^(que|como|cual|cuales|cuanto|cuanta|cuantos|cuantas|por que|para que|donde|cuando|"
+    r"quien|explica(me)?|diferencia|es mejor)\b"
+)
+
+# Referencias al usuario o a la conversación: la respuesta no es reutilizable
+_PERSONAL_OR_CONTEXTUAL = re.compile(
+    r"\b(mi|mis|me|yo|mio|mia|tengo|compre|llamo|nombre|tu|te|estas|hola|gracias|dijiste|anterior|eso|ese|esa|esto|"
+    r"este|esta|ahi|entonces|tambien|y si|registr\w*|guard\w*|recomiend\w*)\b"
+)
+
+_MIN_QUESTION_LENGTH = 8
+_MAX_QUESTION_LENGTH = 200
+
+
+def cache_key(message: str) -> str:
+    return normalize(message)
+
+
+def is_cacheable(message: str, previous_messages: int) -> bool:
+    """Decide si la respuesta a este turno puede compartirse entre usuarios"""
+    # En la primera interacción la respuesta incluye el saludo y la presentación
+    if previous_messages == 0:
+        return False
+    text = normalize(message)
+    if not _MIN_QUESTION_LENGTH <= len(text) <= _MAX_QUESTION_LENGTH:
+        return False
+    if "?" not in message and not _QUESTION_START.search(text):
+        return False
+    return not _PERSONAL_OR_CONTEXTUAL.search(text)
+
+
+class ResponseCache:
+    def __init__(self, max_entries: int = 2000, ttl_seconds: float = 24 * 3600, max_chars: int = 4_000_000):
+        self._cache = TTLCache(
+            max_entries=max_entries,
+            ttl_seconds=ttl_seconds,
+            max_size=max_chars,
+            size_of=len,
+        )
+        self.uncacheable = 0
+
+    @classmethod
+    def from_env(cls) -> "ResponseCache":
+        return cls(
+            max_entries=int(os.getenv("COFFETTO_RESPONSE_CACHE_MAX_ENTRIES", "2000")),
+            ttl_seconds=float(os.getenv("COFFETTO_RESPONSE_CACHE_TTL_SECONDS", str(24 * 3600))),
+            max_chars=int(os.getenv("COFFETTO_RESPONSE_CACHE_MAX_CHARS", "4000000")),
+        )
+
+    def lookup(self, message: str, previous_messages: int):
+        """Retorna (clave, respuesta_cacheada); la clave es None si el turno no es cacheable"""
+        if not is_cacheable(message, previous_messages):
+            self.uncacheable += 1
+            return None, None
+        key = cache_key(message)
+        return key, self._cache.get(key)
+
+    def store(self, key: str, reply: str) -> None:
+        if key and reply:
+            self._cache.set(key, reply)
+
+    def stats(self) -> dict:
+        return {**self._cache.stats(), "uncacheable": self.uncacheable}
@@ -0,0 +1,161 @@
+"""Esquemas JSON para las salidas estructuradas del modelo.
+
+Se definen una sola vez a nivel de módulo para que el registro de LLM
+pueda construir los runnables correspondientes al arrancar la aplicación.
+"""
+
+USER_INTENTIONS = [
+    "Register_coffee",
+    "Register_brewing_method",
+    "Recommend_coffee",
+    "Recommend_brewing",
+    "Show_my_coffees",
+    "Show_my_brewing_methods",
+    "Other",
+]
+
+INTENTION_SCHEMA = {
+    "title": "UserIntention",
+    "description": (
+        "Clasifica la intención del mensaje del usuario relacionado con café. "
+        "Devuelve solo una de las etiquetas permitidas."
+    ),
+    "type": "object",
+    "properties": {
+        "userintention": {
+            "type": "string",
+            "enum": USER_INTENTIONS,
+            "description": (
+                "'Register_coffee': cuando el usuario quiere registrar/guardar información de un café que le gusta. "
+                "'Register_brewing_method': cuando el usuario quiere registrar/guardar un método de preparación de café. "
+                "'Recommend_coffee': cuando el usuario pide recomendaciones de café basadas en sus gustos. "
+                "'Recommend_brewing': cuando el usuario pide recomendaciones de método de preparación para un café específico. "
+                "'Show_my_coffees': cuando el usuario pregunta por sus cafés favoritos, registrados o guardados. "
+                "'Show_my_brewing_methods': cuando el usuario pregunta por sus métodos de preparación registrados o guardados. "
+                "'Other': conversación casual u otro propósito relacionado con café."
+            ),
+        }
+    },
+    "required": ["userintention"],
+    "additionalProperties": False,
+}
+
+COFFEE_FIELDS = [
+    "nombre_cafe",
+    "variedad",
+    "proceso",
+    "tueste",
+    "perfil_sabor",
+    "donde_comprar",
+]
+
+COFFEE_COMPLETENESS_SCHEMA = {
+    "title": "CoffeeCompleteness",
+    "type": "object",
+    "properties": {
+        "is_complete": {"type": "boolean"},
+        "missing_fields": {
+            "type": "array",
+            "items": {
+                "type": "string",
+                "enum": COFFEE_FIELDS,
+            }
+        }
+    },
+    "required": ["is_complete", "missing_fields"],
+    "additionalProperties": False,
+}
+
+COFFEE_DATA_SCHEMA = {
+    "title": "CoffeeData",
+    "description": (
+        "Extrae únicamente los campos del café que el usuario proporciona. No inventes valores."
+    ),
+    "type": "object",
+    "properties": {
+        "nombre_cafe": {
+            "type": "string",
+            "description": "Nombre del café"
+        },
+        "variedad": {"type": "string", "description": "Variedad del café (ej: Geisha, Bourbon, Typica)"},
+        "proceso": {"type": "string", "description": "Proceso de beneficiado (ej: Lavado, Natural, Honey)"},
+        "tueste": {"type": "string", "description": "Nivel de tueste (ej: Claro, Medio, Oscuro)"},
+        "perfil_sabor": {"type": "string", "description": "Descripción del perfil de sabor y notas"},
+        "donde_comprar": {"type": "string", "description": "Lugar donde se puede comprar este café"}
+    },
+    "additionalProperties": False,
+}
+
+BREWING_METHOD_FIELDS = ["nombre_metodo", "ratio", "instrucciones"]
+
+BREWING_METHOD_COMPLETENESS_SCHEMA = {
+    "title": "BrewingMethodCompleteness",
+    "type": "object",
+    "properties": {
+        "is_complete": {"type": "boolean"},
+        "missing_fields": {
+            "type": "array",
+            "items": {
+                "type": "string",
+                "enum": BREWING_METHOD_FIELDS,
+            }
+        }
+    },
+    "required": ["is_complete", "missing_fields"],
+    "additionalProperties": False,
+}
+
+BREWING_METHOD_DATA_SCHEMA = {
+    "title": "BrewingMethodData",
+    "description": "Extrae los campos del método de preparación. No inventes valores.",
+    "type": "object",
+    "properties": {
+        "nombre_metodo": {"type": "string", "description": "Nombre del método de preparación"},
+        "ratio": {"type": "string", "description": "Proporción café:agua (ej: 1:15, 1:16)"},
+        "instrucciones": {"type": "string", "description": "Instrucciones paso a paso del método"}
+    },
+    "additionalProperties": False,
+}
+
+# Intención + completitud + campos en una sola llamada (modo "combined")
+TURN_SCHEMA = {
+    "title": "CoffeeTurn",
+    "description": (
+        "Clasifica la intención del último mensaje del usuario y, si quiere registrar un café "
+        "o un método de preparación, evalúa la completitud y extrae los campos que proporciona. "
+        "No inventes valores: omite los campos que no estén en el mensaje."
+    ),
+    "type": "object",
+    "properties": {
+        "userintention": INTENTION_SCHEMA["properties"]["userintention"],
+        "is_complete": {
+            "type": "boolean",
+            "description": (
+                "Solo para intenciones de registro: true si el mensaje incluye al menos el nombre "
+                "del café (Register_coffee) o del método (Register_brewing_method)."
+            ),
+        },
+        "missing_fields": {
+            "type": "array",
+            "items": {
+                "type": "string",
+                "enum": COFFEE_FIELDS + BREWING_METHOD_FIELDS,
+            },
+            "description": "Campos del registro que faltan en el mensaje del usuario.",
+        },
+        **COFFEE_DATA_SCHEMA["properties"],
+        **BREWING_METHOD_DATA_SCHEMA["properties"],
+    },
+    "required": ["userintention"],
+    "additionalProperties": False,
+}
+
+# Nombre del runnable en el registro -> esquema
+STRUCTURED_SCHEMAS = {
+    "intention": INTENTION_SCHEMA,
+    "coffee_completeness": COFFEE_COMPLETENESS_SCHEMA,
+    "coffee_data": COFFEE_DATA_SCHEMA,
+    "brewing_completeness": BREWING_METHOD_COMPLETENESS_SCHEMA,
+    "brewing_data": BREWING_METHOD_DATA_SCHEMA,
+    "turn": TURN_SCHEMA,
+}
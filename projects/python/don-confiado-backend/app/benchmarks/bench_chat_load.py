@@ -0,0 +1,234 @@
+"""Prueba de carga offline de /api/chat_v1.0 y /api/chat_v1.1.
+
+Levanta la aplicación completa (main:app, con su lifespan) en proceso y la
+recorre con httpx sobre ASGITransport, sin red: Gemini se reemplaza por un
+modelo falso determinista con latencia configurable (benchmarks/fake_llm.py)
+y Supabase por el backend en memoria con latencia simulada. Cada usuario
+virtual repite un guion que pasa por todas las ramas de intención
+(Other, registro incompleto y completo de café, registro de método,
+recomendaciones, listados paginados y v1.0).
+
+Cada nivel de concurrencia envía usuarios x rondas x pasos del guion
+peticiones y reporta peticiones/s, latencias p50/p95/p99, llamadas al
+modelo por petición y crecimiento de memoria (RSS). Sirve para comparar
+antes/después de cambios de asincronía, caché o lotes.
+
+Uso (desde app/):
+    python -m benchmarks.bench_chat_load --concurrency 1,10,50 --rounds 2 --llm-latency 0.2
+"""
+
+import argparse
+import asyncio
+import gc
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Guion de cada usuario virtual: (endpoint, mensaje); "{n}" numera los registros
+SCRIPT = [
+    ("/api/chat_v1.1", "hola, ¿qué es un proceso honey?"),
+    ("/api/chat_v1.1", "quiero registrar un café"),
+    ("/api/chat_v1.1", "se llama Finca {n}, variedad geisha, proceso lavado, tueste claro"),
+    ("/api/chat_v1.1", "quiero guardar mi método V60 ratio 1:16 en tres vertidos"),
+    ("/api/chat_v1.1", "recomiéndame un café parecido a los que me gustan"),
+    ("/api/chat_v1.1", "¿cómo preparar un café natural para resaltar el dulzor?"),
+    ("/api/chat_v1.1", "muéstrame mis cafés"),
+    ("/api/chat_v1.1", "más"),
+    ("/api/chat_v1.1", "muéstrame mis métodos de preparación"),
+    ("/api/chat_v1.0", "hola Coffetto, ¿qué café me recomiendas hoy?"),
+]
+
+
+def _configure_env(args, data_dir: str) -> None:
+    # Los módulos de la aplicación leen el entorno al importarse: se fija antes de importarlos.
+    # Lo que ya esté definido se respeta (p. ej. COFFETTO_SESSION_BACKEND=sqlite para compararlo).
+    os.environ.setdefault("GOOGLE_API_KEY", "benchmark-dummy-key")
+    os.environ.setdefault("COFFETTO_HISTORY_LOG_DIR", os.path.join(data_dir, "conversations"))
+    os.environ.setdefault("COFFETTO_SESSION_SQLITE_PATH", os.path.join(data_dir, "sessions.db"))
+    os.environ.setdefault("COFFETTO_REGISTRATION_DEAD_LETTER_PATH", os.path.join(data_dir, "dead_letter.jsonl"))
+    # La bandeja solo retiene mensajes que llegan durante un turno en curso del mismo usuario; se compara con --inbox
+    os.environ["COFFETTO_INBOX_ENABLED"] = "true" if args.inbox else "false"
+    os.environ["COFFETTO_EXTRACTION_MODE"] = args.extraction_mode
+    # Con --prompt-cache local el registro de prompts se arma en _run con el sustituto en memoria
+    os.environ["COFFETTO_PROMPT_CACHE"] = "prefix"
+    os.environ["COFFETTO_COLLECTION_PREFETCH"] = "true" if args.prefetch else "false"
+
+
+def _rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError):
+        # Sin /proc (macOS): pico de memoria del proceso
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _percentile(sorted_values: list, percent: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(percent / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+async def _virtual_user(client, user_id: str, rounds: int, results: list) -> None:
+    for step in range(rounds * len(SCRIPT)):
+        endpoint, message = SCRIPT[step % len(SCRIPT)]
+        payload = {"message": message.format(n=step), "user_id": user_id}
+        started = time.perf_counter()
+        try:
+            response = await client.post(endpoint, json=payload)
+            body = response.json()
+            ok = response.status_code == 200 and body.get("status") != "error"
+            label = body.get("userintention") or endpoint.rsplit("/", 1)[-1]
+        except Exception:
+            ok, label = False, "exception"
+        results.append((label, time.perf_counter() - started, ok))
+
+
+async def _seed_collections(backend, users: list, coffees_per_user: int) -> None:
+    from business.repositories.coffee_repository import COFFEES_TABLE
+
+    rows = [
+        {"user_id": user_id, "nombre_cafe": f"Semilla {i}", "variedad": "caturra", "proceso": "honey",
+         "tueste": "medio", "perfil_sabor": "panela y cítricos"}
+        for user_id in users
+        for i in range(coffees_per_user)
+    ]
+    if rows:
+        await backend.insert(COFFEES_TABLE, rows)
+
+
+async def _run_level(client, backend, model, ledger, level: int, concurrency: int, args) -> dict:
+    users = [f"bench-{level}-{i}" for i in range(concurrency)]
+    db_latency, backend.latency_seconds = backend.latency_seconds, 0.0
+    await _seed_collections(backend, users, args.seed_coffees)
+    backend.latency_seconds = db_latency
+
+    gc.collect()
+    rss_before = _rss_mb()
+    calls_before = model.calls
+    input_before = ledger.totals.input_tokens
+    cached_before = ledger.totals.cached_input_tokens
+    results = []
+    started = time.perf_counter()
+    await asyncio.gather(*(_virtual_user(client, user_id, args.rounds, results) for user_id in users))
+    elapsed = time.perf_counter() - started
+    gc.collect()
+
+    input_tokens = ledger.totals.input_tokens - input_before
+    cached_tokens = ledger.totals.cached_input_tokens - cached_before
+    latencies = sorted(seconds for _, seconds, _ in results)
+    by_intent = {}
+    for label, seconds, _ in results:
+        by_intent.setdefault(label, []).append(seconds)
+    return {
+        "concurrency": concurrency,
+        "requests": len(results),
+        "errors": sum(1 for _, _, ok in results if not ok),
+        "rps": len(results) / elapsed if elapsed else 0.0,
+        "p50": _percentile(latencies, 50),
+        "p95": _percentile(latencies, 95),
+        "p99": _percentile(latencies, 99),
+        "llm_calls": (model.calls - calls_before) / len(results) if results else 0.0,
+        "input_tokens": input_tokens / len(results) if results else 0.0,
+        "cached_share": cached_tokens / input_tokens if input_tokens else 0.0,
+        "rss": _rss_mb(),
+        "rss_growth": _rss_mb() - rss_before,
+        "by_intent": {label: sorted(values) for label, values in by_intent.items()},
+    }
+
+
+async def _run(args) -> list:
+    import httpx
+
+    from ai.llm_registry import LLMRegistry, set_llm_registry
+    from ai.prompt_registry import PromptRegistry, set_prompt_registry
+    from benchmarks.fake_llm import FakeChatModel, LocalContextCache
+    from business.repositories.backends import InMemoryBackend
+    from business.repositories.coffee_repository import CoffeeRepository, set_repository
+    from main import app
+    from metrics.token_usage import get_usage_ledger
+
+    model = FakeChatModel(
+        latency_seconds=args.llm_latency,
+        jitter=args.jitter,
+        input_seconds_per_1k_tokens=args.input_latency_per_1k,
+    )
+    backend = InMemoryBackend(latency_seconds=args.db_latency)
+    set_llm_registry(LLMRegistry(model))
+    set_repository(CoffeeRepository(backend))
+    if args.prompt_cache == "local":
+        # El sustituto local no impone el mínimo de tokens de la API de Gemini
+        model.context_cache = LocalContextCache(min_tokens=0)
+        set_prompt_registry(PromptRegistry(provider=model.context_cache))
+
+    reports = []
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            # Calentamiento: importaciones perezosas, cachés de clasificadores, etc.
+            await _virtual_user(client, "bench-warmup", 1, [])
+            for level, concurrency in enumerate(args.concurrency):
+                reports.append(await _run_level(client, backend, model, get_usage_ledger(), level, concurrency, args))
+    return reports
+
+
+def _print_reports(reports: list, by_intent: bool) -> None:
+    print(f"{'concurrencia':>12} {'peticiones':>10} {'errores':>7} {'req/s':>8} {'p50 ms':>8} "
+          f"{'p95 ms':>8} {'p99 ms':>8} {'llm/pet':>7} {'tok/pet':>7} {'caché':>6} {'RSS MB':>8} {'+MB':>7}")
+    for report in reports:
+        print(f"{report['concurrency']:>12} {report['requests']:>10} {report['errors']:>7} {report['rps']:>8.1f} "
+              f"{report['p50'] * 1000:>8.1f} {report['p95'] * 1000:>8.1f} {report['p99'] * 1000:>8.1f} "
+              f"{report['llm_calls']:>7.2f} {report['input_tokens']:>7.0f} {report['cached_share']:>6.0%} "
+              f"{report['rss']:>8.1f} {report['rss_growth']:>+7.1f}")
+    if not by_intent:
+        return
+    for report in reports:
+        print(f"\nconcurrencia {report['concurrency']}: latencia por intención")
+        for label, values in sorted(report["by_intent"].items()):
+            print(f"  {label:<26} n={len(values):<5} p50={_percentile(values, 50) * 1000:7.1f} ms  "
+                  f"p95={_percentile(values, 95) * 1000:7.1f} ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=lambda value: [int(v) for v in value.split(",")], default=[1, 10, 50],
+                        help="niveles de usuarios concurrentes, separados por coma")
+    parser.add_argument("--rounds", type=int, default=2, help="veces que cada usuario recorre el guion")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="segundos por llamada al modelo falso")
+    parser.add_argument("--jitter", type=float, default=0.2, help="variación relativa de la latencia del modelo")
+    parser.add_argument("--input-latency-per-1k", type=float, default=0.0,
+                        help="segundos extra del modelo por cada mil tokens de entrada no cacheados")
+    parser.add_argument("--prompt-cache", choices=("prefix", "local"), default="prefix",
+                        help="envío de los prompts de sistema (local = caché de contexto simulada)")
+    parser.add_argument("--db-latency", type=float, default=0.02, help="segundos por llamada a la base en memoria")
+    parser.add_argument("--seed-coffees", type=int, default=12, help="cafés precargados por usuario")
+    parser.add_argument("--extraction-mode", choices=("combined", "multistep"), default="combined")
+    parser.add_argument("--prefetch", action="store_true",
+                        help="leer las colecciones del usuario mientras se clasifica (COFFETTO_COLLECTION_PREFETCH)")
+    parser.add_argument("--inbox", action="store_true", help="activar la bandeja por usuario (turnos en orden)")
+    parser.add_argument("--by-intent", action="store_true", help="mostrar latencias por intención")
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp(prefix="coffetto-load-")
+    try:
+        _configure_env(args, data_dir)
+        reports = asyncio.run(_run(args))
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    print(f"modelo falso: {args.llm_latency * 1000:.0f} ms ±{args.jitter:.0%} | base en memoria: "
+          f"{args.db_latency * 1000:.0f} ms | modo: {args.extraction_mode} | bandeja: {'sí' if args.inbox else 'no'} | "
+          f"prompts: {args.prompt_cache} | prefetch: {'sí' if args.prefetch else 'no'}")
+    _print_reports(reports, args.by_intent)
+
+
+if __name__ == "__main__":
+    main()
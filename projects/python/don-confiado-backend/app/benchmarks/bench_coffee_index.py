@@ -0,0 +1,157 @@
+"""Microbenchmark del índice de similitud de cafés (Recommend_coffee).
+
+Genera una tabla sintética de cafés (100k por defecto, repartidos entre
+varios usuarios, con variedades, procesos, tuestes y notas de sabor al
+azar) y mide sobre `CoffeeSimilarityIndex`:
+
+- carga: tiempo e incremento de memoria (RSS) al indexar la tabla en
+  páginas del tamaño de COFFETTO_RECOMMEND_INDEX_PAGE_SIZE,
+- inserción incremental: latencia de indexar un café recién insertado,
+- consulta: latencia p50/p95/p99 de `search` con usuarios y mensajes al azar,
+- prompt: tokens estimados del contexto de recomendación con la colección
+  completa (como antes) frente al del índice, para usuarios con pocas y
+  muchas filas.
+
+Uso (desde app/):
+    python -m benchmarks.bench_coffee_index --coffees 100000 --queries 1000
+"""
+
+import argparse
+import os
+import random
+import resource
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ai.memory.context_window import estimate_tokens  # noqa: E402
+from ai.recommendation.coffee_index import CoffeeSimilarityIndex, render_recommendation_context  # noqa: E402
+
+VARIETIES = [
+    "Geisha", "Bourbon", "Caturra", "Castillo", "Typica", "Pacamara", "SL28", "Heirloom",
+    "Catuai", "Maragogipe", "Pink Bourbon", "Sidra", "Wush Wush", "Java", "Mundo Novo",
+]
+PROCESSES = ["lavado", "natural", "honey", "anaeróbico", "semi lavado", "fermentación extendida", "maceración carbónica"]
+ROASTS = ["claro", "medio", "medio oscuro", "oscuro"]
+NOTES = [
+    "chocolate", "cacao", "panela", "caramelo", "miel", "nueces", "almendra", "avellana", "vainilla",
+    "canela", "floral", "jazmín", "bergamota", "té negro", "lavanda", "rosa", "durazno", "mango",
+    "piña", "maracuyá", "frutos rojos", "fresa", "mora", "cereza", "uva", "ciruela", "limón",
+    "naranja", "mandarina", "toronja", "manzana verde", "pera", "vino tinto", "whisky", "ron",
+    "tabaco", "especias", "pimienta", "cardamomo", "melaza", "azúcar morena", "frutal", "cítrico",
+    "dulce", "acidez brillante", "cuerpo sedoso", "cuerpo denso", "final largo",
+]
+MESSAGES = [
+    "recomiéndame un café parecido a los que me gustan",
+    "quiero algo frutal y floral, tueste claro",
+    "busco un café con notas a chocolate y nueces",
+    "algo dulce con panela y caramelo para espresso",
+    "un natural con frutos rojos",
+    "¿qué me recomiendas?",
+]
+
+
+def _rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError):
+        # Sin /proc (macOS): pico de memoria del proceso
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _percentile(sorted_values: list, percent: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(percent / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+def _coffee(rng: random.Random, row_id: int, user_id: str) -> dict:
+    variety = rng.choice(VARIETIES)
+    return {
+        "id": row_id,
+        "user_id": user_id,
+        "nombre_cafe": f"{variety} {rng.choice(['Finca', 'Lote', 'Hacienda', 'Reserva'])} {rng.randrange(2000)}",
+        "variedad": variety,
+        "proceso": rng.choice(PROCESSES),
+        "tueste": rng.choice(ROASTS),
+        "perfil_sabor": ", ".join(rng.sample(NOTES, rng.randint(2, 4))),
+    }
+
+
+def _legacy_context(rows: list) -> str:
+    """Contexto anterior: la colección completa del usuario"""
+    if not rows:
+        return "No hay cafés registrados aún."
+    return "Cafés registrados:\n" + "".join(
+        f"- {cafe.get('nombre_cafe', 'Sin nombre')}: {cafe.get('perfil_sabor', 'Sin descripción')}\n" for cafe in rows
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--coffees", type=int, default=100_000)
+    parser.add_argument("--users", type=int, default=5_000)
+    parser.add_argument("--queries", type=int, default=1_000)
+    parser.add_argument("--inserts", type=int, default=1_000)
+    parser.add_argument("--page-size", type=int, default=1_000)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--heavy-user-coffees", type=int, default=500, help="cafés del usuario más activo")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    heavy = [_coffee(rng, row_id, "heavy") for row_id in range(1, args.heavy_user_coffees + 1)]
+    rows = heavy + [
+        _coffee(rng, row_id, f"user-{rng.randrange(args.users)}")
+        for row_id in range(len(heavy) + 1, args.coffees + 1)
+    ]
+    rng.shuffle(rows)
+    index = CoffeeSimilarityIndex(top_k=args.top_k, page_size=args.page_size, sync_seconds=0)
+
+    rss_before = _rss_mb()
+    started = time.perf_counter()
+    for start in range(0, len(rows), args.page_size):
+        index.add_rows(rows[start:start + args.page_size])
+    build_seconds = time.perf_counter() - started
+    stats = index.stats()
+    print(f"carga: {len(index)} cafés en {build_seconds:.2f} s ({len(index) / build_seconds:,.0f} filas/s), "
+          f"{stats['terms']} términos, {stats['postings']:,} entradas, RSS +{_rss_mb() - rss_before:.1f} MB")
+
+    insert_ms = []
+    for row_id in range(args.coffees + 1, args.coffees + args.inserts + 1):
+        row = _coffee(rng, row_id, f"user-{rng.randrange(args.users)}")
+        started = time.perf_counter()
+        index.on_insert("cafes", [row])
+        insert_ms.append((time.perf_counter() - started) * 1000)
+    insert_ms.sort()
+    print(f"inserción incremental: p50 {_percentile(insert_ms, 50):.3f} ms | p95 {_percentile(insert_ms, 95):.3f} ms")
+
+    query_ms = []
+    for _ in range(args.queries):
+        user_id = f"user-{rng.randrange(args.users)}"
+        started = time.perf_counter()
+        index.search(user_id, rng.choice(MESSAGES))
+        query_ms.append((time.perf_counter() - started) * 1000)
+    query_ms.sort()
+    print(f"consulta (top {args.top_k}): p50 {_percentile(query_ms, 50):.2f} ms | "
+          f"p95 {_percentile(query_ms, 95):.2f} ms | p99 {_percentile(query_ms, 99):.2f} ms")
+
+    print(f"\n{'usuario':<10} {'cafés':>6} {'tokens completa':>16} {'tokens índice':>14}")
+    by_user = {}
+    for row in rows:
+        by_user.setdefault(row["user_id"], []).append(row)
+    typical = max((user_id for user_id in by_user if user_id != "heavy"), key=lambda user_id: len(by_user[user_id]))
+    for label, user_id in (("típico", typical), ("activo", "heavy")):
+        collection = sorted(by_user[user_id], key=lambda row: row["id"])
+        indexed = render_recommendation_context(index.search(user_id, MESSAGES[0]))
+        print(f"{label:<10} {len(collection):>6} {estimate_tokens(_legacy_context(collection)):>16} "
+              f"{estimate_tokens(indexed):>14}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Benchmark: historial persistente con escritura diferida (ConversationLog).
+
+Mide tres cosas:
+- append: costo por mensaje en el camino de la petición (solo encolar).
+- flush: mensajes por segundo escritos en lotes vs. un write+close por mensaje.
+- recuperación: tiempo de carga perezosa de un usuario tras un reinicio, y
+  de recuperar todos los usuarios uno a uno.
+
+Uso (desde app/):
+    python -m benchmarks.bench_conversation_log --users 2000 --messages 20
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ai.memory.conversation_log import ConversationLog  # noqa: E402
+
+
+def _content(i: int) -> str:
+    return f"Mensaje {i}: me gustó un café de Huila, proceso lavado, notas de panela y cítricos"
+
+
+def _bench_per_message_writes(directory: str, users: int, messages: int) -> float:
+    """Línea base: abrir, escribir y cerrar el archivo del usuario en cada mensaje"""
+    log = ConversationLog(directory)
+    start = time.perf_counter()
+    for seq in range(messages):
+        for user in range(users):
+            line = json.dumps({"seq": seq, "role": "human", "content": _content(seq)}, ensure_ascii=False)
+            with open(log._path(f"user-{user}"), "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+    return time.perf_counter() - start
+
+
+async def _bench_batched(directory: str, users: int, messages: int, batch_size: int) -> tuple:
+    log = ConversationLog(directory, flush_interval_seconds=0.05, batch_size=batch_size, max_messages=messages)
+    total = users * messages
+    append_seconds = 0.0
+    start = time.perf_counter()
+    for seq in range(messages):
+        for user in range(users):
+            started = time.perf_counter()
+            log.append(f"user-{user}", seq, "human" if seq % 2 == 0 else "ai", _content(seq))
+            append_seconds += time.perf_counter() - started
+        # Cede el event loop como lo harían las peticiones entre mensajes
+        await asyncio.sleep(0)
+    await log.close()
+    elapsed = time.perf_counter() - start
+    return append_seconds / total * 1e6, elapsed, log.flushes
+
+
+async def _bench_recovery(directory: str, users: int, messages: int) -> tuple:
+    log = ConversationLog(directory, max_messages=messages)
+    start = time.perf_counter()
+    first = await log.load("user-0")
+    single = (time.perf_counter() - start) * 1000
+    assert first is not None and len(first[1]) == messages
+
+    start = time.perf_counter()
+    for user in range(users):
+        await log.load(f"user-{user}")
+    all_users = time.perf_counter() - start
+    return single, all_users
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--messages", type=int, default=20, help="mensajes por usuario")
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+    total = args.users * args.messages
+
+    root = tempfile.mkdtemp(prefix="coffetto-log-")
+    try:
+        baseline_dir = os.path.join(root, "per_message")
+        per_message = _bench_per_message_writes(baseline_dir, args.users, args.messages)
+
+        batched_dir = os.path.join(root, "batched")
+        append_us, batched, flushes = asyncio.run(
+            _bench_batched(batched_dir, args.users, args.messages, args.batch_size)
+        )
+        single_ms, all_users = asyncio.run(_bench_recovery(batched_dir, args.users, args.messages))
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    print(f"{total} mensajes ({args.users} usuarios x {args.messages})")
+    print(f"append en la petición:     {append_us:8.2f} us/mensaje")
+    print(f"escritura por mensaje:     {total / per_message:10.0f} mensajes/s")
+    print(f"escritura en lotes:        {total / batched:10.0f} mensajes/s ({flushes} flushes)")
+    print(f"recuperar 1 usuario:       {single_ms:8.2f} ms")
+    print(f"recuperar {args.users} usuarios:  {all_users:8.2f} s ({all_users / args.users * 1000:.2f} ms/usuario)")
+
+
+if __name__ == "__main__":
+    main()
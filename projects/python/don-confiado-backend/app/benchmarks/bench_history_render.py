@@ -0,0 +1,69 @@
+"""Microbenchmark: transcripción del historial incremental vs. reconstruida.
+
+Compara la antigua `_history_as_text` (recorre y une todos los mensajes en
+cada llamada) con ConversationHistory.as_text() sobre historiales de 10,
+1k y 10k turnos, simulando las 2-3 renderizaciones de una petición v1.1.
+
+Uso (desde app/):
+    python -m benchmarks.bench_history_render
+"""
+
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ai.memory.conversation_history import ConversationHistory  # noqa: E402
+
+
+def _legacy_history_as_text(messages) -> str:
+    lines = []
+    for msg in messages:
+        if msg.get("role") == "human":
+            lines.append(f"Usuario: {msg.get('content', '')}")
+        elif msg.get("role") == "ai":
+            lines.append(f"Asistente: {msg.get('content', '')}")
+    return "\n".join(lines)
+
+
+def _build(turns: int):
+    messages = []
+    history = ConversationHistory()
+    for i in range(turns):
+        role = "human" if i % 2 == 0 else "ai"
+        content = f"Mensaje {i} sobre café de origen, proceso lavado y tueste medio"
+        messages.append({"role": role, "content": content})
+        history.append(role, content)
+    assert history.as_text() == _legacy_history_as_text(messages)
+    return messages, history
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--renders-per-request", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'turnos':>8} {'legacy (us)':>14} {'incremental (us)':>18} {'append (us)':>12}")
+    for turns in (10, 1_000, 10_000):
+        messages, history = _build(turns)
+        number = max(10, 100_000 // turns)
+        legacy = timeit.timeit(
+            lambda: [_legacy_history_as_text(messages) for _ in range(args.renders_per_request)],
+            number=number,
+        ) / number * 1e6
+        incremental = timeit.timeit(
+            lambda: [history.as_text() for _ in range(args.renders_per_request)],
+            number=number,
+        ) / number * 1e6
+        # Costo de mantener la transcripción: append + recorte del mensaje más antiguo
+        def _append_and_trim():
+            history.append("human", "¿Qué ratio uso para V60?")
+            history.drop_oldest(1)
+        append = timeit.timeit(_append_and_trim, number=number) / number * 1e6
+        print(f"{turns:>8} {legacy:>14.2f} {incremental:>18.3f} {append:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
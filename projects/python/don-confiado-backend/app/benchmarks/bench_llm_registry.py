@@ -0,0 +1,79 @@
+"""Benchmark: costo de preparación del LLM por petición vs. registro compartido.
+
+Compara lo que hacía cada petición a /api/chat_v1.1 (construir
+ChatGoogleGenerativeAI y hasta tres runnables con salida estructurada) con
+la búsqueda en el registro construido al arrancar. No hace llamadas de red.
+
+Uso (desde app/):
+    python -m benchmarks.bench_llm_registry --iterations 200
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("GOOGLE_API_KEY", "benchmark-dummy-key")
+
+from langchain_google_genai import ChatGoogleGenerativeAI  # noqa: E402
+
+from ai.llm_registry import DEFAULT_MODEL, build_llm_registry  # noqa: E402
+from ai.schemas import (  # noqa: E402
+    COFFEE_COMPLETENESS_SCHEMA,
+    COFFEE_DATA_SCHEMA,
+    INTENTION_SCHEMA,
+)
+
+
+def _per_request_setup() -> None:
+    llm = ChatGoogleGenerativeAI(model=DEFAULT_MODEL)
+    llm.with_structured_output(INTENTION_SCHEMA)
+    llm.with_structured_output(COFFEE_COMPLETENESS_SCHEMA)
+    llm.with_structured_output(COFFEE_DATA_SCHEMA)
+
+
+def _registry_lookup(registry) -> None:
+    registry.llm
+    registry.structured("intention")
+    registry.structured("coffee_completeness")
+    registry.structured("coffee_data")
+
+
+def _measure(fn, iterations: int) -> list:
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def _report(label: str, samples: list) -> None:
+    ordered = sorted(samples)
+    p95 = ordered[int(len(ordered) * 0.95) - 1]
+    print(f"{label:<28} media={statistics.mean(samples):9.4f} ms  p95={p95:9.4f} ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    registry = build_llm_registry()
+    startup_ms = (time.perf_counter() - start) * 1000
+
+    per_request = _measure(_per_request_setup, args.iterations)
+    shared = _measure(lambda: _registry_lookup(registry), args.iterations)
+
+    print(f"Construcción única del registro: {startup_ms:.2f} ms")
+    _report("Preparación por petición", per_request)
+    _report("Registro compartido", shared)
+    print(f"Ahorro por petición: {statistics.mean(per_request) - statistics.mean(shared):.4f} ms")
+
+
+if __name__ == "__main__":
+    main()
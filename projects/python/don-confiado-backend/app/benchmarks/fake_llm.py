@@ -0,0 +1,201 @@
+import asyncio
+import random
+import time
+import unicodedata
+
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+from ai.prompt_registry import ContextCacheProvider
+from metrics.token_usage import record_usage
+
+"""Modelo de chat falso y determinista para benchmarks sin red.
+
+Imita la interfaz que usa la aplicación de ChatGoogleGenerativeAI
+(ainvoke, astream y with_structured_output) con una latencia simulada
+configurable: fija por llamada más un costo por cada mil tokens de entrada
+no cacheados. Las salidas estructuradas se deciden por palabras clave del
+último mensaje del usuario, de modo que cada rama de intención de
+/api/chat_v1.1 se puede ejercitar sin Gemini.
+
+Con `context_cache` (un LocalContextCache, el sustituto en memoria de la
+caché de contexto de Gemini) acepta `cached_content` como la
+API de Gemini: falla si el contenido expiró y reporta sus tokens como
+leídos de la caché. El consumo de tokens se registra igual que lo haría el
+callback del modelo real.
+"""
+
+# (palabra clave en el último mensaje normalizado, intención) en orden de prioridad
+_INTENT_KEYWORDS = [
+    ("mis metodos", "Show_my_brewing_methods"),
+    ("mis cafes", "Show_my_coffees"),
+    ("metodo", "Register_brewing_method"),
+    ("registrar un cafe", "Register_coffee"),
+    ("se llama", "Register_coffee"),
+    ("como preparar", "Recommend_brewing"),
+    ("recomiendame un cafe", "Recommend_coffee"),
+]
+
+_REPLY = (
+    "Qué buena pregunta. El proceso honey deja parte del mucílago durante el secado, "
+    "así que el café gana dulzor y cuerpo sin perder acidez."
+)
+
+
+def _normalize(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text.lower())
+    return "".join(char for char in text if not unicodedata.combining(char))
+
+
+def _last_user_message(prompt) -> str:
+    text = prompt if isinstance(prompt, str) else str(prompt)
+    for marker in ("Último mensaje del usuario:", "Mensaje del usuario:", "Usuario:"):
+        if marker in text:
+            text = text.rsplit(marker, 1)[-1]
+            break
+    return _normalize(text.strip().split("\n", 1)[0])
+
+
+def fake_intent(message: str) -> str:
+    normalized = _normalize(message)
+    for keyword, intent in _INTENT_KEYWORDS:
+        if keyword in normalized:
+            return intent
+    return "Other"
+
+
+class LocalContextCache(ContextCacheProvider):
+    """Sustituto en memoria de la caché de contexto, para benchmarks sin red"""
+
+    def __init__(self, min_tokens: int = 0, clock=time.monotonic):
+        self.min_tokens = min_tokens
+        self._clock = clock
+        # identificador -> (expira_en, texto)
+        self._contents = {}
+        self.created = 0
+
+    async def create(self, prompt, ttl_seconds: float) -> str:
+        self.created += 1
+        handle = f"cachedContents/local-{prompt.name}-{self.created}"
+        self._contents[handle] = (self._clock() + ttl_seconds, prompt.text)
+        return handle
+
+    def resolve(self, handle: str) -> str:
+        """Texto cacheado de `handle`; KeyError si no existe o expiró, como la API real"""
+        expires_at, text = self._contents[handle]
+        if expires_at <= self._clock():
+            del self._contents[handle]
+            raise KeyError(f"Contenido cacheado expirado: {handle}")
+        return text
+
+
+class FakeChatModel:
+    def __init__(
+        self,
+        latency_seconds: float = 0.0,
+        jitter: float = 0.0,
+        seed: int = 7,
+        tokens_per_chunk: int = 4,
+        input_seconds_per_1k_tokens: float = 0.0,
+        context_cache=None,
+    ):
+        self.latency_seconds = latency_seconds
+        # Procesamiento del prompt (tiempo hasta el primer token) por cada mil tokens no cacheados
+        self.input_seconds_per_1k_tokens = input_seconds_per_1k_tokens
+        self.context_cache = context_cache
+        # Variación relativa de la latencia (0.2 = ±20%), reproducible con `seed`
+        self.jitter = jitter
+        self.tokens_per_chunk = tokens_per_chunk
+        self._random = random.Random(seed)
+        self.calls = 0
+
+    async def _simulate_latency(self, uncached_tokens: int = 0) -> None:
+        self.calls += 1
+        seconds = self.latency_seconds + self.input_seconds_per_1k_tokens * uncached_tokens / 1000
+        if seconds > 0:
+            factor = 1 + self._random.uniform(-self.jitter, self.jitter) if self.jitter else 1
+            await asyncio.sleep(seconds * factor)
+
+    def _prompt_tokens(self, prompt, cached_content: str = None) -> tuple:
+        """(tokens de entrada, de ellos leídos de la caché)"""
+        text = "".join(getattr(m, "content", str(m)) for m in prompt) if isinstance(prompt, list) else str(prompt)
+        cached_tokens = 0
+        if cached_content is not None:
+            if self.context_cache is None:
+                raise ValueError("cached_content sin caché de contexto configurada")
+            cached_tokens = len(self.context_cache.resolve(cached_content)) // 4
+        return len(text) // 4 + cached_tokens, cached_tokens
+
+    def _usage(self, input_tokens: int, cached_tokens: int, output: str) -> dict:
+        output_tokens = max(1, len(output) // 4)
+        return {
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+            "input_token_details": {"cache_read": cached_tokens},
+        }
+
+    async def ainvoke(self, prompt, config=None, cached_content: str = None, **kwargs):
+        input_tokens, cached_tokens = self._prompt_tokens(prompt, cached_content)
+        await self._simulate_latency(input_tokens - cached_tokens)
+        usage = self._usage(input_tokens, cached_tokens, _REPLY)
+        record_usage(usage, "fake")
+        return AIMessage(content=_REPLY, usage_metadata=usage)
+
+    async def astream(self, prompt, config=None, cached_content: str = None, **kwargs):
+        input_tokens, cached_tokens = self._prompt_tokens(prompt, cached_content)
+        await self._simulate_latency(input_tokens - cached_tokens)
+        words = _REPLY.split(" ")
+        for start in range(0, len(words), self.tokens_per_chunk):
+            chunk = " ".join(words[start:start + self.tokens_per_chunk])
+            yield AIMessageChunk(content=chunk if start == 0 else " " + chunk)
+            await asyncio.sleep(0)
+        record_usage(self._usage(input_tokens, cached_tokens, _REPLY), "fake")
+
+    def with_structured_output(self, schema, **kwargs):
+        return FakeStructuredModel(self, schema)
+
+
+class FakeStructuredModel:
+    def __init__(self, model: FakeChatModel, schema: dict):
+        self.model = model
+        self.title = schema.get("title")
+
+    async def ainvoke(self, prompt, config=None) -> dict:
+        input_tokens, _ = self.model._prompt_tokens(prompt)
+        await self.model._simulate_latency(input_tokens)
+        record_usage(self.model._usage(input_tokens, 0, "{}"), "fake")
+        message = _last_user_message(prompt)
+        intent = fake_intent(message)
+        if self.title == "UserIntention":
+            return {"userintention": intent}
+        coffee = self._coffee(message)
+        brewing = self._brewing_method(message)
+        if self.title == "CoffeeCompleteness":
+            return {"is_complete": bool(coffee), "missing_fields": [] if coffee else ["nombre_cafe"]}
+        if self.title == "BrewingMethodCompleteness":
+            return {"is_complete": bool(brewing), "missing_fields": [] if brewing else ["nombre_metodo"]}
+        if self.title == "CoffeeData":
+            return coffee
+        if self.title == "BrewingMethodData":
+            return brewing
+        if self.title == "CoffeeTurn":
+            turn = {"userintention": intent}
+            if intent == "Register_coffee":
+                turn.update(coffee, is_complete=bool(coffee), missing_fields=[] if coffee else ["nombre_cafe"])
+            elif intent == "Register_brewing_method":
+                turn.update(brewing, is_complete=bool(brewing), missing_fields=[] if brewing else ["nombre_metodo"])
+            return turn
+        return {}
+
+    @staticmethod
+    def _coffee(message: str) -> dict:
+        if "se llama" not in message:
+            return {}
+        name = message.split("se llama", 1)[1].split(",")[0].strip() or "sin nombre"
+        return {"nombre_cafe": name, "variedad": "geisha", "proceso": "lavado", "tueste": "claro", "perfil_sabor": "floral"}
+
+    @staticmethod
+    def _brewing_method(message: str) -> dict:
+        if "metodo" not in message:
+            return {}
+        return {"nombre_metodo": "V60", "ratio": "1:16", "instrucciones": "Vierte en tres tiempos"}
@@ -0,0 +1,142 @@
+"""Perfil del tiempo de importación y de arranque del backend.
+
+Importa `main` en un proceso nuevo con `python -X importtime` y reporta el
+tiempo total, los paquetes de primer nivel que más tardan (suma del tiempo
+propio de sus módulos) y los módulos con más tiempo propio. Sirve para detectar SDKs
+pesados que se cuelan en la importación de los routers.
+
+Con --ready además mide, en otro proceso nuevo, cuánto tarda la aplicación
+en importarse, en arrancar (lifespan) y en reportar 200 en /ready, con el
+detalle de cada paso del calentamiento. Usa una API key de prueba y la base
+en memoria, así que no hace llamadas de red.
+
+Uso (desde app/):
+    python -m benchmarks.profile_imports --top 15 --ready
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Se ejecuta en el proceso hijo; imprime un JSON con los tiempos
+_READY_PROBE = """
+import asyncio, json, time
+started = time.perf_counter()
+import httpx
+from main import app
+imported = time.perf_counter()
+
+async def probe():
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        serving = time.perf_counter()
+        async with httpx.AsyncClient(transport=transport, base_url="http://probe") as client:
+            while True:
+                response = await client.get("/ready")
+                if response.status_code == 200 or response.json()["finished"]:
+                    return serving, time.perf_counter(), response.json()
+                await asyncio.sleep(0.005)
+
+serving, ready, status = asyncio.run(probe())
+print(json.dumps({
+    "import_seconds": imported - started,
+    "serving_seconds": serving - started,
+    "ready_seconds": ready - started,
+    "status": status,
+}))
+"""
+
+
+def _parse_importtime(stderr: str) -> list:
+    """[(módulo, propio_us, acumulado_us, profundidad)] de la salida de -X importtime"""
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        # Un espacio tras el separador y dos más por cada nivel de anidamiento
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        entries.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return entries
+
+
+def profile_imports(module: str) -> list:
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=APP_DIR,
+        env=_child_env(),
+        capture_output=True,
+        text=True,
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"No se pudo importar {module}:\n{completed.stderr[-2000:]}")
+    return _parse_importtime(completed.stderr)
+
+
+def measure_ready() -> dict:
+    completed = subprocess.run(
+        [sys.executable, "-c", _READY_PROBE],
+        cwd=APP_DIR,
+        env=_child_env(),
+        capture_output=True,
+        text=True,
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"Falló la medición de /ready:\n{completed.stderr[-2000:]}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def _child_env() -> dict:
+    env = dict(os.environ)
+    env.setdefault("GOOGLE_API_KEY", "profile-dummy-key")
+    env.setdefault("COFFETTO_DB_BACKEND", "memory")
+    return env
+
+
+def _print_profile(module: str, entries: list, top: int) -> None:
+    total_us = next((cumulative for name, _, cumulative, depth in entries if name == module and depth == 0), 0)
+    print(f"import {module}: {total_us / 1e6:.3f} s ({len(entries)} módulos)\n")
+
+    # Tiempo por paquete de primer nivel: el propio de cada módulo, para no contar dos veces los anidados
+    by_package = {}
+    for name, self_us, _, _ in entries:
+        package = name.split(".", 1)[0]
+        by_package[package] = by_package.get(package, 0) + self_us
+    print(f"{'paquete':<32} {'ms':>8} {'%':>6}")
+    for package, self_us in sorted(by_package.items(), key=lambda item: item[1], reverse=True)[:top]:
+        share = self_us / total_us if total_us else 0.0
+        print(f"{package:<32} {self_us / 1000:>8.1f} {share:>6.1%}")
+
+    print(f"\n{'módulo (tiempo propio)':<48} {'ms':>8}")
+    for name, self_us, _, _ in sorted(entries, key=lambda entry: entry[1], reverse=True)[:top]:
+        print(f"{name:<48} {self_us / 1000:>8.1f}")
+
+
+def _print_ready(report: dict) -> None:
+    status = report["status"]
+    print(f"\nimportación: {report['import_seconds']:.3f} s | escuchando (lifespan): "
+          f"{report['serving_seconds']:.3f} s | /ready: {report['ready_seconds']:.3f} s "
+          f"({'listo' if status['ready'] else 'no listo'})")
+    for name, step in status["steps"].items():
+        error = f"  error: {step['error']}" if "error" in step else ""
+        print(f"  {name:<14} {step['seconds'] * 1000:>8.1f} ms{error}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--module", default="main", help="módulo a importar")
+    parser.add_argument("--top", type=int, default=15, help="filas de cada tabla")
+    parser.add_argument("--ready", action="store_true", help="medir también el tiempo hasta /ready")
+    args = parser.parse_args()
+
+    _print_profile(args.module, profile_imports(args.module), args.top)
+    if args.ready:
+        _print_ready(measure_ready())
+
+
+if __name__ == "__main__":
+    main()
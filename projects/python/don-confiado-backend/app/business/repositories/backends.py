@@ -0,0 +1,156 @@
+import asyncio
+import itertools
+from datetime import datetime, timezone
+
+import httpx
+
+"""Backends de datos para los repositorios.
+
+- PostgrestBackend: cliente HTTP asíncrono con pool de conexiones contra la
+  API REST (PostgREST) de Supabase, con tamaño de pool, keep-alive y
+  timeout por llamada configurables.
+- InMemoryBackend: sustituto en memoria con la misma interfaz para pruebas
+  y benchmarks sin red.
+"""
+
+
+class RepositoryError(Exception):
+    """Error al consultar o escribir en el backend de datos"""
+
+
+class PostgrestBackend:
+    def __init__(
+        self,
+        url: str,
+        key: str,
+        pool_size: int = 20,
+        keepalive_connections: int = 10,
+        keepalive_expiry: float = 30.0,
+        timeout: float = 10.0,
+    ):
+        self.timeout = timeout
+        self._client = httpx.AsyncClient(
+            base_url=f"{url.rstrip('/')}/rest/v1",
+            headers={
+                "apikey": key,
+                "Authorization": f"Bearer {key}",
+                "Content-Type": "application/json",
+            },
+            limits=httpx.Limits(
+                max_connections=pool_size,
+                max_keepalive_connections=keepalive_connections,
+                keepalive_expiry=keepalive_expiry,
+            ),
+            timeout=timeout,
+        )
+
+    async def select(
+        self,
+        table: str,
+        filters: dict,
+        columns: str = "*",
+        order: str = None,
+        limit: int = None,
+        offset: int = None,
+        after_id: int = None,
+        timeout: float = None,
+    ) -> list:
+        params = {"select": columns}
+        params.update({column: f"eq.{value}" for column, value in filters.items()})
+        if after_id is not None:
+            # Paginación por llave: solo filas con id mayor al último leído
+            params["id"] = f"gt.{after_id}"
+        if order:
+            params["order"] = order
+        if limit is not None:
+            params["limit"] = str(limit)
+        if offset:
+            params["offset"] = str(offset)
+        response = await self._request("GET", f"/{table}", params=params, timeout=timeout)
+        return response.json()
+
+    async def insert(self, table: str, rows: list, timeout: float = None) -> list:
+        params = None
+        prefer = "return=representation"
+        if len(rows) > 1:
+            # PostgREST rechaza un arreglo cuyos objetos no tienen las mismas llaves (PGRST102)
+            # salvo que se indiquen las columnas; las que le falten a una fila toman su valor por defecto
+            params = {"columns": ",".join(dict.fromkeys(column for row in rows for column in row))}
+            prefer = "return=representation,missing=default"
+        response = await self._request(
+            "POST",
+            f"/{table}",
+            params=params,
+            json=rows,
+            headers={"Prefer": prefer},
+            timeout=timeout,
+        )
+        return response.json() if response.content else []
+
+    async def close(self) -> None:
+        await self._client.aclose()
+
+    async def _request(self, method: str, path: str, timeout: float = None, **kwargs) -> httpx.Response:
+        try:
+            response = await self._client.request(
+                method, path, timeout=timeout if timeout is not None else self.timeout, **kwargs
+            )
+        except httpx.HTTPError as e:
+            raise RepositoryError(f"{method} {path}: {e}") from e
+        if response.is_error:
+            raise RepositoryError(f"{method} {path}: {response.status_code} {response.text}")
+        return response
+
+
+class InMemoryBackend:
+    def __init__(self, latency_seconds: float = 0.0):
+        # Latencia simulada por llamada, para benchmarks
+        self.latency_seconds = latency_seconds
+        self.tables = {}
+        self.calls = 0
+        self._ids = itertools.count(1)
+
+    async def select(
+        self,
+        table: str,
+        filters: dict,
+        columns: str = "*",
+        order: str = None,
+        limit: int = None,
+        offset: int = None,
+        after_id: int = None,
+        timeout: float = None,
+    ) -> list:
+        await self._simulate_latency()
+        rows = [
+            row for row in self.tables.get(table, [])
+            if all(str(row.get(column)) == str(value) for column, value in filters.items())
+            and (after_id is None or row.get("id", 0) > after_id)
+        ]
+        if order:
+            column, _, direction = order.partition(".")
+            rows.sort(key=lambda row: (row.get(column) is None, row.get(column)), reverse=direction == "desc")
+        start = offset or 0
+        rows = rows[start:start + limit] if limit is not None else rows[start:]
+        if columns != "*":
+            wanted = [column.strip() for column in columns.split(",")]
+            rows = [{column: row.get(column) for column in wanted} for row in rows]
+        return [dict(row) for row in rows]
+
+    async def insert(self, table: str, rows: list, timeout: float = None) -> list:
+        await self._simulate_latency()
+        now = datetime.now(timezone.utc).isoformat()
+        inserted = []
+        for row in rows:
+            stored = {"id": next(self._ids), "created_at": now, "updated_at": now, **row}
+            self.tables.setdefault(table, []).append(stored)
+            inserted.append(dict(stored))
+        return inserted
+
+    async def close(self) -> None:
+        pass
+
+    async def _simulate_latency(self) -> None:
+        self.calls += 1
+        if self.latency_seconds:
+            await asyncio.sleep(self.latency_seconds)
@@ -0,0 +1,189 @@
+import asyncio
+import os
+
+from dotenv import load_dotenv
+
+from business.repositories.backends import InMemoryBackend, PostgrestBackend
+from cache.collection_cache import CollectionCache
+from metrics.stage_timing import span
+
+"""Repositorio de cafés y métodos de preparación de cada usuario.
+
+Encapsula las consultas a las tablas `cafes` y `metodos_preparacion` para
+que el servicio de chat no construya consultas en línea. Las lecturas de
+la colección completa pasan por la caché de colecciones y las inserciones
+exitosas la actualizan. Las vistas paginadas leen solo sus columnas, o
+recortan la colección cacheada si ya está en memoria. Cada método acepta un `timeout` propio; sin él se
+usa el del backend (SUPABASE_TIMEOUT_SECONDS).
+
+Los listeners registrados con `add_insert_listener` reciben las filas de
+cada inserción exitosa (p. ej. el índice de similitud de cafés), y
+`list_all_coffees_after` recorre la tabla `cafes` de todos los usuarios
+por páginas ordenadas por id.
+"""
+
+load_dotenv()
+
+COFFEES_TABLE = "cafes"
+BREWING_METHODS_TABLE = "metodos_preparacion"
+
+
+class CoffeeRepository:
+    def __init__(self, backend, collection_cache: CollectionCache = None):
+        self.backend = backend
+        self.collection_cache = collection_cache or CollectionCache.from_env()
+        # listener(tabla, filas) que se llama tras cada inserción exitosa
+        self._insert_listeners = []
+
+    def add_insert_listener(self, listener) -> None:
+        self._insert_listeners.append(listener)
+
+    # --- Cafés ---
+    async def list_coffees(self, user_id: str, timeout: float = None) -> list:
+        return await self._list_collection(COFFEES_TABLE, user_id, timeout)
+
+    async def list_coffees_page(
+        self, user_id: str, columns: tuple, page: int, page_size: int, timeout: float = None
+    ) -> tuple:
+        return await self._list_page(COFFEES_TABLE, user_id, columns, page, page_size, timeout)
+
+    async def list_all_coffees_after(self, after_id: int, limit: int, columns: str = "*", timeout: float = None) -> list:
+        """Cafés de todos los usuarios con id mayor a `after_id`, en orden de id"""
+        with span("db_read"):
+            return await self.backend.select(
+                COFFEES_TABLE, {}, columns=columns, order="id.asc", limit=limit, after_id=after_id, timeout=timeout
+            )
+
+    async def insert_coffee(self, record: dict, timeout: float = None) -> list:
+        return await self._insert(COFFEES_TABLE, [record], timeout)
+
+    async def insert_coffees(self, records: list, timeout: float = None) -> list:
+        """Inserción de varias filas en una sola llamada"""
+        return await self._insert(COFFEES_TABLE, records, timeout)
+
+    # --- Métodos de preparación ---
+    async def list_brewing_methods(self, user_id: str, timeout: float = None) -> list:
+        return await self._list_collection(BREWING_METHODS_TABLE, user_id, timeout)
+
+    async def list_brewing_methods_page(
+        self, user_id: str, columns: tuple, page: int, page_size: int, timeout: float = None
+    ) -> tuple:
+        return await self._list_page(BREWING_METHODS_TABLE, user_id, columns, page, page_size, timeout)
+
+    async def insert_brewing_method(self, record: dict, timeout: float = None) -> list:
+        return await self._insert(BREWING_METHODS_TABLE, [record], timeout)
+
+    async def insert_brewing_methods(self, records: list, timeout: float = None) -> list:
+        """Inserción de varias filas en una sola llamada"""
+        return await self._insert(BREWING_METHODS_TABLE, records, timeout)
+
+    async def warm_up(self, connections: int = 2) -> None:
+        """Abre `connections` conexiones del pool con consultas mínimas, para que
+        la primera petición no pague el DNS ni el handshake TLS"""
+        await asyncio.gather(*(
+            self.backend.select(COFFEES_TABLE, {}, columns="id", limit=1) for _ in range(max(1, connections))
+        ))
+
+    async def close(self) -> None:
+        await self.backend.close()
+
+    # --- Internos ---
+    async def _list_collection(self, table: str, user_id: str, timeout: float = None) -> list:
+        async def load():
+            with span("db_read"):
+                # Mismo orden que las páginas leídas de la base: _list_page recorta esta lista
+                return await self.backend.select(table, {"user_id": user_id}, order="id.asc", timeout=timeout)
+
+        return await self.collection_cache.get_or_load(table, user_id, load)
+
+    async def _list_page(
+        self, table: str, user_id: str, columns: tuple, page: int, page_size: int, timeout: float = None
+    ) -> tuple:
+        """Retorna (filas de la página con solo `columns`, hay_más_páginas)"""
+        start = page * page_size
+        cached = self.collection_cache.peek(table, user_id)
+        if cached is not None:
+            window = cached[start:start + page_size + 1]
+        else:
+            # Se pide una fila extra para saber si existe una página siguiente
+            with span("db_read"):
+                window = await self.backend.select(
+                    table,
+                    {"user_id": user_id},
+                    columns=",".join(columns),
+                    order="id.asc",
+                    limit=page_size + 1,
+                    offset=start,
+                    timeout=timeout,
+                )
+        rows = [{column: row.get(column) for column in columns} for row in window[:page_size]]
+        return rows, len(window) > page_size
+
+    async def _insert(self, table: str, records: list, timeout: float = None) -> list:
+        with span("db_write"):
+            rows = await self.backend.insert(table, records, timeout=timeout)
+        by_user = {}
+        for row in rows:
+            by_user.setdefault(row.get("user_id"), []).append(row)
+        for user_id in {record["user_id"] for record in records}:
+            self.collection_cache.add_rows(table, user_id, by_user.get(user_id))
+        for listener in self._insert_listeners:
+            # La fila ya quedó guardada: un listener que falla no debe convertir la inserción en error
+            try:
+                listener(table, rows)
+            except Exception as e:
+                print(f"Error en un listener de inserción ({table}): {e}")
+        return rows
+
+
+_repository = None
+
+
+def build_repository():
+    """Construye el repositorio según COFFETTO_DB_BACKEND ("supabase" | "memory").
+
+    Retorna None si el backend es Supabase y faltan sus credenciales.
+    """
+    backend_name = os.getenv("COFFETTO_DB_BACKEND", "supabase").strip().lower()
+    if backend_name == "memory":
+        return CoffeeRepository(InMemoryBackend())
+
+    supabase_url = os.getenv("SUPABASE_URL")
+    supabase_key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+    if not supabase_url or not supabase_key:
+        return None
+    backend = PostgrestBackend(
+        supabase_url,
+        supabase_key,
+        pool_size=int(os.getenv("SUPABASE_POOL_SIZE", "20")),
+        keepalive_connections=int(os.getenv("SUPABASE_POOL_KEEPALIVE", "10")),
+        keepalive_expiry=float(os.getenv("SUPABASE_KEEPALIVE_EXPIRY_SECONDS", "30")),
+        timeout=float(os.getenv("SUPABASE_TIMEOUT_SECONDS", "10")),
+    )
+    return CoffeeRepository(backend)
+
+
+def init_repository():
+    """Inicializa el repositorio global; pensado para el evento de arranque"""
+    global _repository
+    if _repository is None:
+        _repository = build_repository()
+    return _repository
+
+
+def set_repository(repository) -> None:
+    """Reemplaza el repositorio global (p. ej. por uno en memoria en benchmarks)"""
+    global _repository
+    _repository = repository
+
+
+def get_repository():
+    """Retorna el repositorio global, o None si no hay base de datos configurada"""
+    return init_repository()
+
+
+async def close_repository() -> None:
+    global _repository
+    if _repository is not None:
+        await _repository.close()
+        _repository = None
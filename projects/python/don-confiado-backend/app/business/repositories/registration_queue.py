@@ -0,0 +1,219 @@
+import asyncio
+import json
+import os
+import time
+
+from business.repositories.coffee_repository import BREWING_METHODS_TABLE, COFFEES_TABLE, get_repository
+from metrics.stage_timing import untraced_context
+
+"""Cola de registros con escritura diferida (COFFETTO_REGISTRATION_MODE=queued).
+
+Los registros de cafés y métodos ya validados se encolan y el usuario
+recibe la confirmación de inmediato; un worker en segundo plano los inserta
+en lotes de varias filas por tabla. Si un lote falla, sus registros se
+reintentan por separado con espera exponencial, para que una fila inválida
+no bloquee al resto. Los que agotan los reintentos se escriben en un
+archivo dead-letter (JSONL) y quedan como aviso pendiente para el usuario,
+que se le entrega en su siguiente respuesta.
+"""
+
+# Tabla -> método de inserción múltiple del repositorio
+_BULK_INSERTS = {
+    COFFEES_TABLE: "insert_coffees",
+    BREWING_METHODS_TABLE: "insert_brewing_methods",
+}
+
+
+class _QueuedRecord:
+    __slots__ = ("table", "record", "attempts", "next_attempt", "last_error")
+
+    def __init__(self, table: str, record: dict):
+        self.table = table
+        self.record = record
+        self.attempts = 0
+        self.next_attempt = 0.0
+        self.last_error = None
+
+
+class RegistrationQueue:
+    def __init__(
+        self,
+        batch_size: int = 50,
+        flush_interval_seconds: float = 0.5,
+        max_attempts: int = 5,
+        retry_backoff_seconds: float = 1.0,
+        dead_letter_path: str = "data/registrations_dead_letter.jsonl",
+        clock=time.monotonic,
+    ):
+        self.batch_size = batch_size
+        self.flush_interval_seconds = flush_interval_seconds
+        self.max_attempts = max_attempts
+        self.retry_backoff_seconds = retry_backoff_seconds
+        self.dead_letter_path = dead_letter_path
+        self._clock = clock
+        self._pending = []
+        # user_id -> registros que fallaron definitivamente y aún no se le han informado
+        self._failures = {}
+        self._wakeup = None
+        self._task = None
+        self._closing = False
+        self.enqueued = 0
+        self.inserted = 0
+        self.batches = 0
+        self.retries = 0
+        self.dead_lettered = 0
+
+    @classmethod
+    def from_env(cls) -> "RegistrationQueue":
+        return cls(
+            batch_size=int(os.getenv("COFFETTO_REGISTRATION_BATCH_SIZE", "50")),
+            flush_interval_seconds=float(os.getenv("COFFETTO_REGISTRATION_FLUSH_SECONDS", "0.5")),
+            max_attempts=int(os.getenv("COFFETTO_REGISTRATION_MAX_ATTEMPTS", "5")),
+            retry_backoff_seconds=float(os.getenv("COFFETTO_REGISTRATION_RETRY_BACKOFF_SECONDS", "1.0")),
+            dead_letter_path=os.getenv("COFFETTO_REGISTRATION_DEAD_LETTER_PATH", "data/registrations_dead_letter.jsonl"),
+        )
+
+    def enqueue(self, table: str, record: dict) -> None:
+        if table not in _BULK_INSERTS:
+            raise ValueError(f"Tabla sin inserción en lote: {table}")
+        self._pending.append(_QueuedRecord(table, record))
+        self.enqueued += 1
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            # Sus inserciones no cuentan como tiempo de la petición que creó el worker
+            self._task = asyncio.get_running_loop().create_task(self._worker(), context=untraced_context())
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+
+    def pop_failures(self, user_id: str) -> list:
+        """Registros del usuario que no se pudieron guardar (se entregan una sola vez)"""
+        return self._failures.pop(user_id, [])
+
+    async def flush(self, force: bool = False) -> None:
+        """Inserta los registros listos; con force también los que esperan reintento"""
+        now = self._clock()
+        ready = [item for item in self._pending if force or item.next_attempt <= now]
+        if not ready:
+            return
+        ready_ids = {id(item) for item in ready}
+        self._pending = [item for item in self._pending if id(item) not in ready_ids]
+
+        batches = []
+        for table in _BULK_INSERTS:
+            fresh = [item for item in ready if item.table == table and item.attempts == 0]
+            for start in range(0, len(fresh), self.batch_size):
+                batches.append(fresh[start:start + self.batch_size])
+            # Los reintentos van solos para aislar filas inválidas
+            batches.extend([item] for item in ready if item.table == table and item.attempts > 0)
+        for batch in batches:
+            await self._insert_batch(batch)
+
+    async def close(self) -> None:
+        """Detiene el worker e intenta una última vez lo pendiente; pensado para el apagado"""
+        if self._task is not None:
+            self._closing = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+            self._closing = False
+        await self.flush(force=True)
+        # Lo que sigue pendiente tras el último intento queda en dead-letter para no perderlo
+        remaining, self._pending = self._pending, []
+        for item in remaining:
+            await self._dead_letter(item)
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._pending),
+            "enqueued": self.enqueued,
+            "inserted": self.inserted,
+            "batches": self.batches,
+            "retries": self.retries,
+            "dead_lettered": self.dead_lettered,
+            "undelivered_failures": sum(len(items) for items in self._failures.values()),
+        }
+
+    # --- Internos ---
+    async def _worker(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if self._closing:
+                return
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Error en la cola de registros: {e}")
+
+    async def _insert_batch(self, batch: list) -> None:
+        repository = get_repository()
+        try:
+            if repository is None:
+                raise RuntimeError("Missing Supabase credentials")
+            insert_many = getattr(repository, _BULK_INSERTS[batch[0].table])
+            await insert_many([item.record for item in batch])
+            self.batches += 1
+            self.inserted += len(batch)
+        except Exception as e:
+            for item in batch:
+                item.attempts += 1
+                item.last_error = str(e)
+                if item.attempts >= self.max_attempts:
+                    await self._dead_letter(item)
+                else:
+                    self.retries += 1
+                    item.next_attempt = self._clock() + self.retry_backoff_seconds * 2 ** (item.attempts - 1)
+                    self._pending.append(item)
+
+    async def _dead_letter(self, item: _QueuedRecord) -> None:
+        self.dead_lettered += 1
+        self._failures.setdefault(item.record.get("user_id"), []).append(
+            {"table": item.table, "record": item.record, "error": item.last_error}
+        )
+        entry = {
+            "table": item.table,
+            "record": item.record,
+            "attempts": item.attempts,
+            "error": item.last_error,
+            "failed_at": time.time(),
+        }
+        try:
+            await asyncio.to_thread(self._append_dead_letter, json.dumps(entry, ensure_ascii=False))
+        except OSError as e:
+            print(f"No se pudo escribir el registro en dead-letter: {e} ({entry})")
+
+    def _append_dead_letter(self, line: str) -> None:
+        directory = os.path.dirname(self.dead_letter_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.dead_letter_path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+_registration_queue = None
+_initialized = False
+
+
+def init_registration_queue():
+    """Crea la cola si COFFETTO_REGISTRATION_MODE=queued; None en modo inline"""
+    global _registration_queue, _initialized
+    if not _initialized:
+        _initialized = True
+        mode = os.getenv("COFFETTO_REGISTRATION_MODE", "inline").strip().lower()
+        if mode == "queued":
+            _registration_queue = RegistrationQueue.from_env()
+        elif mode != "inline":
+            raise ValueError(f"COFFETTO_REGISTRATION_MODE inválido: {mode}")
+    return _registration_queue
+
+
+def get_registration_queue():
+    return init_registration_queue()
+
+
+async def close_registration_queue() -> None:
+    if _registration_queue is not None:
+        await _registration_queue.close()
@@ -0,0 +1,126 @@
+from business.repositories.coffee_repository import BREWING_METHODS_TABLE, COFFEES_TABLE, get_repository
+from business.repositories.registration_queue import get_registration_queue
+
+"""Lógica de negocio del chat: registros y colecciones de cada usuario.
+
+Operaciones sin modelo de lenguaje que usan los nodos del grafo de chat
+(ai/agents/agent00/graph.py): armar y guardar el registro de un café o
+método, y leer las colecciones para las recomendaciones y los listados
+(o precargarlas en la caché de colecciones mientras se clasifica el turno).
+Los errores de la base de datos se devuelven en el resultado (status
+"error") para que el nodo de respuesta elija la plantilla adecuada.
+"""
+
+MISSING_CREDENTIALS = "Missing Supabase credentials"
+
+# Tabla de la colección que usa cada intención de recomendación
+RECOMMENDATION_TABLES = {
+    "Recommend_coffee": COFFEES_TABLE,
+    "Recommend_brewing": BREWING_METHODS_TABLE,
+}
+
+# Tabla que lee cada intención de lectura (recomendaciones y listados)
+COLLECTION_TABLES = {
+    **RECOMMENDATION_TABLES,
+    "Show_my_coffees": COFFEES_TABLE,
+    "Show_my_brewing_methods": BREWING_METHODS_TABLE,
+}
+
+
+def valid_value(value: object) -> bool:
+    """Valida que un valor no sea None, vacío o 'null'"""
+    if value is None:
+        return False
+    text = str(value).strip()
+    if text == "":
+        return False
+    if text.lower() == "null":
+        return False
+    return True
+
+
+def build_record(user_id: str, extracted: dict) -> dict:
+    record = {k: v for k, v in extracted.items() if valid_value(v)}
+    # Asociar el registro con el usuario
+    record["user_id"] = user_id
+    return record
+
+
+async def save_registration(table: str, record: dict) -> dict:
+    """Guarda el registro; retorna {"status": "created" | "queued" | "error", "data" | "error"}"""
+    repository = get_repository()
+    if repository is None:
+        return {"status": "error", "error": MISSING_CREDENTIALS, "missing_credentials": True}
+    try:
+        registration_queue = get_registration_queue()
+        if registration_queue is not None:
+            # Escritura diferida: se confirma ya y el worker inserta en lote
+            registration_queue.enqueue(table, record)
+            return {"status": "queued", "data": [record]}
+        if table == COFFEES_TABLE:
+            data = await repository.insert_coffee(record)
+        else:
+            data = await repository.insert_brewing_method(record)
+        return {"status": "created", "data": data}
+    except Exception as e:
+        return {"status": "error", "error": str(e)}
+
+
+async def prefetch_collection(table: str, user_id: str) -> None:
+    """Carga la colección completa en la caché de colecciones del repositorio.
+
+    Los errores se ignoran: la lectura normal del turno los vuelve a encontrar
+    y los reporta.
+    """
+    repository = get_repository()
+    if repository is None:
+        return
+    try:
+        if table == COFFEES_TABLE:
+            await repository.list_coffees(user_id)
+        else:
+            await repository.list_brewing_methods(user_id)
+    except Exception:
+        pass
+
+
+async def recommendation_context(table: str, user_id: str) -> str:
+    """Colección del usuario como texto para el prompt de recomendación"""
+    repository = get_repository()
+    if repository is None:
+        return "Base de datos no configurada."
+    if table == COFFEES_TABLE:
+        try:
+            cafes_data = await repository.list_coffees(user_id)
+        except Exception:
+            return "Error al acceder a la base de datos de cafés."
+        if not cafes_data:
+            return "No hay cafés registrados aún."
+        return "Cafés registrados:\n" + "".join(
+            f"- {cafe.get('nombre_cafe', 'Sin nombre')}: {cafe.get('perfil_sabor', 'Sin descripción')}\n"
+            for cafe in cafes_data
+        )
+    try:
+        metodos_data = await repository.list_brewing_methods(user_id)
+    except Exception:
+        return "Error al acceder a la base de datos de métodos."
+    if not metodos_data:
+        return "No hay métodos de preparación registrados aún."
+    return "Métodos de preparación registrados:\n" + "".join(
+        f"- {metodo.get('nombre_metodo', 'Sin nombre')}: {metodo.get('ratio', 'Sin ratio')}\n"
+        for metodo in metodos_data
+    )
+
+
+async def collection_page(view: dict, user_id: str, page: int, page_size: int) -> dict:
+    """Página de una vista de colección: {"status": "success", "rows", "has_more"} o {"status": "error", "error"}"""
+    repository = get_repository()
+    if repository is None:
+        return {"status": "error", "error": MISSING_CREDENTIALS, "missing_credentials": True}
+    try:
+        list_page = getattr(repository, view["list_page"])
+        rows, has_more = await list_page(user_id, view["columns"], page, page_size)
+    except Exception as e:
+        return {"status": "error", "error": str(e)}
+    return {"status": "success", "rows": rows, "has_more": has_more}
+
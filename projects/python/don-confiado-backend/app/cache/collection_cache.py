@@ -0,0 +1,108 @@
+import asyncio
+import os
+
+from cache.ttl_cache import TTLCache
+
+"""Caché de lectura (read-through) de las colecciones de cada usuario.
+
+Guarda las filas de `cafes` y `metodos_preparacion` por (tabla, user_id).
+La colección de un usuario solo cambia cuando registra algo, así que las
+inserciones exitosas actualizan la entrada en lugar de volver a leerla.
+Las cargas concurrentes de una misma clave comparten una sola consulta.
+
+Una inserción o invalidación mientras hay una carga en curso sube la
+generación de la clave: esa carga ya no se guarda en la caché (su consulta
+pudo leer la colección antes de la inserción) y quien pida la clave después
+empieza una carga nueva en vez de unirse a la vieja.
+"""
+
+
+def _rows_size(rows: list) -> int:
+    """Tamaño aproximado en caracteres de una lista de filas"""
+    return sum(len(str(value)) for row in rows for value in row.values()) + len(rows)
+
+
+class CollectionCache:
+    def __init__(self, max_entries: int = 5000, ttl_seconds: float = 600, max_chars: int = 20_000_000):
+        self._cache = TTLCache(
+            max_entries=max_entries,
+            ttl_seconds=ttl_seconds,
+            max_size=max_chars,
+            size_of=_rows_size,
+        )
+        # Cargas en curso: (tabla, user_id) -> Future
+        self._loading = {}
+        # (tabla, user_id) -> [generación, cargas en curso]; solo mientras hay cargas en curso
+        self._generations = {}
+
+    @classmethod
+    def from_env(cls) -> "CollectionCache":
+        return cls(
+            max_entries=int(os.getenv("COFFETTO_COLLECTION_CACHE_MAX_ENTRIES", "5000")),
+            ttl_seconds=float(os.getenv("COFFETTO_COLLECTION_CACHE_TTL_SECONDS", "600")),
+            max_chars=int(os.getenv("COFFETTO_COLLECTION_CACHE_MAX_CHARS", "20000000")),
+        )
+
+    async def get_or_load(self, table: str, user_id: str, loader) -> list:
+        """Retorna las filas cacheadas o las carga con `loader()` (awaitable)"""
+        key = (table, user_id)
+        rows = self._cache.get(key)
+        if rows is not None:
+            return rows
+
+        pending = self._loading.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._loading[key] = future
+        generation = self._generations.setdefault(key, [0, 0])
+        generation[1] += 1
+        loaded_generation = generation[0]
+        try:
+            rows = list(await loader())
+            # Si hubo una inserción durante la carga estas filas pueden no incluirla
+            if generation[0] == loaded_generation:
+                self._cache.set(key, rows)
+            future.set_result(rows)
+            return rows
+        except BaseException as e:
+            future.set_exception(e)
+            # Evita el aviso de excepción no recuperada si nadie más esperaba
+            future.exception()
+            raise
+        finally:
+            if self._loading.get(key) is future:
+                del self._loading[key]
+            generation[1] -= 1
+            if generation[1] == 0:
+                del self._generations[key]
+
+    def peek(self, table: str, user_id: str):
+        """Filas cacheadas de (tabla, user_id) sin cargarlas; None si no están"""
+        return self._cache.get((table, user_id))
+
+    def add_rows(self, table: str, user_id: str, rows: list) -> None:
+        """Agrega filas recién insertadas; si no hay datos devueltos se invalida"""
+        key = (table, user_id)
+        self._bump_generation(key)
+        cached = self._cache.pop(key)
+        if cached is not None and rows:
+            self._cache.set(key, cached + list(rows))
+
+    def invalidate(self, table: str, user_id: str) -> None:
+        key = (table, user_id)
+        self._bump_generation(key)
+        self._cache.pop(key)
+
+    def stats(self) -> dict:
+        return self._cache.stats()
+
+    # --- Internos ---
+    def _bump_generation(self, key: tuple) -> None:
+        """Descarta las cargas en curso de la clave (ver get_or_load)"""
+        generation = self._generations.get(key)
+        if generation is not None:
+            generation[0] += 1
+            # Las peticiones siguientes no se unen a la carga vieja
+            self._loading.pop(key, None)
@@ -0,0 +1,97 @@
+import time
+from collections import OrderedDict
+
+"""Caché en memoria con expiración (TTL) y expulsión LRU por tamaño.
+
+Se acota por número de entradas y, opcionalmente, por un tamaño aproximado
+calculado con `size_of(value)`. Lleva contadores de aciertos, fallos y
+expulsiones para exponer la tasa de aciertos.
+"""
+
+
+class TTLCache:
+    def __init__(
+        self,
+        max_entries: int = 1000,
+        ttl_seconds: float = 3600,
+        max_size: int = 0,
+        size_of=None,
+        clock=time.monotonic,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        # Tamaño total máximo (0 = sin límite) medido con size_of
+        self.max_size = max_size
+        self._size_of = size_of or (lambda value: 1)
+        self._clock = clock
+        # key -> (expira_en, tamaño, valor); el primero es el menos usado recientemente
+        self._entries = OrderedDict()
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key) -> bool:
+        entry = self._entries.get(key)
+        return entry is not None and entry[0] > self._clock()
+
+    def get(self, key, default=None):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        if entry[0] <= self._clock():
+            self._remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return default
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[2]
+
+    def set(self, key, value) -> None:
+        if key in self._entries:
+            self._remove(key)
+        size = self._size_of(value)
+        if self.max_size and size > self.max_size:
+            return
+        self._entries[key] = (self._clock() + self.ttl_seconds, size, value)
+        self._size += size
+        while len(self._entries) > self.max_entries or (self.max_size and self._size > self.max_size):
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def pop(self, key, default=None):
+        entry = self._entries.get(key)
+        if entry is None:
+            return default
+        self._remove(key)
+        return entry[2]
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._size = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "size": self._size,
+            "max_entries": self.max_entries,
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+    def _remove(self, key) -> None:
+        _, size, _ = self._entries.pop(key)
+        self._size -= size
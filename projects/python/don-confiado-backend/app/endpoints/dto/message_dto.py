@@ -10,4 +10,8 @@ class MessageDTO(BaseModel):
 
 class ChatRequestDTO(BaseModel):
     message: str
-    user_id: str
\ No newline at end of file
+    user_id: str
+    # "combined" | "multistep"; si se omite se usa COFFETTO_EXTRACTION_MODE
+    extraction_mode: Optional[str] = None
+    # Si es true la respuesta incluye "usage" con los tokens y el costo del turno
+    debug: bool = False
@@ -0,0 +1,18 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from fastapi_utils.cbv import cbv
+
+from warmup import get_warmup
+
+"""Disponibilidad del servicio para balanceadores y orquestadores."""
+
+health_webservice_api_router = APIRouter()
+
+
+@cbv(health_webservice_api_router)
+class HealthWebService:
+    @health_webservice_api_router.get("/ready")
+    async def ready(self):
+        # 503 hasta que el calentamiento del arranque construya el modelo y los prompts
+        status = get_warmup().status()
+        return JSONResponse(status, status_code=200 if status["ready"] else 503)
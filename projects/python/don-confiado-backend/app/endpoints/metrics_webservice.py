@@ -0,0 +1,16 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from fastapi_utils.cbv import cbv
+
+from metrics.stage_timing import render_metrics
+
+"""Exposición de métricas en formato de texto de Prometheus."""
+
+metrics_webservice_api_router = APIRouter()
+
+
+@cbv(metrics_webservice_api_router)
+class MetricsWebService:
+    @metrics_webservice_api_router.get("/metrics", response_class=PlainTextResponse)
+    async def metrics(self):
+        return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,58 @@
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI
+from ai.memory.conversation_log import close_conversation_log, init_conversation_log
+from ai.memory.session_store import close_session_store, init_session_store
+from ai.recommendation.coffee_index import close_coffee_index, init_coffee_index
+from business.repositories.coffee_repository import close_repository, init_repository
+from business.repositories.registration_queue import close_registration_queue, init_registration_queue
+from endpoints.hello_world_webservice import HelloWorldWebService, hello_webservice_api_router
+from endpoints.business_webservice import business_webservice_api_router
+from endpoints.chat_webservice import chat_webservice_api_router
+from endpoints.health_webservice import health_webservice_api_router
+from endpoints.metrics_webservice import metrics_webservice_api_router
+from warmup import close_warmup, start_warmup
+
+"""Aplicación FastAPI del backend de Coffetto.
+
+Se expone como `main:app` para que uvicorn pueda importarla en cada worker
+(ver tribu-main.py).
+"""
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Pool de conexiones a la base de datos compartido por todas las peticiones
+    repository = init_repository()
+    # Índice de similitud de cafés: se suscribe a las inserciones; el calentamiento lo carga
+    init_coffee_index(repository)
+    # Modelo, prompts de sistema y conexiones del pool se preparan en segundo plano (ver warmup.py y /ready)
+    start_warmup()
+    # Cola de registros con escritura diferida (COFFETTO_REGISTRATION_MODE=queued)
+    init_registration_queue()
+    # Sesiones compartidas entre workers (ver COFFETTO_SESSION_BACKEND)
+    init_session_store()
+    # Historial persistente con escritura diferida (ver COFFETTO_HISTORY_LOG_*)
+    init_conversation_log()
+    yield
+    await close_warmup()
+    await close_coffee_index()
+    # La cola se vacía antes de cerrar el pool de la base de datos
+    await close_registration_queue()
+    await close_repository()
+    await close_session_store()
+    # Escribir lo que quede en el búfer antes de salir
+    await close_conversation_log()
+
+
+def create_app() -> FastAPI:
+    app = FastAPI(lifespan=lifespan)
+    app.include_router(hello_webservice_api_router)
+    app.include_router(business_webservice_api_router)
+    app.include_router(chat_webservice_api_router)
+    app.include_router(metrics_webservice_api_router)
+    app.include_router(health_webservice_api_router)
+    return app
+
+
+app = create_app()
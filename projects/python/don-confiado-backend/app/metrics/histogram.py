@@ -0,0 +1,58 @@
+from bisect import bisect_left
+
+"""Histogramas en memoria con exposición en formato de texto de Prometheus.
+
+Implementación mínima (sin dependencias) de lo que necesita /metrics:
+cada serie guarda los conteos por cubeta, la suma y el total, y se
+acumulan al renderizar. Registrar una observación es un bisect y tres
+sumas, sin bloqueos: todo ocurre en el hilo del event loop.
+
+Las métricas son por proceso; con varios workers cada uno expone las suyas.
+"""
+
+# Cubetas en segundos: desde pasos locales (~1 ms) hasta llamadas lentas al LLM
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: tuple, buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # (valores de etiquetas) -> [conteos por cubeta (+Inf al final), suma]
+        self._series = {}
+
+    def observe(self, value: float, labelvalues: tuple) -> None:
+        series = self._series.get(labelvalues)
+        if series is None:
+            series = self._series[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0]
+        # Primera cubeta con límite >= value (semántica "le" de Prometheus)
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def clear(self) -> None:
+        self._series.clear()
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} histogram",
+        ]
+        for labelvalues, (counts, total) in sorted(self._series.items()):
+            labels = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, labelvalues))
+            prefix = f"{labels}," if labels else ""
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            cumulative += counts[-1]
+            lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {cumulative}')
+            suffix = f"{{{labels}}}" if labels else ""
+            lines.append(f"{self.name}_sum{suffix} {total}")
+            lines.append(f"{self.name}_count{suffix} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
@@ -0,0 +1,110 @@
+import contextvars
+import os
+from time import perf_counter
+
+from metrics.histogram import Histogram
+
+"""Tiempos por etapa del pipeline de chat, exportados como histogramas.
+
+Cada turno abre una traza (`start_trace`) en el contexto de la petición;
+las etapas se miden con `with span("extraction"): ...` en cualquier capa
+(endpoint, repositorio, generación de respuesta) sin pasar la traza como
+argumento. Al cerrar la traza (`finish_trace`) cada tramo se registra con
+la intención y el resultado del turno, que solo se conocen al final:
+
+    coffetto_stage_duration_seconds{stage, intent, outcome}
+    coffetto_request_duration_seconds{endpoint, intent, outcome}
+
+Fuera de una traza (scripts, tareas en segundo plano) `span` no registra
+nada. Medir un tramo cuesta un par de perf_counter y un append; los
+histogramas se actualizan una vez por turno.
+"""
+
+METRICS_ENABLED = os.getenv("COFFETTO_METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+
+STAGE_DURATION = Histogram(
+    "coffetto_stage_duration_seconds",
+    "Duración de cada etapa del pipeline de chat",
+    ("stage", "intent", "outcome"),
+)
+REQUEST_DURATION = Histogram(
+    "coffetto_request_duration_seconds",
+    "Duración total de un turno de chat",
+    ("endpoint", "intent", "outcome"),
+)
+
+_current_trace = contextvars.ContextVar("coffetto_request_trace", default=None)
+
+
+class RequestTrace:
+    __slots__ = ("endpoint", "intent", "started", "spans", "finished")
+
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self.intent = None
+        self.started = perf_counter()
+        # (etapa, segundos) en el orden en que terminaron
+        self.spans = []
+        self.finished = False
+
+
+class _Span:
+    __slots__ = ("name", "trace", "started")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.trace = _current_trace.get()
+        if self.trace is not None:
+            self.started = perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # Los tramos que terminan después de cerrar la traza no se registran
+        if self.trace is not None and not self.trace.finished:
+            self.trace.spans.append((self.name, perf_counter() - self.started))
+        return False
+
+
+def span(name: str) -> _Span:
+    """Mide el bloque `with` como la etapa `name` del turno en curso"""
+    return _Span(name)
+
+
+def start_trace(endpoint: str) -> RequestTrace:
+    """Abre la traza del turno en el contexto actual"""
+    trace = RequestTrace(endpoint)
+    _current_trace.set(trace)
+    return trace
+
+
+def label_intent(intent: str) -> None:
+    """Intención del turno en curso, para etiquetar sus tramos aunque el turno falle después"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.intent = intent
+
+
+def finish_trace(trace, outcome: str) -> None:
+    if trace is None or trace.finished:
+        return
+    trace.finished = True
+    if not METRICS_ENABLED:
+        return
+    elapsed = perf_counter() - trace.started
+    intent = trace.intent or "none"
+    for name, seconds in trace.spans:
+        STAGE_DURATION.observe(seconds, (name, intent, outcome))
+    REQUEST_DURATION.observe(elapsed, (trace.endpoint, intent, outcome))
+
+
+def untraced_context() -> contextvars.Context:
+    """Copia del contexto actual sin traza, para tareas que sobreviven a la petición"""
+    context = contextvars.copy_context()
+    context.run(_current_trace.set, None)
+    return context
+
+
+def render_metrics() -> str:
+    return STAGE_DURATION.render() + REQUEST_DURATION.render()
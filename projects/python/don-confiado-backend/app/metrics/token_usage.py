@@ -0,0 +1,180 @@
+import contextvars
+import os
+from collections import OrderedDict
+
+"""Contabilidad de tokens y costo de las llamadas a Gemini.
+
+`UsageCallbackHandler` (metrics/usage_callback.py) se registra como
+callback del modelo base, así que recibe el `usage_metadata` de todas las
+llamadas (ainvoke, astream y los runnables con salida estructurada, que
+comparten el modelo). Cada llamada se suma al consumo del turno en curso
+(`start_request_usage`), y al cerrar el turno el total se agrega al
+`UsageLedger` por intención y por usuario.
+
+Las llamadas que terminan después de cerrar su turno (p. ej. el resumen
+del historial en segundo plano) se cargan al mismo usuario con la
+intención "background".
+
+El costo es una estimación con los precios por millón de tokens de
+COFFETTO_PRICE_INPUT_PER_MTOK, COFFETTO_PRICE_CACHED_INPUT_PER_MTOK (tokens
+de entrada leídos de la caché de contexto) y COFFETTO_PRICE_OUTPUT_PER_MTOK (USD).
+"""
+
+PRICE_INPUT_PER_MTOK = float(os.getenv("COFFETTO_PRICE_INPUT_PER_MTOK", "0.30"))
+PRICE_CACHED_INPUT_PER_MTOK = float(os.getenv("COFFETTO_PRICE_CACHED_INPUT_PER_MTOK", "0.075"))
+PRICE_OUTPUT_PER_MTOK = float(os.getenv("COFFETTO_PRICE_OUTPUT_PER_MTOK", "2.50"))
+
+_current_usage = contextvars.ContextVar("coffetto_request_usage", default=None)
+
+
+class TokenUsage:
+    __slots__ = ("calls", "input_tokens", "cached_input_tokens", "output_tokens", "total_tokens")
+
+    def __init__(self):
+        self.calls = 0
+        # input_tokens incluye los leídos de la caché de contexto (cached_input_tokens)
+        self.input_tokens = 0
+        self.cached_input_tokens = 0
+        self.output_tokens = 0
+        self.total_tokens = 0
+
+    def add(
+        self, input_tokens: int, output_tokens: int, total_tokens: int, calls: int = 1, cached_input_tokens: int = 0
+    ) -> None:
+        self.calls += calls
+        self.input_tokens += input_tokens
+        self.cached_input_tokens += cached_input_tokens
+        self.output_tokens += output_tokens
+        self.total_tokens += total_tokens
+
+    def merge(self, other: "TokenUsage") -> None:
+        self.add(other.input_tokens, other.output_tokens, other.total_tokens, other.calls, other.cached_input_tokens)
+
+    @property
+    def cost_usd(self) -> float:
+        uncached = self.input_tokens - self.cached_input_tokens
+        return (
+            uncached * PRICE_INPUT_PER_MTOK
+            + self.cached_input_tokens * PRICE_CACHED_INPUT_PER_MTOK
+            + self.output_tokens * PRICE_OUTPUT_PER_MTOK
+        ) / 1_000_000
+
+    def as_dict(self) -> dict:
+        return {
+            "calls": self.calls,
+            "input_tokens": self.input_tokens,
+            "cached_input_tokens": self.cached_input_tokens,
+            "output_tokens": self.output_tokens,
+            "total_tokens": self.total_tokens,
+            "cost_usd": round(self.cost_usd, 6),
+        }
+
+
+class RequestUsage(TokenUsage):
+    """Consumo de un turno, con el detalle de cada llamada"""
+
+    __slots__ = ("user_id", "intent", "call_log", "finished")
+
+    def __init__(self, user_id: str):
+        super().__init__()
+        self.user_id = user_id
+        self.intent = None
+        # [{"model", "input_tokens", "cached_input_tokens", "output_tokens", "total_tokens"}, ...]
+        self.call_log = []
+        self.finished = False
+
+    def as_dict(self) -> dict:
+        return {**super().as_dict(), "by_call": list(self.call_log)}
+
+
+class UsageLedger:
+    def __init__(self, max_users: int = 10000):
+        # Acotado en usuarios: se descarta el que lleva más tiempo sin consumir
+        self.max_users = max_users
+        self.totals = TokenUsage()
+        self.requests = 0
+        self._by_intent = {}
+        self._by_user = OrderedDict()
+
+    @classmethod
+    def from_env(cls) -> "UsageLedger":
+        return cls(max_users=int(os.getenv("COFFETTO_USAGE_MAX_USERS", "10000")))
+
+    def record(self, user_id: str, intent: str, usage: TokenUsage) -> None:
+        self.totals.merge(usage)
+        self._by_intent.setdefault(intent or "none", TokenUsage()).merge(usage)
+        user_usage = self._by_user.pop(user_id, None) or TokenUsage()
+        user_usage.merge(usage)
+        self._by_user[user_id] = user_usage
+        if len(self._by_user) > self.max_users:
+            self._by_user.popitem(last=False)
+
+    def user(self, user_id: str):
+        usage = self._by_user.get(user_id)
+        return usage.as_dict() if usage is not None else None
+
+    def stats(self, top_users: int = 20) -> dict:
+        heaviest = sorted(self._by_user.items(), key=lambda item: item[1].total_tokens, reverse=True)[:top_users]
+        return {
+            "requests": self.requests,
+            "totals": self.totals.as_dict(),
+            "avg_tokens_per_request": round(self.totals.total_tokens / self.requests, 1) if self.requests else 0,
+            "by_intent": {intent: usage.as_dict() for intent, usage in sorted(self._by_intent.items())},
+            "tracked_users": len(self._by_user),
+            "top_users": [{"user_id": user_id, **usage.as_dict()} for user_id, usage in heaviest],
+            "prices_per_mtok_usd": {
+                "input": PRICE_INPUT_PER_MTOK,
+                "cached_input": PRICE_CACHED_INPUT_PER_MTOK,
+                "output": PRICE_OUTPUT_PER_MTOK,
+            },
+        }
+
+
+_ledger = UsageLedger.from_env()
+
+
+def get_usage_ledger() -> UsageLedger:
+    return _ledger
+
+
+def start_request_usage(user_id: str) -> RequestUsage:
+    """Abre el acumulador de tokens del turno en el contexto actual"""
+    usage = RequestUsage(user_id)
+    _current_usage.set(usage)
+    return usage
+
+
+def finish_request_usage(usage: RequestUsage, intent: str) -> None:
+    if usage.finished:
+        return
+    usage.finished = True
+    usage.intent = intent
+    _ledger.requests += 1
+    _ledger.record(usage.user_id, intent, usage)
+
+
+def record_usage(usage_metadata: dict, model: str = None) -> None:
+    """Suma el usage_metadata de una llamada al turno en curso (o al libro si ya cerró)"""
+    input_tokens = int(usage_metadata.get("input_tokens") or 0)
+    output_tokens = int(usage_metadata.get("output_tokens") or 0)
+    total_tokens = int(usage_metadata.get("total_tokens") or input_tokens + output_tokens)
+    cached_input_tokens = int((usage_metadata.get("input_token_details") or {}).get("cache_read") or 0)
+    usage = _current_usage.get()
+    if usage is None:
+        # Fuera de un turno (scripts, arranque): solo cuenta en los totales
+        _ledger.totals.add(input_tokens, output_tokens, total_tokens, cached_input_tokens=cached_input_tokens)
+        return
+    if usage.finished:
+        late = TokenUsage()
+        late.add(input_tokens, output_tokens, total_tokens, cached_input_tokens=cached_input_tokens)
+        _ledger.record(usage.user_id, "background", late)
+        return
+    usage.add(input_tokens, output_tokens, total_tokens, cached_input_tokens=cached_input_tokens)
+    usage.call_log.append({
+        "model": model,
+        "input_tokens": input_tokens,
+        "cached_input_tokens": cached_input_tokens,
+        "output_tokens": output_tokens,
+        "total_tokens": total_tokens,
+    })
+
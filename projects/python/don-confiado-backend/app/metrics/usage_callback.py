@@ -0,0 +1,23 @@
+from langchain_core.callbacks import BaseCallbackHandler
+
+from metrics.token_usage import record_usage
+
+"""Callback de LangChain que alimenta la contabilidad de tokens.
+
+Va en su propio módulo para que importar `metrics.token_usage` no cargue
+langchain_core: solo se importa al construir el modelo (ai/llm_registry.py).
+"""
+
+
+class UsageCallbackHandler(BaseCallbackHandler):
+    # Se ejecuta en el mismo hilo y contexto de la llamada para ver el turno en curso
+    run_inline = True
+
+    def on_llm_end(self, response, **kwargs) -> None:
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                usage_metadata = getattr(message, "usage_metadata", None)
+                if usage_metadata:
+                    model = (getattr(message, "response_metadata", None) or {}).get("model_name")
+                    record_usage(usage_metadata, model)
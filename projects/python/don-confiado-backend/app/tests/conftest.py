@@ -0,0 +1,39 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+"""Configuración de pytest para las pruebas del backend.
+
+Las pruebas importan los módulos de la app (ai, business, cache...) igual
+que uvicorn, desde app/. Sin credenciales reales: la base es la de memoria
+y la API key de Gemini es de prueba, así que ninguna prueba sale a la red.
+
+Uso (desde app/):
+    python -m pytest -q tests
+"""
+
+os.environ.setdefault("COFFETTO_DB_BACKEND", "memory")
+os.environ.setdefault("GOOGLE_API_KEY", "test-dummy-key")
+
+
+class FakeClock:
+    """Reloj controlado por la prueba (para los parámetros `clock=` de almacenes y colas)"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock() -> FakeClock:
+    return FakeClock()
+
+
+def node_statuses(trace) -> dict:
+    """Nodo -> resultado (ran, cached, skipped, cancelled) de un GraphTrace"""
+    return {node["node"]: node["status"] for node in trace.as_dict()["nodes"]}
@@ -0,0 +1,91 @@
+import asyncio
+
+import pytest
+
+from ai import llm_registry
+from ai.agents.agent00 import graph as chat_graph
+from ai.llm_registry import LLMRegistry
+from ai.memory.conversation_history import ConversationHistory
+from benchmarks.fake_llm import FakeChatModel
+from ai.collection_views import COLLECTION_VIEWS
+from business.repositories.coffee_repository import BREWING_METHODS_TABLE
+from conftest import node_statuses
+
+"""Flujo de chat v1.1: lectura anticipada de colecciones según el pre-clasificador local."""
+
+
+class FakeClassifier:
+    """Pre-clasificador con una etiqueta fija y confianza por debajo del umbral (decide el LLM)"""
+
+    threshold = 0.9
+
+    def __init__(self, label: str, confidence: float = 0.5):
+        self.label = label
+        self.confidence = confidence
+
+    def classify(self, text: str) -> tuple:
+        return self.label, self.confidence, "ngram"
+
+
+@pytest.fixture
+def prefetched(monkeypatch):
+    # Modelo falso sin red; monkeypatch restaura el registro global al terminar
+    monkeypatch.setattr(llm_registry, "_registry", LLMRegistry(FakeChatModel(latency_seconds=0.01)))
+    reads = []
+
+    async def fake_prefetch(table, user_id):
+        reads.append(table)
+
+    async def fake_page(view, user_id, page, page_size):
+        reads.append((view["columns"], page))
+        return {"status": "success", "rows": [], "has_more": False}
+
+    monkeypatch.setattr(chat_graph, "prefetch_collection", fake_prefetch)
+    monkeypatch.setattr(chat_graph, "collection_page", fake_page)
+    return reads
+
+
+def _run(graph: chat_graph.ChatGraph, message: str) -> tuple:
+    history = ConversationHistory()
+    history.append("human", message)
+    return asyncio.run(graph.run("u", message, "multistep", history, history.as_text()))
+
+
+def test_show_intent_prefetches_only_the_first_projected_page(prefetched):
+    graph = chat_graph.ChatGraph(FakeClassifier("Show_my_coffees"), shadow_rate=0, prefetch_collections=True)
+
+    result, trace = _run(graph, "muéstrame mis cafés")
+
+    assert result["userintention"] == "Show_my_coffees"
+    # fetch_collection reutiliza la página leída por adelantado: una sola lectura, sin la colección completa
+    assert prefetched == [(COLLECTION_VIEWS["Show_my_coffees"]["columns"], 0)]
+    assert node_statuses(trace)["prefetch"] == "ran"
+
+
+def test_recommend_intent_prefetches_its_table(prefetched):
+    graph = chat_graph.ChatGraph(FakeClassifier("Recommend_brewing"), shadow_rate=0, prefetch_collections=True)
+
+    result, trace = _run(graph, "como preparar mi café")
+
+    assert result["userintention"] == "Recommend_brewing"
+    assert prefetched[0] == BREWING_METHODS_TABLE
+    assert node_statuses(trace)["prefetch"] == "ran"
+
+
+def test_possible_registration_is_not_prefetched(prefetched):
+    graph = chat_graph.ChatGraph(FakeClassifier("Register_coffee"), shadow_rate=0, prefetch_collections=True)
+
+    result, trace = _run(graph, "quiero registrar un café")
+
+    assert result["userintention"] == "Register_coffee"
+    assert prefetched == []
+    assert node_statuses(trace)["prefetch"] == "skipped"
+
+
+def test_unknown_label_is_not_prefetched(prefetched):
+    graph = chat_graph.ChatGraph(FakeClassifier("Other"), shadow_rate=0, prefetch_collections=True)
+
+    _, trace = _run(graph, "¿qué es un proceso honey?")
+
+    assert prefetched == []
+    assert node_statuses(trace)["prefetch"] == "skipped"
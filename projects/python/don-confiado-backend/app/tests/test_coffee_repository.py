@@ -0,0 +1,53 @@
+import asyncio
+
+from business.repositories.backends import InMemoryBackend
+from business.repositories.coffee_repository import COFFEES_TABLE, CoffeeRepository
+from cache.collection_cache import CollectionCache
+
+"""Repositorio de cafés: páginas leídas de la base y recortadas de la caché."""
+
+COLUMNS = ("id", "nombre_cafe")
+
+
+def _repository_with_unordered_rows() -> CoffeeRepository:
+    backend = InMemoryBackend()
+    # Filas guardadas fuera de orden, como puede devolverlas PostgREST sin `order`
+    backend.tables[COFFEES_TABLE] = [
+        {"id": row_id, "user_id": "u", "nombre_cafe": f"Café {row_id}"} for row_id in (5, 2, 9, 1, 7, 3, 8, 4, 6)
+    ]
+    return CoffeeRepository(backend, CollectionCache())
+
+
+async def _all_pages(repository: CoffeeRepository, page_size: int) -> list:
+    rows, page, has_more = [], 0, True
+    while has_more:
+        page_rows, has_more = await repository.list_coffees_page("u", COLUMNS, page, page_size)
+        rows.extend(page_rows)
+        page += 1
+    return rows
+
+
+def test_cached_pages_match_database_pages():
+    async def scenario():
+        repository = _repository_with_unordered_rows()
+        from_database = await _all_pages(repository, page_size=4)
+
+        # Una recomendación deja la colección completa en caché; las páginas salen de ahí
+        await repository.list_coffees("u")
+        from_cache = await _all_pages(repository, page_size=4)
+
+        assert [row["id"] for row in from_database] == list(range(1, 10))
+        assert from_cache == from_database
+
+    asyncio.run(scenario())
+
+
+def test_page_one_from_database_then_page_two_from_cache():
+    async def scenario():
+        repository = _repository_with_unordered_rows()
+        first, _ = await repository.list_coffees_page("u", COLUMNS, 0, 4)
+        await repository.list_coffees("u")
+        second, _ = await repository.list_coffees_page("u", COLUMNS, 1, 4)
+        assert [row["id"] for row in first + second] == list(range(1, 9))
+
+    asyncio.run(scenario())
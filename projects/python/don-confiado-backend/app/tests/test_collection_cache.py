@@ -0,0 +1,128 @@
+import asyncio
+
+import pytest
+
+from cache.collection_cache import CollectionCache
+
+"""Caché de colecciones: cargas compartidas y cargas que cruzan una inserción."""
+
+TABLE = "cafes"
+
+
+class SlowLoader:
+    """Loader que lee las filas al empezar y responde cuando se le indica"""
+
+    def __init__(self, table_rows: list):
+        self.table_rows = table_rows
+        self.calls = 0
+        self.release = asyncio.Event()
+
+    async def __call__(self) -> list:
+        self.calls += 1
+        snapshot = list(self.table_rows)
+        await self.release.wait()
+        return snapshot
+
+
+def test_concurrent_loads_share_one_query():
+    async def scenario():
+        cache = CollectionCache()
+        loader = SlowLoader([{"id": 1}])
+        first = asyncio.create_task(cache.get_or_load(TABLE, "u", loader))
+        second = asyncio.create_task(cache.get_or_load(TABLE, "u", loader))
+        await asyncio.sleep(0)
+        loader.release.set()
+        assert await first == await second == [{"id": 1}]
+        assert loader.calls == 1
+        assert cache.peek(TABLE, "u") == [{"id": 1}]
+
+    asyncio.run(scenario())
+
+
+@pytest.mark.parametrize("change", ["add_rows", "invalidate"])
+def test_load_that_overlaps_an_insert_is_not_cached(change):
+    async def scenario():
+        cache = CollectionCache()
+        table_rows = []
+        loader = SlowLoader(table_rows)
+        # La carga lee la tabla vacía y se queda en vuelo
+        stale = asyncio.create_task(cache.get_or_load(TABLE, "u", loader))
+        await asyncio.sleep(0)
+
+        # Mientras tanto se inserta un café
+        inserted = {"id": 1, "nombre_cafe": "Finca Uno"}
+        table_rows.append(inserted)
+        if change == "add_rows":
+            cache.add_rows(TABLE, "u", [inserted])
+        else:
+            cache.invalidate(TABLE, "u")
+
+        loader.release.set()
+        assert await stale == []
+        assert cache.peek(TABLE, "u") is None
+
+        # La siguiente lectura vuelve a la base y ve la inserción
+        fresh = SlowLoader(table_rows)
+        fresh.release.set()
+        assert await cache.get_or_load(TABLE, "u", fresh) == [inserted]
+        assert cache.peek(TABLE, "u") == [inserted]
+
+    asyncio.run(scenario())
+
+
+def test_reader_after_insert_does_not_join_the_stale_load():
+    async def scenario():
+        cache = CollectionCache()
+        table_rows = []
+        stale_loader = SlowLoader(table_rows)
+        stale = asyncio.create_task(cache.get_or_load(TABLE, "u", stale_loader))
+        await asyncio.sleep(0)
+
+        inserted = {"id": 1}
+        table_rows.append(inserted)
+        cache.add_rows(TABLE, "u", [inserted])
+
+        fresh_loader = SlowLoader(table_rows)
+        fresh = asyncio.create_task(cache.get_or_load(TABLE, "u", fresh_loader))
+        await asyncio.sleep(0)
+        assert fresh_loader.calls == 1
+
+        # La carga nueva termina primero y la vieja después: la vieja no pisa a la nueva
+        fresh_loader.release.set()
+        assert await fresh == [inserted]
+        stale_loader.release.set()
+        assert await stale == []
+        assert cache.peek(TABLE, "u") == [inserted]
+        assert cache._generations == {} and cache._loading == {}
+
+    asyncio.run(scenario())
+
+
+def test_add_rows_appends_to_cached_collection():
+    async def scenario():
+        cache = CollectionCache()
+        loader = SlowLoader([{"id": 1}])
+        loader.release.set()
+        await cache.get_or_load(TABLE, "u", loader)
+        cache.add_rows(TABLE, "u", [{"id": 2}])
+        assert cache.peek(TABLE, "u") == [{"id": 1}, {"id": 2}]
+        # Sin filas devueltas por la inserción se invalida
+        cache.add_rows(TABLE, "u", [])
+        assert cache.peek(TABLE, "u") is None
+
+    asyncio.run(scenario())
+
+
+def test_failed_load_is_not_cached_and_propagates():
+    async def scenario():
+        cache = CollectionCache()
+
+        async def failing():
+            raise RuntimeError("sin conexión")
+
+        with pytest.raises(RuntimeError):
+            await cache.get_or_load(TABLE, "u", failing)
+        assert cache.peek(TABLE, "u") is None
+        assert cache._loading == {} and cache._generations == {}
+
+    asyncio.run(scenario())
@@ -0,0 +1,56 @@
+from ai.memory.conversation_history import ConversationHistory
+
+"""Transcripción del historial: líneas por mensaje unidas solo al pedirlas."""
+
+_PREFIXES = {"human": "Usuario: ", "ai": "Asistente: "}
+
+
+def _rendered(messages) -> str:
+    return "\n".join(f"{_PREFIXES[m['role']]}{m['content']}" for m in messages if m["role"] in _PREFIXES)
+
+
+def _history(*messages) -> ConversationHistory:
+    history = ConversationHistory()
+    for role, content in messages:
+        history.append(role, content)
+    return history
+
+
+def test_transcript_matches_full_render_after_appends_and_trims():
+    history = _history(("human", "hola"), ("system", "oculto"), ("ai", "¡Hola!"), ("human", "mis cafés"))
+    assert history.as_text() == _rendered(history)
+
+    history.append("ai", "Tienes 2 cafés")
+    history.drop_oldest(2)
+    assert history.as_text() == _rendered(history) == "Asistente: ¡Hola!\nUsuario: mis cafés\nAsistente: Tienes 2 cafés"
+
+    history.drop_newest(1)
+    assert history.as_text() == _rendered(history)
+    history.drop_newest(5)
+    assert history.as_text() == "" and history.chars == 0
+
+
+def test_join_is_cached_until_the_history_changes():
+    history = _history(("human", "hola"), ("ai", "¡Hola!"))
+
+    first = history.as_text()
+    assert history.as_text() is first
+    history.append("system", "no se muestra")
+    assert history.as_text() is first
+    history.append("human", "gracias")
+    assert history.as_text() is not first and history.as_text().endswith("Usuario: gracias")
+
+
+def test_text_range_and_tail_use_absolute_sequences():
+    history = _history(("human", "uno"), ("ai", "dos"), ("human", "tres"), ("ai", "cuatro"))
+    history.drop_oldest(1)
+
+    assert history.text_range(2, 4) == "Usuario: tres\nAsistente: cuatro"
+    assert history.text_range(0) == history.as_text()
+    assert history.text_range(4) == ""
+    # "Asistente: cuatro" (17) cabe sola; con "Usuario: tres" (13 + separador) ya no
+    assert history.tail_start_seq(20) == 3
+    assert history.tail_start_seq(60) == 1
+    assert history.tail_start_seq(60, floor_seq=2) == 2
+    # El último mensaje se incluye aunque no quepa
+    assert history.tail_start_seq(5) == 3
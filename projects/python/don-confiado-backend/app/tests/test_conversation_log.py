@@ -0,0 +1,135 @@
+import asyncio
+import json
+
+from ai.memory.conversation_log import ConversationLog
+
+"""Registro persistente de conversaciones: escritura en lotes, compactación y recuperación."""
+
+
+def _log(tmp_path, **options) -> ConversationLog:
+    return ConversationLog(str(tmp_path / "conversations"), **options)
+
+
+def _lines(log: ConversationLog, user_id: str) -> list:
+    with open(log._path(user_id), encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_records_are_written_in_one_batch_on_flush(tmp_path):
+    log = _log(tmp_path)
+    # Sin event loop no hay tarea de fondo: todo queda en el búfer hasta flush()
+    log.append("u", 0, "human", "hola")
+    log.append("u", 1, "ai", "¡Hola!")
+    log.save_state("u", {"pending_intent": None})
+    assert log.stats()["pending_records"] == 3
+
+    asyncio.run(log.flush())
+
+    assert log.stats()["pending_records"] == 0
+    assert (log.flushes, log.written_records) == (1, 3)
+    assert _lines(log, "u")[-1] == {"state": {"pending_intent": None}}
+
+
+def test_background_task_flushes_after_interval_and_on_full_batch(tmp_path):
+    log = _log(tmp_path, flush_interval_seconds=0.05, batch_size=3)
+
+    async def scenario():
+        log.append("u", 0, "human", "hola")
+        await asyncio.sleep(0.2)
+        assert log.written_records == 1
+        # Un lote lleno despierta la tarea sin esperar el intervalo
+        log.flush_interval_seconds = 60
+        await asyncio.sleep(0.1)
+        log.append("u", 1, "ai", "¡Hola!")
+        log.append("u", 2, "human", "mis cafés")
+        await asyncio.sleep(0.1)
+        assert log.written_records == 1
+        log.append("u", 3, "ai", "Tienes 2 cafés")
+        await asyncio.sleep(0.2)
+        assert log.written_records == 4
+        await log.close()
+
+    asyncio.run(scenario())
+
+
+def test_load_includes_buffered_records(tmp_path):
+    log = _log(tmp_path)
+    log.append("u", 0, "human", "hola")
+    asyncio.run(log.flush())
+    log.append("u", 1, "ai", "¡Hola!")
+
+    first_seq, messages, _ = asyncio.run(log.load("u"))
+
+    assert first_seq == 0
+    assert [message["content"] for message in messages] == ["hola", "¡Hola!"]
+
+
+def test_recovery_skips_truncated_line_and_keeps_latest_records(tmp_path):
+    log = _log(tmp_path)
+    log.append("u", 0, "human", "hola")
+    log.append("u", 1, "ai", "respuesta vieja")
+    log.save_state("u", {"pending_intent": "Register_coffee"})
+    # Reescritura de la misma secuencia (p. ej. un turno reubicado): gana la última
+    log.append("u", 1, "ai", "respuesta nueva")
+    asyncio.run(log.flush())
+    with open(log._path("u"), "a", encoding="utf-8") as f:
+        f.write('{"seq": 2, "role": "hum')
+
+    # Un proceso nuevo (tras una caída) lee el mismo directorio
+    first_seq, messages, state = asyncio.run(_log(tmp_path).load("u"))
+
+    assert first_seq == 0
+    assert [message["content"] for message in messages] == ["hola", "respuesta nueva"]
+    assert state == {"pending_intent": "Register_coffee"}
+    assert asyncio.run(_log(tmp_path).load("otro")) is None
+
+
+def test_recovery_returns_most_recent_contiguous_messages(tmp_path):
+    log = _log(tmp_path, max_messages=3)
+    for seq in (0, 1, 5, 6, 7, 8):
+        log.append("u", seq, "human", f"m{seq}")
+    asyncio.run(log.flush())
+
+    first_seq, messages, _ = asyncio.run(log.load("u"))
+
+    assert first_seq == 6
+    assert [message["content"] for message in messages] == ["m6", "m7", "m8"]
+
+
+def test_large_file_is_compacted_to_recent_messages_and_state(tmp_path):
+    log = _log(tmp_path, max_messages=2, max_file_bytes=200)
+    for seq in range(10):
+        log.append("u", seq, "human", f"mensaje número {seq}")
+    log.save_state("u", {"summary": "resumen"})
+
+    asyncio.run(log.flush())
+
+    assert log.compactions == 1
+    assert _lines(log, "u") == [
+        {"seq": 8, "role": "human", "content": "mensaje número 8"},
+        {"seq": 9, "role": "human", "content": "mensaje número 9"},
+        {"state": {"summary": "resumen"}},
+    ]
+
+
+def test_failed_flush_keeps_records_in_order_for_next_flush(tmp_path, monkeypatch):
+    log = _log(tmp_path)
+    write_batch = log._write_batch
+    calls = []
+
+    def flaky_write(batch):
+        calls.append(len(batch))
+        if len(calls) == 1:
+            raise OSError("disco lleno")
+        write_batch(batch)
+
+    monkeypatch.setattr(log, "_write_batch", flaky_write)
+    log.append("u", 0, "human", "hola")
+    asyncio.run(log.flush())
+    assert log.flush_failures == 1 and log.stats()["pending_records"] == 1
+
+    log.append("u", 1, "ai", "¡Hola!")
+    asyncio.run(log.flush())
+
+    assert calls == [1, 2]
+    assert [line["content"] for line in _lines(log, "u")] == ["hola", "¡Hola!"]
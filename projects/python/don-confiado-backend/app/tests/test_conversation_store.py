@@ -0,0 +1,89 @@
+from ai.memory.conversation_store import ConversationStore
+
+"""Límites del almacén de conversaciones: expulsión de usuarios y recorte por usuario."""
+
+
+def _store(**limits) -> ConversationStore:
+    options = {
+        "max_users": 100,
+        "max_total_chars": 1_000_000,
+        "idle_ttl_seconds": 0,
+        "max_messages_per_user": 100,
+        "max_chars_per_user": 100_000,
+    }
+    options.update(limits)
+    return ConversationStore(**options)
+
+
+def test_lru_evicts_least_recently_used_user():
+    store = _store(max_users=2)
+    store.append("a", "human", "hola")
+    store.append("b", "human", "hola")
+    # "a" se usa de nuevo: el menos reciente pasa a ser "b"
+    store.get("a")
+    store.append("c", "human", "hola")
+
+    assert "a" in store and "c" in store and "b" not in store
+    assert store.stats()["evictions"]["lru"] == 1
+    assert store.stats()["messages"] == 2
+
+
+def test_idle_users_expire_after_ttl(clock):
+    store = ConversationStore(idle_ttl_seconds=60, clock=clock)
+    store.append("a", "human", "hola")
+    clock.now = 30
+    store.append("b", "human", "hola")
+    clock.now = 70
+    store.get("b")
+
+    assert "a" not in store and "b" in store
+    assert store.stats()["evictions"]["idle_ttl"] == 1
+
+
+def test_trims_oldest_messages_over_message_cap():
+    store = _store(max_messages_per_user=3)
+    for i in range(5):
+        store.append("a", "human", f"mensaje {i}")
+
+    history = store.get("a")
+    assert [message["content"] for message in history] == ["mensaje 2", "mensaje 3", "mensaje 4"]
+    assert history.start_seq == 2
+    assert store.stats()["trimmed_messages"] == 2
+    assert store.stats()["messages"] == 3
+
+
+def test_trim_by_chars_keeps_last_message_even_if_too_long():
+    store = _store(max_chars_per_user=10)
+    store.append("a", "human", "corto")
+    store.append("a", "ai", "x" * 50)
+
+    history = store.get("a")
+    assert len(history) == 1
+    assert history[0]["content"] == "x" * 50
+    assert store.stats()["chars"] == 50
+
+
+def test_memory_cap_evicts_other_users_but_not_the_current_one():
+    store = _store(max_total_chars=100)
+    store.append("a", "human", "a" * 40)
+    store.append("b", "human", "b" * 40)
+    store.append("c", "human", "c" * 40)
+
+    assert "a" not in store and "b" in store and "c" in store
+    assert store.stats()["evictions"]["memory"] == 1
+    assert store.stats()["chars"] == 80
+
+    # Un solo usuario por encima del tope no se expulsa a sí mismo
+    store.append("c", "ai", "c" * 200)
+    assert "c" in store
+
+
+def test_counters_stay_consistent_after_remove():
+    store = _store()
+    store.append("a", "human", "hola")
+    store.append("a", "ai", "buenas")
+    store.remove("a")
+
+    assert len(store) == 0
+    assert store.stats()["messages"] == 0
+    assert store.stats()["chars"] == 0
@@ -0,0 +1,46 @@
+import pytest
+
+from ai.intent.fast_classifier import FastIntentClassifier
+
+"""Pre-clasificador local: qué decide sin el LLM y qué le deja."""
+
+classifier = FastIntentClassifier(threshold=0.9)
+
+
+@pytest.mark.parametrize("message, wrong_label", [
+    ("qué opinas de mis cafés", "Show_my_coffees"),
+    ("me recomiendas un libro sobre cafe", "Recommend_coffee"),
+    ("¿cómo hago para registrar un café?", "Register_coffee"),
+    ("¿Cómo guardar el café para que no pierda aroma?", "Register_coffee"),
+    ("recomiéndame un método para mi café", "Recommend_coffee"),
+])
+def test_questions_that_mention_keywords_go_to_the_llm(message, wrong_label):
+    label, confidence, _ = classifier.classify(message)
+    assert confidence < classifier.threshold, (message, label, confidence)
+
+
+@pytest.mark.parametrize("message, expected", [
+    ("hola", "Other"),
+    ("muéstrame mis cafés", "Show_my_coffees"),
+    ("que cafes tengo registrados", "Show_my_coffees"),
+    ("muéstrame mis métodos", "Show_my_brewing_methods"),
+    ("quiero registrar un café", "Register_coffee"),
+    ("quiero guardar mi método V60 ratio 1:16 en tres vertidos", "Register_brewing_method"),
+    ("recomiéndame un café parecido a los que me gustan", "Recommend_coffee"),
+    ("¿cómo preparar un café natural para resaltar el dulzor?", "Recommend_brewing"),
+])
+def test_clear_requests_take_the_fast_path(message, expected):
+    label, confidence, _ = classifier.classify(message)
+    assert label == expected
+    assert confidence >= classifier.threshold
+
+
+def test_keyword_rule_needs_the_model_to_agree():
+    # Un modelo entrenado para ver "mis cafes" como charla no respalda la regla de listado
+    disagreeing = FastIntentClassifier(examples={
+        "Other": ["muestrame mis cafes favoritos por favor", "cuentame algo de cafe"],
+        "Show_my_coffees": ["lista de registros guardados"],
+    })
+    label, confidence, source = disagreeing.classify("muéstrame mis cafés favoritos")
+    assert source == "ngram"
+    assert label == "Other"
@@ -0,0 +1,37 @@
+import asyncio
+
+import pytest
+
+from ai.prompt_registry import ContextCacheProvider, PromptRegistry, build_prompt_registry
+
+"""Registro de prompts: modos de COFFETTO_PROMPT_CACHE y prompts por debajo del mínimo de la caché."""
+
+
+class RecordingProvider(ContextCacheProvider):
+    def __init__(self, min_tokens: int):
+        self.min_tokens = min_tokens
+        self.created = []
+
+    async def create(self, prompt, ttl_seconds: float) -> str:
+        self.created.append(prompt.name)
+        return f"cachedContents/{prompt.name}"
+
+
+def test_local_cache_mode_is_not_accepted(monkeypatch):
+    # El sustituto en memoria solo existe en los benchmarks: con el modelo real fallaría cada llamada
+    monkeypatch.setenv("COFFETTO_PROMPT_CACHE", "local")
+    with pytest.raises(ValueError):
+        build_prompt_registry()
+
+
+def test_warm_reports_prompts_below_the_minimum_once(capsys):
+    provider = RecordingProvider(min_tokens=50)
+    registry = PromptRegistry(prompts={"corto": "Eres Coffetto.", "largo": "Eres Coffetto. " * 40}, provider=provider)
+
+    asyncio.run(registry.warm())
+
+    output = capsys.readouterr().out
+    assert output.count("Caché de contexto omitida") == 1 and "corto" in output
+    assert provider.created == ["largo"]
+    messages, kwargs = asyncio.run(registry.request("corto", "hola"))
+    assert kwargs == {} and len(messages) == 2
@@ -0,0 +1,188 @@
+import asyncio
+import json
+
+import httpx
+
+from business.repositories import registration_queue
+from business.repositories.backends import PostgrestBackend
+from business.repositories.coffee_repository import BREWING_METHODS_TABLE, COFFEES_TABLE, CoffeeRepository
+from business.repositories.registration_queue import RegistrationQueue
+
+"""Cola de registros: inserción en lotes, reintentos con espera exponencial y dead-letter."""
+
+
+class FakeRepository:
+    """Rechaza el lote completo si alguna fila trae "invalid" (como un error de la base de datos)"""
+
+    def __init__(self):
+        self.calls = []
+
+    async def insert_coffees(self, records: list) -> list:
+        return self._insert(COFFEES_TABLE, records)
+
+    async def insert_brewing_methods(self, records: list) -> list:
+        return self._insert(BREWING_METHODS_TABLE, records)
+
+    def _insert(self, table: str, records: list) -> list:
+        self.calls.append((table, [record["nombre"] for record in records]))
+        if any(record.get("invalid") for record in records):
+            raise ValueError("fila inválida")
+        return records
+
+
+class StrictPostgrest:
+    """Imita a PostgREST: un arreglo con objetos de llaves distintas necesita ?columns= (PGRST102)"""
+
+    def __init__(self):
+        self.requests = []
+        self._ids = 0
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        rows = json.loads(request.content)
+        self.requests.append((request.url.params.get("columns"), len(rows)))
+        columns = request.url.params.get("columns")
+        if columns is None:
+            if len({frozenset(row) for row in rows}) > 1:
+                return httpx.Response(400, json={"code": "PGRST102", "message": "All object keys must match"})
+            columns = ",".join(rows[0])
+        inserted = []
+        for row in rows:
+            self._ids += 1
+            inserted.append({"id": self._ids, **{column: row.get(column) for column in columns.split(",")}})
+        return httpx.Response(201, json=inserted)
+
+
+def _postgrest_repository(server: StrictPostgrest) -> CoffeeRepository:
+    backend = PostgrestBackend("http://supabase.test", "test-key")
+    backend._client = httpx.AsyncClient(
+        base_url="http://supabase.test/rest/v1", transport=httpx.MockTransport(server.handle)
+    )
+    return CoffeeRepository(backend)
+
+
+def _queue(tmp_path, clock, **options) -> RegistrationQueue:
+    # Intervalo largo: el worker de fondo no interviene, los flush se llaman a mano
+    options.setdefault("flush_interval_seconds", 60)
+    return RegistrationQueue(dead_letter_path=str(tmp_path / "dead_letter.jsonl"), clock=clock, **options)
+
+
+def _coffee(name: str, user_id: str = "u", invalid: bool = False) -> dict:
+    record = {"user_id": user_id, "nombre": name}
+    if invalid:
+        record["invalid"] = True
+    return record
+
+
+def test_records_are_inserted_in_one_batch_per_table(tmp_path, monkeypatch, clock):
+    repository = FakeRepository()
+    monkeypatch.setattr(registration_queue, "get_repository", lambda: repository)
+    queue = _queue(tmp_path, clock)
+
+    async def scenario():
+        for name in ("Geisha", "Bourbon", "Caturra"):
+            queue.enqueue(COFFEES_TABLE, _coffee(name))
+        queue.enqueue(BREWING_METHODS_TABLE, _coffee("V60"))
+        await queue.flush()
+        await queue.close()
+
+    asyncio.run(scenario())
+
+    assert repository.calls == [
+        (COFFEES_TABLE, ["Geisha", "Bourbon", "Caturra"]),
+        (BREWING_METHODS_TABLE, ["V60"]),
+    ]
+    assert (queue.batches, queue.inserted, queue.retries) == (2, 4, 0)
+
+
+def test_failed_batch_is_retried_row_by_row_with_backoff(tmp_path, monkeypatch, clock):
+    repository = FakeRepository()
+    monkeypatch.setattr(registration_queue, "get_repository", lambda: repository)
+    queue = _queue(tmp_path, clock, retry_backoff_seconds=1.0)
+
+    async def scenario():
+        queue.enqueue(COFFEES_TABLE, _coffee("Geisha"))
+        queue.enqueue(COFFEES_TABLE, _coffee("Roto", invalid=True))
+        await queue.flush()
+        assert (queue.inserted, queue.retries, queue.stats()["pending"]) == (0, 2, 2)
+
+        # Antes de la espera no se reintenta nada
+        clock.now = 0.5
+        await queue.flush()
+        assert len(repository.calls) == 1
+
+        # Cada fila se reintenta sola: la válida entra y la inválida espera el doble
+        clock.now = 1.0
+        await queue.flush()
+        assert repository.calls[1:] == [(COFFEES_TABLE, ["Geisha"]), (COFFEES_TABLE, ["Roto"])]
+        assert queue.inserted == 1
+        clock.now = 2.5
+        await queue.flush()
+        assert len(repository.calls) == 3
+        clock.now = 3.0
+        await queue.flush()
+        assert len(repository.calls) == 4
+        await queue.close()
+
+    asyncio.run(scenario())
+
+
+def test_record_is_dead_lettered_after_max_attempts(tmp_path, monkeypatch, clock):
+    repository = FakeRepository()
+    monkeypatch.setattr(registration_queue, "get_repository", lambda: repository)
+    queue = _queue(tmp_path, clock, max_attempts=2, retry_backoff_seconds=1.0)
+
+    async def scenario():
+        queue.enqueue(COFFEES_TABLE, _coffee("Roto", invalid=True))
+        await queue.flush()
+        clock.now = 1.0
+        await queue.flush()
+        await queue.close()
+
+    asyncio.run(scenario())
+
+    assert (queue.dead_lettered, queue.stats()["pending"]) == (1, 0)
+    with open(tmp_path / "dead_letter.jsonl", encoding="utf-8") as f:
+        entries = [json.loads(line) for line in f]
+    assert [(entry["record"]["nombre"], entry["attempts"], entry["error"]) for entry in entries] == [
+        ("Roto", 2, "fila inválida"),
+    ]
+    # El aviso al usuario se entrega una sola vez
+    assert [failure["record"]["nombre"] for failure in queue.pop_failures("u")] == ["Roto"]
+    assert queue.pop_failures("u") == []
+
+
+def test_close_dead_letters_what_the_last_attempt_could_not_insert(tmp_path, monkeypatch, clock):
+    monkeypatch.setattr(registration_queue, "get_repository", lambda: None)
+    queue = _queue(tmp_path, clock, max_attempts=5)
+
+    async def scenario():
+        queue.enqueue(COFFEES_TABLE, _coffee("Geisha", user_id="a"))
+        queue.enqueue(BREWING_METHODS_TABLE, _coffee("V60", user_id="b"))
+        await queue.close()
+
+    asyncio.run(scenario())
+
+    assert (queue.inserted, queue.dead_lettered) == (0, 2)
+    assert queue.pop_failures("a")[0]["error"] == "Missing Supabase credentials"
+    assert [failure["table"] for failure in queue.pop_failures("b")] == [BREWING_METHODS_TABLE]
+
+
+def test_records_with_different_fields_share_one_postgrest_batch(tmp_path, monkeypatch, clock):
+    server = StrictPostgrest()
+    repository = _postgrest_repository(server)
+    monkeypatch.setattr(registration_queue, "get_repository", lambda: repository)
+    queue = _queue(tmp_path, clock)
+
+    async def scenario():
+        # build_record omite los campos opcionales que no se extrajeron
+        queue.enqueue(COFFEES_TABLE, {"user_id": "u", "nombre_cafe": "Geisha", "proceso": "lavado"})
+        queue.enqueue(COFFEES_TABLE, {"user_id": "u", "nombre_cafe": "Bourbon", "tueste": "medio"})
+        queue.enqueue(COFFEES_TABLE, {"user_id": "v", "nombre_cafe": "Caturra"})
+        await queue.flush()
+        await queue.close()
+        await repository.backend.close()
+
+    asyncio.run(scenario())
+
+    assert server.requests == [("user_id,nombre_cafe,proceso,tueste", 3)]
+    assert (queue.batches, queue.inserted, queue.retries, queue.dead_lettered) == (1, 3, 0, 0)
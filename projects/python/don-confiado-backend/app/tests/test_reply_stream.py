@@ -0,0 +1,125 @@
+import asyncio
+import json
+
+import ai.prompt_registry as prompt_registry
+from ai.reply_stream import generate_reply, run_streamed, stream_local_text
+
+"""Streaming NDJSON: texto enviado como tokens frente a la respuesta final."""
+
+
+class Message:
+    def __init__(self, content: str):
+        self.content = content
+
+
+class FakeLLM:
+    """Transmite `chunks`; con cached_content puede fallar después de `fail_after` fragmentos"""
+
+    def __init__(self, chunks: list, fail_after: int = None):
+        self.chunks = chunks
+        self.fail_after = fail_after
+
+    async def astream(self, prompt, cached_content: str = None, **kwargs):
+        for i, chunk in enumerate(self.chunks):
+            if cached_content and self.fail_after == i:
+                raise RuntimeError("contenido cacheado expirado")
+            yield Message(chunk)
+
+    async def ainvoke(self, prompt, cached_content: str = None, **kwargs):
+        if cached_content and self.fail_after is not None:
+            raise RuntimeError("contenido cacheado expirado")
+        return Message("".join(self.chunks))
+
+
+class FakePromptRegistry:
+    async def request(self, name: str, user_text: str) -> tuple:
+        return ["mensajes"], {"cached_content": "cachedContents/1"}
+
+    def prefix_request(self, name: str, user_text: str) -> tuple:
+        return ["mensajes"], {}
+
+    def invalidate(self, name: str) -> None:
+        pass
+
+
+def _events(handler) -> list:
+    async def collect():
+        stream = run_streamed(handler)
+        return [json.loads(line) async for line in stream.ndjson()]
+
+    return asyncio.run(collect())
+
+
+def _tokens(events: list) -> list:
+    return [event["text"] for event in events if event["type"] == "token"]
+
+
+def test_local_reply_is_sent_as_one_token():
+    async def handler():
+        return {"reply": "Guardé tu café."}
+
+    events = _events(handler)
+    assert _tokens(events) == ["Guardé tu café."]
+    assert events[-1] == {"type": "done", "reply": "Guardé tu café."}
+
+
+def test_rest_of_reply_is_sent_when_streamed_intro_differs_in_whitespace():
+    async def handler():
+        intro = await generate_reply(FakeLLM(["  Estos son ", "tus cafés. \n"]), "prompt")
+        return {"reply": f"{intro.strip()}\n1. Geisha\n2. Bourbon"}
+
+    tokens = _tokens(_events(handler))
+    assert tokens[:2] == ["  Estos son ", "tus cafés. \n"]
+    assert "".join(tokens[2:]) == "\n1. Geisha\n2. Bourbon"
+
+
+def test_locally_streamed_listing_is_not_sent_twice():
+    async def handler():
+        intro = (await generate_reply(FakeLLM([" Tus cafés. "]), "prompt")).strip()
+        stream_local_text("\n1. Geisha")
+        return {"reply": f"{intro}\n1. Geisha"}
+
+    assert "".join(_tokens(_events(handler))) == " Tus cafés. \n1. Geisha"
+
+
+def test_retry_is_not_streamed_after_partial_tokens(monkeypatch):
+    monkeypatch.setattr(prompt_registry, "get_prompt_registry", FakePromptRegistry)
+    llm = FakeLLM(["Respuesta", " completa"], fail_after=1)
+
+    async def handler():
+        return {"reply": await prompt_registry.reply_with_system_prompt(llm, "general_chat", "texto")}
+
+    events = _events(handler)
+    # El primer intento alcanzó a enviar un fragmento; el reintento no se transmite de nuevo
+    # y solo se completa lo que falta al final
+    assert _tokens(events) == ["Respuesta", " completa"]
+    assert events[-1]["reply"] == "Respuesta completa"
+
+
+def test_diverging_retry_is_only_in_done_event(monkeypatch):
+    monkeypatch.setattr(prompt_registry, "get_prompt_registry", FakePromptRegistry)
+
+    class RewordingLLM(FakeLLM):
+        async def ainvoke(self, prompt, cached_content: str = None, **kwargs):
+            return Message("Otra redacción")
+
+    llm = RewordingLLM(["Respuesta", " completa"], fail_after=1)
+
+    async def handler():
+        return {"reply": await prompt_registry.reply_with_system_prompt(llm, "general_chat", "texto")}
+
+    events = _events(handler)
+    assert _tokens(events) == ["Respuesta"]
+    assert events[-1]["reply"] == "Otra redacción"
+
+
+def test_retry_is_streamed_when_first_attempt_sent_nothing(monkeypatch):
+    monkeypatch.setattr(prompt_registry, "get_prompt_registry", FakePromptRegistry)
+    llm = FakeLLM(["Respuesta", " completa"], fail_after=0)
+
+    async def handler():
+        return {"reply": await prompt_registry.reply_with_system_prompt(llm, "general_chat", "texto")}
+
+    events = _events(handler)
+    assert _tokens(events) == ["Respuesta", " completa"]
+    assert events[-1]["reply"] == "Respuesta completa"
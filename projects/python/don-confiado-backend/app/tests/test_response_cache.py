@@ -0,0 +1,85 @@
+import asyncio
+
+import pytest
+
+import ai.agents.agent00.graph as chat_graph
+from ai.memory.conversation_history import ConversationHistory
+from ai.response_cache import ResponseCache, is_cacheable
+
+"""Caché de respuestas compartida de la rama 'Other'."""
+
+
+@pytest.mark.parametrize("message, previous_messages, expected", [
+    ("¿qué es un proceso honey?", 2, True),
+    ("explícame la diferencia entre arábica y robusta", 4, True),
+    # Primera interacción: la respuesta lleva el saludo
+    ("¿qué es un proceso honey?", 0, False),
+    # Referencias personales o a la conversación
+    ("¿qué café me recomiendas?", 2, False),
+    ("¿cómo se llama mi café?", 2, False),
+    ("¿y eso qué significa?", 2, False),
+    ("hola, ¿qué es un natural?", 2, False),
+    # No es una pregunta, o es demasiado corta
+    ("el honey me encanta", 2, False),
+    ("¿qué?", 2, False),
+])
+def test_is_cacheable(message, previous_messages, expected):
+    assert is_cacheable(message, previous_messages) is expected
+
+
+def test_lookup_uses_normalized_message_as_key():
+    cache = ResponseCache()
+    key, reply = cache.lookup("¿Qué es un proceso HONEY?", 2)
+    assert reply is None
+    cache.store(key, "respuesta")
+
+    assert cache.lookup("que es un proceso honey", 2) == (key, "respuesta")
+    assert cache.lookup("¿qué es un proceso honey?", 0) == (None, None)
+    assert cache.stats()["uncacheable"] == 1
+
+
+def _state(message: str, history_text: str, previous_messages: int) -> dict:
+    history = ConversationHistory()
+    for i in range(previous_messages + 1):
+        history.append("human" if i % 2 == 0 else "ai", f"mensaje {i}")
+    return {"intention": "Other", "message": message, "history": history, "history_text": history_text}
+
+
+def _run_reply(monkeypatch, state: dict) -> tuple:
+    prompts = []
+
+    async def fake_reply(llm, name, prompt_text):
+        prompts.append(prompt_text)
+        return "respuesta"
+
+    monkeypatch.setattr(chat_graph, "reply_with_system_prompt", fake_reply)
+    monkeypatch.setattr(chat_graph, "get_llm_registry", lambda: type("Registry", (), {"llm": None})())
+    graph = chat_graph.ChatGraph()
+    return asyncio.run(graph._reply(state)), prompts[0], graph
+
+
+def test_shared_reply_is_generated_without_history(monkeypatch):
+    history_text = "Usuario: me llamo Ana\nAsistente: ¡Hola Ana!"
+    state = _state("¿qué es un proceso honey?", history_text, previous_messages=2)
+    output, prompt, graph = _run_reply(monkeypatch, state)
+
+    assert output["shared_reply"] is True
+    assert "Ana" not in prompt
+    reply_cache = chat_graph._GeneralReplyCache(graph.response_cache)
+    key, _ = reply_cache.lookup(state)
+    reply_cache.store(key, output)
+    # Otro usuario con la misma pregunta recibe la respuesta sin datos de Ana
+    _, cached = reply_cache.lookup(_state("¿Qué es un proceso honey?", "Usuario: soy Luis", previous_messages=2))
+    assert cached["result"]["reply"] == "respuesta"
+
+
+def test_personal_reply_uses_history_and_is_not_stored(monkeypatch):
+    history_text = "Usuario: me llamo Ana\nAsistente: ¡Hola Ana!"
+    state = _state("¿qué es un proceso honey?", history_text, previous_messages=0)
+    output, prompt, graph = _run_reply(monkeypatch, state)
+
+    assert output["shared_reply"] is False
+    assert "Ana" in prompt
+    reply_cache = chat_graph._GeneralReplyCache(graph.response_cache)
+    reply_cache.store("que es un proceso honey", output)
+    assert graph.response_cache.stats()["entries"] == 0
@@ -0,0 +1,88 @@
+import asyncio
+import sqlite3
+
+from ai.memory.conversation_store import ConversationStore
+from ai.memory.session_store import SQLiteSessionStore
+from endpoints import chat_webservice
+
+"""Guardados condicionales del almacén de sesiones y reubicación de turnos simultáneos."""
+
+
+def _turn(store: ConversationStore, user_id: str, question: str, answer: str) -> None:
+    store.append(user_id, "human", question)
+    store.append(user_id, "ai", answer)
+
+
+def test_sqlite_save_is_conditional_on_version(tmp_path):
+    sessions = SQLiteSessionStore(str(tmp_path / "sessions.db"))
+    messages = [{"role": "human", "content": "hola"}]
+
+    async def scenario():
+        assert await sessions.save("u", 0, messages, {}, 0)
+        # Otro proceso que también leyó la versión 0 no puede pisar el guardado
+        assert not await sessions.save("u", 0, [{"role": "human", "content": "otro"}], {}, 0)
+        first_seq, stored, _, version = await sessions.load("u", 0)
+        assert (first_seq, stored, version) == (0, messages, 1)
+        assert await sessions.save("u", 1, [{"role": "ai", "content": "¡Hola!"}], {}, version)
+        assert (await sessions.load("u", 0))[3] == 2
+        await sessions.close()
+
+    asyncio.run(scenario())
+
+
+def test_sqlite_adds_version_to_existing_files(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE session_state (user_id TEXT PRIMARY KEY, state TEXT NOT NULL, updated_at REAL NOT NULL)")
+    conn.execute("INSERT INTO session_state VALUES ('u', '{}', 0)")
+    conn.commit()
+    conn.close()
+    sessions = SQLiteSessionStore(path)
+
+    async def scenario():
+        assert (await sessions.load("u", 0))[3] == 0
+        assert await sessions.save("u", 0, [{"role": "human", "content": "hola"}], {}, 0) is False
+        await sessions.close()
+
+    asyncio.run(scenario())
+
+
+def test_concurrent_turn_is_saved_after_the_other_process(tmp_path, monkeypatch):
+    sessions = SQLiteSessionStore(str(tmp_path / "sessions.db"))
+    other_process = ConversationStore()
+    this_process = ConversationStore()
+    monkeypatch.setattr(chat_webservice, "_memory_store", this_process)
+    monkeypatch.setattr(chat_webservice, "get_conversation_log", lambda: None)
+
+    async def scenario():
+        # Ambos procesos leyeron la sesión vacía (versión 0) y atienden un turno a la vez
+        _turn(other_process, "u", "mis cafés", "Tienes 2 cafés")
+        _turn(this_process, "u", "registra un Geisha", "¿Qué proceso tiene?")
+        this_process.get("u").pending_intent = "Register_coffee"
+        assert await sessions.save("u", 0, other_process.get("u").messages_since(0), other_process.get("u").state(), 0)
+
+        await chat_webservice._save_session(sessions, "u", 0, 0)
+
+        first_seq, stored, state, version = await sessions.load("u", 0)
+        contents = [message["content"] for message in stored]
+        assert contents == ["mis cafés", "Tienes 2 cafés", "registra un Geisha", "¿Qué proceso tiene?"]
+        assert (first_seq, version, state["pending_intent"]) == (0, 2, "Register_coffee")
+        history = this_process.get("u")
+        assert [message["content"] for message in history] == contents
+        assert history.as_text().splitlines()[2] == "Usuario: registra un Geisha"
+        assert this_process.stats()["messages"] == 4
+        await sessions.close()
+
+    asyncio.run(scenario())
+
+
+def test_drop_newest_keeps_transcript_consistent():
+    store = ConversationStore()
+    _turn(store, "u", "hola", "¡Hola!")
+    _turn(store, "u", "mis cafés", "Tienes 2 cafés")
+    history = store.get("u")
+
+    assert history.drop_newest(2) == len("mis cafés") + len("Tienes 2 cafés")
+    assert history.as_text() == "Usuario: hola\nAsistente: ¡Hola!"
+    history.drop_newest(5)
+    assert history.as_text() == "" and history.chars == 0 and history.end_seq == 0
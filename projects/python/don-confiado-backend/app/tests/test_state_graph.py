@@ -0,0 +1,150 @@
+import asyncio
+
+import pytest
+
+from ai.agents.agent00.graph import NodeCache, StateGraph
+from conftest import node_statuses
+
+"""Grafo de nodos del chat: dependencias, condiciones `when`, caché y cancelación de nodos en curso."""
+
+
+class DictCache(NodeCache):
+    def __init__(self):
+        self.entries = {}
+
+    def lookup(self, state: dict) -> tuple:
+        key = state.get("message")
+        return key, self.entries.get(key)
+
+    def store(self, key, output: dict) -> None:
+        self.entries[key] = output
+
+
+def test_nodes_run_after_dependencies_and_skip_when_false():
+    order = []
+
+    def node(name, output):
+        async def run(state):
+            order.append(name)
+            return output
+        return run
+
+    graph = (
+        StateGraph()
+        .add_node("classify", node("classify", {"intent": "Other"}))
+        .add_node("register", node("register", {"saved": True}), after=("classify",),
+                  when=lambda state: state["intent"] == "Register_coffee")
+        .add_node("reply", node("reply", {"result": "hola"}), after=("classify",))
+    )
+    state = {}
+
+    trace = asyncio.run(graph.run(state))
+
+    assert order == ["classify", "reply"]
+    assert state == {"intent": "Other", "result": "hola"}
+    assert node_statuses(trace) == {"classify": "ran", "register": "skipped", "reply": "ran"}
+
+
+def test_running_node_is_cancelled_when_its_guard_fails():
+    prefetch_finished = []
+
+    async def classify(state):
+        await asyncio.sleep(0.05)
+        return {"intent": "Register_coffee"}
+
+    async def prefetch(state):
+        # Especulativo: corre a la vez que la clasificación mientras la intención no descarte la lectura
+        await asyncio.sleep(1)
+        prefetch_finished.append(True)
+        return {"collection": []}
+
+    graph = (
+        StateGraph()
+        .add_node("classify", classify)
+        .add_node("prefetch", prefetch, when=lambda state: state.get("intent") in (None, "Show_my_coffees"))
+    )
+    state = {}
+
+    trace = asyncio.run(graph.run(state))
+
+    assert node_statuses(trace) == {"classify": "ran", "prefetch": "cancelled"}
+    assert prefetch_finished == [] and "collection" not in state
+    assert trace.seconds < 0.5
+
+
+def test_running_node_survives_when_guard_still_holds():
+    async def classify(state):
+        return {"intent": "Show_my_coffees"}
+
+    async def prefetch(state):
+        await asyncio.sleep(0.05)
+        return {"collection": ["Geisha"]}
+
+    graph = (
+        StateGraph()
+        .add_node("classify", classify)
+        .add_node("prefetch", prefetch, when=lambda state: state.get("intent") in (None, "Show_my_coffees"))
+    )
+    state = {}
+
+    trace = asyncio.run(graph.run(state))
+
+    assert node_statuses(trace)["prefetch"] == "ran"
+    assert state["collection"] == ["Geisha"]
+
+
+def test_cached_output_skips_run_and_rechecks_running_nodes():
+    calls = []
+    cache = DictCache()
+    cache.store("hola", {"intent": "Other"})
+
+    async def classify(state):
+        calls.append("classify")
+        return {"intent": "Other"}
+
+    async def prefetch(state):
+        await asyncio.sleep(1)
+        return {"collection": []}
+
+    graph = (
+        StateGraph()
+        .add_node("prefetch", prefetch, when=lambda state: state.get("intent") is None)
+        .add_node("classify", classify, cache=cache)
+    )
+
+    trace = asyncio.run(graph.run({"message": "hola"}))
+
+    assert calls == []
+    assert node_statuses(trace) == {"classify": "cached", "prefetch": "cancelled"}
+
+
+def test_failing_node_cancels_the_rest_and_propagates():
+    cancelled = []
+
+    async def fails(state):
+        await asyncio.sleep(0.01)
+        raise RuntimeError("sin modelo")
+
+    async def slow(state):
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    graph = StateGraph().add_node("slow", slow).add_node("fails", fails)
+
+    with pytest.raises(RuntimeError, match="sin modelo"):
+        asyncio.run(graph.run({}))
+    assert cancelled == [True]
+
+
+def test_add_node_rejects_duplicates_and_unknown_dependencies():
+    async def run(state):
+        return {}
+
+    graph = StateGraph().add_node("a", run)
+    with pytest.raises(ValueError):
+        graph.add_node("a", run)
+    with pytest.raises(ValueError):
+        graph.add_node("b", run, after=("c",))
@@ -0,0 +1,81 @@
+import asyncio
+import time
+
+from ai.memory.user_inbox import UserInbox
+
+"""Bandeja por usuario: sin espera si no hay turno en curso, unión de lo que llega durante un turno."""
+
+
+class SlowTurns:
+    """Turnos que tardan `seconds` y registran el mensaje (unido) que recibieron"""
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.messages = []
+
+    def process(self, message: str):
+        async def turn():
+            self.messages.append(message)
+            await asyncio.sleep(self.seconds)
+            return {"reply": f"re: {message}"}
+        return turn()
+
+
+def test_message_of_idle_user_is_processed_without_waiting():
+    inbox = UserInbox()
+    turns = SlowTurns(0)
+
+    async def scenario():
+        started = time.perf_counter()
+        result = await inbox.submit("u", "hola", turns.process)
+        return result, time.perf_counter() - started
+
+    result, seconds = asyncio.run(scenario())
+
+    assert result == {"reply": "re: hola"}
+    assert seconds < 0.05
+    assert inbox.stats()["active_users"] == 0
+
+
+def test_messages_during_a_running_turn_are_merged_into_the_next():
+    inbox = UserInbox(max_messages=5)
+    turns = SlowTurns(0.05)
+
+    async def scenario():
+        first = asyncio.create_task(inbox.submit("u", "hola", turns.process))
+        await asyncio.sleep(0.01)
+        # Llegan mientras corre el primer turno
+        second = asyncio.create_task(inbox.submit("u", "quiero registrar", turns.process))
+        third = asyncio.create_task(inbox.submit("u", "un Geisha", turns.process))
+        # Otro usuario no espera al primero
+        other = await asyncio.wait_for(inbox.submit("v", "mis cafés", turns.process), timeout=0.2)
+        return await first, await second, await third, other
+
+    first, second, third, other = asyncio.run(scenario())
+
+    assert turns.messages == ["hola", "mis cafés", "quiero registrar\nun Geisha"]
+    assert first == {"reply": "re: hola"}
+    assert second == {"status": "coalesced", "reply": ""}
+    assert third == {"reply": "re: quiero registrar\nun Geisha"}
+    assert other == {"reply": "re: mis cafés"}
+    assert (inbox.turns, inbox.coalesced) == (3, 1)
+
+
+def test_failed_turn_reaches_every_merged_request():
+    inbox = UserInbox()
+
+    def process(message):
+        async def turn():
+            await asyncio.sleep(0.02)
+            raise RuntimeError("sin modelo")
+        return turn()
+
+    async def scenario():
+        first = asyncio.create_task(inbox.submit("u", "hola", process))
+        await asyncio.sleep(0.01)
+        merged = [asyncio.create_task(inbox.submit("u", text, process)) for text in ("a", "b")]
+        return await asyncio.gather(first, *merged, return_exceptions=True)
+
+    results = asyncio.run(scenario())
+
+    assert [type(result) for result in results] == [RuntimeError] * 3
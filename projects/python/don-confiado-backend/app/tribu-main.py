@@ -1,12 +1,21 @@
-from fastapi import FastAPI
+import os
+
 import uvicorn
-from endpoints.hello_world_webservice import HelloWorldWebService, hello_webservice_api_router
-from endpoints.business_webservice import business_webservice_api_router
-from endpoints.chat_webservice import chat_webservice_api_router
+from dotenv import load_dotenv
+
+"""Punto de entrada del servidor.
+
+Con COFFETTO_WORKERS > 1 uvicorn levanta varios procesos que importan
+`main:app`; para que compartan las conversaciones se necesita un almacén de
+sesiones compartido (COFFETTO_SESSION_BACKEND=sqlite o redis).
+"""
+
+load_dotenv()
+
 
 if __name__ == "__main__":
-    app = FastAPI()
-    app.include_router(hello_webservice_api_router)
-    app.include_router(business_webservice_api_router)
-    app.include_router(chat_webservice_api_router)
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    workers = int(os.getenv("COFFETTO_WORKERS", "1"))
+    if workers > 1 and os.getenv("COFFETTO_SESSION_BACKEND", "memory").strip().lower() == "memory":
+        print("Advertencia: COFFETTO_WORKERS > 1 con COFFETTO_SESSION_BACKEND=memory; "
+              "cada worker tendrá su propia copia de las conversaciones.")
+    uvicorn.run("main:app", host="0.0.0.0", port=8000, workers=workers)
@@ -0,0 +1,159 @@
+import asyncio
+import os
+import time
+
+from ai.llm_registry import init_llm_registry
+from ai.prompt_registry import init_prompt_registry
+from ai.recommendation.coffee_index import get_coffee_index
+from business.repositories.coffee_repository import get_repository
+
+"""Calentamiento del arranque y estado de disponibilidad (/ready).
+
+El lifespan lanza el calentamiento como tarea en segundo plano, así que
+uvicorn empieza a escuchar sin esperar al SDK de Gemini. La tarea:
+
+- llm: importa langchain_google_genai y construye el modelo y sus runnables
+  estructurados en un hilo, para no bloquear el event loop.
+- prompts: compila los prompts de sistema y, con COFFETTO_PROMPT_CACHE=gemini,
+  crea su caché en el proveedor (necesita el modelo).
+- db: abre COFFETTO_WARMUP_DB_CONNECTIONS conexiones del pool de la base de
+  datos con consultas mínimas, en paralelo con los anteriores.
+- coffee_index: carga el índice de similitud de cafés con toda la tabla
+  `cafes` (ver ai/recommendation/coffee_index.py) y arranca su
+  sincronización periódica.
+
+La aplicación está lista cuando terminan los pasos llm y prompts sin error;
+un fallo de la base o del índice solo se reporta, porque cada petición
+reintenta la base y la recomendación usa la colección del usuario mientras
+el índice no está cargado.
+Los turnos de chat que llegan antes esperan el calentamiento (hasta
+COFFETTO_WARMUP_WAIT_SECONDS) en vez de construir el modelo por su cuenta.
+"""
+
+REQUIRED_STEPS = ("llm", "prompts")
+
+
+class Warmup:
+    def __init__(self, db_connections: int = 2, wait_seconds: float = 30.0):
+        self.db_connections = db_connections
+        self.wait_seconds = wait_seconds
+        self.started_at = None
+        self.finished_at = None
+        # paso -> {"seconds": ..., "error": ...}
+        self.steps = {}
+        self._task = None
+
+    @classmethod
+    def from_env(cls) -> "Warmup":
+        return cls(
+            db_connections=int(os.getenv("COFFETTO_WARMUP_DB_CONNECTIONS", "2")),
+            wait_seconds=float(os.getenv("COFFETTO_WARMUP_WAIT_SECONDS", "30")),
+        )
+
+    @property
+    def finished(self) -> bool:
+        return self.finished_at is not None
+
+    @property
+    def ready(self) -> bool:
+        return self.finished and all(
+            step in self.steps and "error" not in self.steps[step] for step in REQUIRED_STEPS
+        )
+
+    def start(self) -> asyncio.Task:
+        if self._task is None:
+            self.started_at = time.perf_counter()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        return self._task
+
+    async def wait(self) -> None:
+        """Espera a que termine el calentamiento, como mucho `wait_seconds`"""
+        task = self._task
+        if task is None or task.done():
+            return
+        # asyncio.wait no cancela la tarea si se agota el tiempo
+        await asyncio.wait((task,), timeout=self.wait_seconds)
+
+    async def close(self) -> None:
+        task, self._task = self._task, None
+        if task is not None and not task.done():
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    def status(self) -> dict:
+        elapsed = None
+        if self.started_at is not None:
+            elapsed = (self.finished_at or time.perf_counter()) - self.started_at
+        return {
+            "ready": self.ready,
+            "finished": self.finished,
+            "warmup_seconds": round(elapsed, 3) if elapsed is not None else None,
+            "steps": {name: dict(step) for name, step in self.steps.items()},
+        }
+
+    # --- Internos ---
+    async def _run(self) -> None:
+        try:
+            await asyncio.gather(
+                self._model_steps(),
+                self._step("db", self._warm_database),
+                self._step("coffee_index", self._load_coffee_index),
+            )
+        finally:
+            self.finished_at = time.perf_counter()
+        failed = [name for name, step in self.steps.items() if "error" in step]
+        print(f"Calentamiento terminado en {self.finished_at - self.started_at:.2f} s"
+              + (f" (con errores en: {', '.join(failed)})" if failed else ""))
+
+    async def _model_steps(self) -> None:
+        # Los prompts en modo gemini se cachean con el modelo: van después de construirlo
+        if await self._step("llm", asyncio.to_thread, init_llm_registry):
+            await self._step("prompts", self._warm_prompts)
+
+    async def _step(self, name: str, function, *args) -> bool:
+        started = time.perf_counter()
+        try:
+            await function(*args)
+        except Exception as e:
+            self.steps[name] = {"seconds": round(time.perf_counter() - started, 3), "error": str(e)}
+            print(f"Falló el calentamiento ({name}): {e}")
+            return False
+        self.steps[name] = {"seconds": round(time.perf_counter() - started, 3)}
+        return True
+
+    async def _warm_prompts(self) -> None:
+        await init_prompt_registry().warm()
+
+    async def _warm_database(self) -> None:
+        repository = get_repository()
+        if repository is not None and self.db_connections > 0:
+            await repository.warm_up(self.db_connections)
+
+    async def _load_coffee_index(self) -> None:
+        index = get_coffee_index()
+        repository = get_repository()
+        if index is None or repository is None:
+            return
+        await index.sync(repository)
+        print(f"Índice de cafés cargado: {len(index)} cafés")
+        index.start_sync(repository)
+
+
+_warmup = Warmup.from_env()
+
+
+def get_warmup() -> Warmup:
+    return _warmup
+
+
+def start_warmup() -> asyncio.Task:
+    """Lanza el calentamiento en segundo plano; pensado para el evento de arranque"""
+    return _warmup.start()
+
+
+async def wait_until_ready() -> None:
+    await _warmup.wait()
+
+
+async def close_warmup() -> None:
+    await _warmup.close()
@@ -104,6 +104,11 @@ class WhatsAppHandler {
             .then((response: any) => {
               console.log("API response:", response);
 
+              // Mensaje unido por el backend a un turno posterior: la respuesta llega con el último
+              if (response.status === "coalesced") {
+                return;
+              }
+
               this.sock.sendMessage(msg.key.remoteJid, {
                 text: response.reply ?? "⚠️ No pude entender tu mensaje",
               });